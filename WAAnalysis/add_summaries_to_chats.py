@@ -1,8 +1,8 @@
-import json
 import logging
 from pathlib import Path
 from WAAnalysis.utils import load_markdown, update_markdown_frontmatter
 from WAAnalysis.config import BATCH_OUTPUT_DIR
+from WAAnalysis.json_codec import iter_jsonl
 
 # Set paths
 CHUNKED_DIR = Path("chunked")
@@ -21,12 +21,10 @@ def load_batch_results(results_file):
     """
     results_mapping = {}
     try:
-        with open(results_file, 'r') as file:
-            for line in file:
-                result = json.loads(line)
-                custom_id = result['custom_id']
-                response_content = result['response']['body']['choices'][0]['message']['content']
-                results_mapping[custom_id] = response_content
+        for result in iter_jsonl(results_file):
+            custom_id = result['custom_id']
+            response_content = result['response']['body']['choices'][0]['message']['content']
+            results_mapping[custom_id] = response_content
         log.info(f"Batch results loaded successfully from {results_file}.")
     except Exception as e:
         log.error(f"Error loading batch results: {e}")
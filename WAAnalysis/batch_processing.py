@@ -1,8 +1,24 @@
-import json
+import time
 import logging
+import argparse
 from WAAnalysis.config import BATCH_INPUT_DIR, BATCH_TRACKING_FILE, MD_DIR, ERROR_LOGS_DIRECTORY, DEBUG, MANUAL_TESTING
 from WAAnalysis.batch_utils import generate_batch_input, upload_batch_file, create_batch, cancel_batch
-from WAAnalysis.utils import ensure_directories_exist, save_to_json
+from WAAnalysis.utils import ensure_directories_exist, save_to_json, clean_conversations
+from WAAnalysis.json_codec import read_json
+from WAAnalysis.day_chunker import batch_documents
+from WAAnalysis.output_sizing import load_output_profiles, size_requests
+from WAAnalysis.request_packer import pack_requests, load_packs, load_retry_requests, clear_retry_requests
+from WAAnalysis.batch_sharder import write_shards, archive_input
+from WAAnalysis.response_cache import split_cached, record_batch_requests, batch_request_rows
+from WAAnalysis.batch_result_processor import process_cached_results
+
+# -------------------------------
+# Job Types
+# -------------------------------
+# The combined analysis job returns all four results per document in one
+# request; the per-field job types remain for targeted re-runs
+FIELD_JOB_TYPES = ["topics", "entities", "sentiment", "key_points"]
+DEFAULT_JOB_TYPES = ["analysis"]
 
 # -------------------------------
 # Load and Save Tracking File
@@ -11,7 +27,7 @@ from WAAnalysis.utils import ensure_directories_exist, save_to_json
 def load_tracking_file():
     """Loads the tracking file if it exists, otherwise returns an empty structure."""
     if BATCH_TRACKING_FILE.exists():
-        return json.loads(BATCH_TRACKING_FILE.read_text())
+        return read_json(BATCH_TRACKING_FILE)
     return {"jobs": []}
 
 
@@ -24,28 +40,37 @@ def save_tracking_file(data):
 # Update Tracking File
 # -------------------------------
 
-def update_tracking_file(file_name, job_type, batch_id):
-    """Updates the tracking file with new batch job information."""
+def update_tracking_file(file_name, job_type, batch_id, shard_of=None, submission=None, input_file=None):
+    """
+    Updates the tracking file with new batch job information, one entry per
+    batch_id, so resubmitting a file never replaces a batch still in flight.
+    Shards record the batch input file they were split from and the submission
+    they belong to, so their outputs can be stitched back together once all of
+    them finish, and the archived copy of their input, so their unanswered
+    requests can be retried.
+    """
     data = load_tracking_file()
-
-    # Check if the job already exists and update it
+    entry = {
+        "filename": file_name,
+        "job_type": job_type,
+        "batch_id": batch_id,
+        "completed": False,
+        "output_file": None,
+        "shard_of": shard_of,
+        "submission": submission,
+        "input_file": input_file
+    }
+
+    # Check if the batch is already tracked and update it
     for job in data["jobs"]:
-        if job["filename"] == file_name and job["job_type"] == job_type:
-            job.update({
-                "batch_id": batch_id,
-                "completed": False,
-                "output_file": None
-            })
+        if job.get("batch_id") == batch_id:
+            job.update(entry)
+            job.pop("stitched_into", None)
+            job.pop("status", None)
             break
     else:
-        # If the job doesn't exist, create a new one
-        data["jobs"].append({
-            "filename": file_name,
-            "job_type": job_type,
-            "batch_id": batch_id,
-            "completed": False,
-            "output_file": None
-        })
+        # If the batch isn't tracked, create a new entry
+        data["jobs"].append(entry)
 
     save_tracking_file(data)
 
@@ -69,70 +94,149 @@ def rollback_on_error(batch_id, job_type, file_name, error_message):
         error_log.write(f"Error processing {job_type} for {file_name}:\n{error_message}\n\n")
 
 
+def rollback_submission(batch_ids, job_type, file_name, error_message):
+    """
+    Fails a whole submission when one of its shards cannot be uploaded or
+    created: the batches already created for it are cancelled and dropped from
+    the tracking file, so none of its shards is stitched without the others and
+    every document is submitted again on the next run.
+    """
+    rollback_on_error(None, job_type, file_name, error_message)
+
+    for batch_id in batch_ids:
+        try:
+            rollback_on_error(batch_id, job_type, file_name, f"Cancelled with its submission: {error_message}")
+        except Exception as e:
+            logging.error(f"Could not cancel batch {batch_id} for {job_type}: {str(e)}")
+
+    data = load_tracking_file()
+    data["jobs"] = [job for job in data["jobs"] if job.get("batch_id") not in batch_ids]
+    save_tracking_file(data)
+    logging.error(f"Submission of {job_type} failed; run batch processing again to resubmit it.")
+
+
 # -------------------------------
 # Batch Input Processing Function
 # -------------------------------
 
-def process_markdown_files():
-    """Processes markdown files for each job type and generates batch requests."""
+def process_markdown_files(job_types=DEFAULT_JOB_TYPES, pack=True):
+    """
+    Processes markdown files for each job type and generates batch requests.
+    Unless pack is False, small documents share requests several at a time.
+    """
     try:
         md_files = [f for f in MD_DIR.iterdir() if f.suffix == '.md']
         total_files = len(md_files)
-        job_types = ["topics", "entities", "sentiment", "key_points"]
 
         # Ensure batch input directories exist
         ensure_directories_exist([BATCH_INPUT_DIR / job for job in job_types])
 
         logging.info(f"Found {total_files} markdown files. Starting batch processing...")
 
+        # max_tokens limits learned from earlier batches, if any
+        output_profiles = load_output_profiles()
+
+        # Split days over the token budget into parts, then clean every document
+        # once, in parallel, and reuse it for all job types
+        documents = batch_documents(md_files)
+        document_names = [name for name, _ in documents]
+        clean_texts = dict(zip(document_names, clean_conversations([text for _, text in documents])))
+        logging.info(f"Prepared {len(documents)} documents from {total_files} markdown files.")
+
         for job_type in job_types:
             logging.info(f"Generating and combining batch inputs for {job_type}...")
 
             # Create a single JSONL file for this job type
             batch_file_path = BATCH_INPUT_DIR / f"{job_type}_batch.jsonl"
             
-            with open(batch_file_path, 'w') as batch_file:
-                for i, file in enumerate(md_files, start=1):
-                    file_name = file.name
-                    try:
-                        logging.info(f"Generating batch input for {job_type} ({file_name})...")
-                        
-                        # Generate the batch input and append to the JSONL file
-                        jsonl_input = generate_batch_input(file_name, job_type)
-                        batch_file.write(json.dumps(jsonl_input) + "\n")
-                        
-                        logging.info(f"Added {file_name} to {job_type} batch.")
-
-                    except Exception as e:
-                        # Rollback and log error if something goes wrong
-                        rollback_on_error(None, job_type, file_name, str(e))
-                        return  # Stop further processing after rollback
+            requests = []
+            for file_name in document_names:
+                try:
+                    logging.info(f"Generating batch input for {job_type} ({file_name})...")
+                    requests.append(generate_batch_input(file_name, job_type, clean_texts[file_name]))
+                    logging.info(f"Added {file_name} to {job_type} batch.")
+
+                except Exception as e:
+                    # Rollback and log error if something goes wrong
+                    rollback_on_error(None, job_type, file_name, str(e))
+                    return  # Stop further processing after rollback
+
+            # Documents queued for a retry are sent on their own, from their
+            # queued request unless it was generated again above
+            retry_requests = load_retry_requests(job_type)
+            retry_ids = {request["custom_id"] for request in retry_requests}
+            generated_ids = {request["custom_id"] for request in requests}
+            requests.extend(request for request in retry_requests if request["custom_id"] not in generated_ids)
+            if retry_requests:
+                logging.info(f"Retrying {len(retry_requests)} {job_type} documents individually.")
+
+            # Size each request's output from its input, and serve requests
+            # identical to earlier successful ones from the response cache
+            size_requests(requests, job_type, output_profiles)
+            generated = requests
+            requests, cached_results, digests = split_cached(generated)
+            unusable = set(process_cached_results(cached_results, job_type))
+            requests.extend(request for request in generated if request["custom_id"] in unusable)
+            if not requests:
+                logging.info(f"Every {job_type} request was served from the response cache.")
+                clear_retry_requests(job_type)
+                continue
+
+            # Pack small documents together, then write the JSONL file, sharded to the batch limits
+            if pack:
+                requests = pack_requests(requests, job_type, unpacked_ids=retry_ids)
+            shard_paths = write_shards(batch_file_path, requests)
 
             logging.info(f"Completed writing batch file for {job_type}: {batch_file_path}")
 
-            # Step 3: Upload the single batch input file and create the batch
+            # Step 3: Upload each shard and create its batch, so they run concurrently
             if MANUAL_TESTING:
                 logging.info(f"Skipping upload and batch creation due to MANUAL_TESTING mode for {job_type}")
-            else:
+                continue
+
+            # A shard that fails to upload or create fails the whole submission
+            submission = time.strftime("%Y%m%dT%H%M%S")
+            created = []
+            for shard_path in shard_paths:
                 try:
-                    logging.info(f"Uploading batch input for {job_type}...")
-                    file_id = upload_batch_file(batch_file_path)
+                    logging.info(f"Uploading batch input {shard_path.name} for {job_type}...")
+                    file_id = upload_batch_file(shard_path)
                     batch = create_batch(file_id, f"{job_type}_Batch")
-                    logging.info(f"Batch created with ID: {batch['id']}")
+                    logging.info(f"Batch created with ID: {batch.id}")
+                    created.append(batch.id)
 
-                    # Update tracking file with the new batch_id
-                    update_tracking_file(f"{job_type}_batch.jsonl", job_type, batch['id'])
+                    # Track the new batch_id with a copy of its input
+                    input_file = archive_input(shard_path, batch.id)
+                    update_tracking_file(shard_path.name, job_type, batch.id, batch_file_path.name, submission,
+                                         str(input_file))
 
                 except Exception as e:
                     logging.error(f"Error creating batch for {job_type}: {str(e)}")
-                    rollback_on_error(None, job_type, f"{job_type}_batch.jsonl", str(e))
+                    rollback_submission(created, job_type, shard_path.name, str(e))
+                    break
+
+                # Record its requests for the response cache. The batch is live, so a failure here only
+                # leaves its output to be backfilled from the archived input by response_cache
+                try:
+                    record_batch_requests(batch.id, batch_request_rows(shard_path, digests, load_packs()))
+                except Exception as e:
+                    logging.warning(f"Could not record the requests of batch {batch.id} for the response cache: {str(e)}")
+            else:
+                # Queued retries are kept until a submission carries all of them
+                clear_retry_requests(job_type)
 
     except Exception as e:
         logging.error(f"Failed to process markdown files: {str(e)}")
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate and submit batch analysis requests for the markdown files.")
+    parser.add_argument("--job-types", nargs="+", choices=DEFAULT_JOB_TYPES + FIELD_JOB_TYPES, default=DEFAULT_JOB_TYPES,
+                        help="Job types to run (default: the combined analysis).")
+    parser.add_argument("--no-pack", action="store_true", help="Send every document in its own request.")
+    args = parser.parse_args()
+
     if DEBUG:
         logging.info("Running in DEBUG mode.")
     
-    process_markdown_files()
+    process_markdown_files(args.job_types, pack=not args.no_pack)
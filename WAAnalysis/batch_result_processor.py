@@ -1,26 +1,32 @@
 import logging
-import json
+import argparse
+from collections import defaultdict
 from pathlib import Path
-from WAAnalysis.config import BATCH_OUTPUT_DIR, MD_DIR, DEBUG
-from WAAnalysis.utils import update_markdown_frontmatter, load_markdown
+from WAAnalysis.config import BATCH_OUTPUT_DIR, MD_DIR, DAY_CHUNK_DIR, DEBUG
+from WAAnalysis.utils import update_markdown_frontmatter, load_markdown, rewrite_markdown_frontmatter
+from WAAnalysis.json_codec import loads, read_jsonl, iter_jsonl
+from WAAnalysis.parallel import run_parallel
+from WAAnalysis.token_cache import count_tokens
+from WAAnalysis.day_chunker import source_file_name
+from WAAnalysis.batch_sharder import results_job_type
+from WAAnalysis.request_packer import load_packs, unpack_response, pack_document_requests, write_retry_requests
 
 # -------------------------------
 # Import Global Logger from Config
 # -------------------------------
 log = logging.getLogger(__name__)
 
+# Combined part polarities within this distance of zero are labelled Neutral
+NEUTRAL_POLARITY = 0.1
+
 # -------------------------------
 # Utility Functions
 # -------------------------------
 
 def load_jsonl_file(file_path):
     """Loads a .jsonl file and returns a list of parsed lines."""
-    data = []
     try:
-        with open(file_path, 'r') as f:
-            for line in f:
-                data.append(json.loads(line.strip()))
-        return data
+        return read_jsonl(file_path)
     except Exception as e:
         log.error(f"Failed to load {file_path}: {e}")
         return []
@@ -31,13 +37,22 @@ def merge_existing_data(md_file_path, new_data):
     frontmatter, body = load_markdown(md_file_path)
 
     log.debug(f"Existing frontmatter for {md_file_path}: {frontmatter}")
+    return merge_frontmatter(frontmatter, new_data), body
+
+def merge_frontmatter(frontmatter, new_data):
+    """Merges new batch data into a parsed frontmatter dict in place and returns it."""
     log.debug(f"New data to merge: {new_data}")
 
     # Merge new data with the existing frontmatter
     for key, value in new_data.items():
         log.debug(f"Processing key: {key}, value: {value}")
 
-        if key in frontmatter:
+        if key == "overall_sentiment" and isinstance(value, dict):
+            # A whole day's sentiment replaces any earlier one; part sentiments are combined
+            frontmatter[key] = combine_sentiment_parts(frontmatter.get(key), value["parts"]) \
+                if value.get("parts") else value
+            log.debug(f"Set {key}: {frontmatter[key]}")
+        elif key in frontmatter:
             if frontmatter[key] is None:
                 log.debug(f"Key {key} is None, initializing as an empty list.")
                 frontmatter[key] = []
@@ -50,18 +65,18 @@ def merge_existing_data(md_file_path, new_data):
                     for new_item in value:
                         key_for_new_item = f"{new_item['person']}_{new_item['role']}"
                         if key_for_new_item in merged_items:
-                            # Merge relationships lists to avoid duplicates
-                            merged_items[key_for_new_item]['relationships'] = list(
-                                set(merged_items[key_for_new_item]['relationships'] + new_item['relationships'])
-                            )
+                            # Merge relationships lists to avoid duplicates, keeping their order
+                            merged_items[key_for_new_item]['relationships'] = list(dict.fromkeys(
+                                merged_items[key_for_new_item]['relationships'] + new_item['relationships']
+                            ))
                         else:
                             merged_items[key_for_new_item] = new_item
                     
                     frontmatter[key] = list(merged_items.values())  # Rebuild the list from the merged dictionary
                     log.debug(f"Merged list for {key}: {frontmatter[key]}")
                 else:
-                    # Merge and deduplicate non-dict lists
-                    frontmatter[key] = list(set(frontmatter[key] + value))
+                    # Merge and deduplicate non-dict lists, keeping their order
+                    frontmatter[key] = list(dict.fromkeys(frontmatter[key] + value))
                     log.debug(f"Merged list for {key}: {frontmatter[key]}")
             elif isinstance(frontmatter[key], dict) and isinstance(value, dict):
                 # Merge dictionaries (for cases like `sentiment`)
@@ -75,60 +90,230 @@ def merge_existing_data(md_file_path, new_data):
             frontmatter[key] = value  # Add new key-value pair
             log.debug(f"Added new key {key} with value: {frontmatter[key]}")
 
-    return frontmatter, body
+    return frontmatter
+
+
+def sentiment_label(polarity):
+    """Labels a polarity as Positive, Negative or Neutral."""
+    if polarity > NEUTRAL_POLARITY:
+        return "Positive"
+    if polarity < -NEUTRAL_POLARITY:
+        return "Negative"
+    return "Neutral"
+
+def combine_sentiment_parts(existing, new_parts):
+    """
+    Combines the sentiments of a day's continuation parts into the day's
+    sentiment. Each part's polarity and subjectivity are weighted by its tokens,
+    and the label follows the combined polarity. The parts are kept, so merging
+    a part's result again replaces it rather than counting it twice.
+    """
+    parts = dict((existing or {}).get("parts") or {}) if isinstance(existing, dict) else {}
+    parts.update(new_parts)
+    total = sum(part["tokens"] for part in parts.values()) or 1
+    polarity = round(sum(part["polarity"] * part["tokens"] for part in parts.values()) / total, 3)
+    subjectivity = round(sum(part["subjectivity"] * part["tokens"] for part in parts.values()) / total, 3)
+    return {"sentiment": sentiment_label(polarity), "polarity": polarity, "subjectivity": subjectivity, "parts": parts}
+
+def part_tokens(custom_id):
+    """Returns the token count of a continuation part, used to weight its results; 1 if it is missing."""
+    part_path = DAY_CHUNK_DIR / custom_id
+    if not part_path.exists():
+        log.warning(f"Continuation part {custom_id} not found in {DAY_CHUNK_DIR}; weighting it equally.")
+        return 1
+    return count_tokens(part_path.read_text(encoding="utf-8"))
+
+def document_data_for(batch_type, response_content, custom_id=None):
+    """
+    Maps a response to the frontmatter fields it fills. A combined analysis
+    response is split into the fields of all four per-field job types. The
+    sentiment of a continuation part is recorded as a part of its day's.
+    """
+    if batch_type == "analysis":
+        document_data = {}
+        for field_type in ("topics", "entities", "sentiment", "key_points"):
+            # Sentiment is nested in the combined object, the other results sit at the top level
+            content = response_content.get("sentiment", {}) if field_type == "sentiment" else response_content
+            document_data.update(document_data_for(field_type, content, custom_id))
+        return document_data
+
+    document_data = {}
+    if batch_type == "topics":
+        document_data['topics'] = response_content.get('topics', [])
+    elif batch_type == "entities":
+        document_data['entity_relationships'] = response_content.get('entities', [])
+    elif batch_type == "sentiment":
+        document_data['overall_sentiment'] = {
+            "sentiment": response_content.get('sentiment', "Unknown"),
+            "polarity": response_content.get('polarity', 0),
+            "subjectivity": response_content.get('subjectivity', 0)
+        }
+        if custom_id and source_file_name(custom_id) != custom_id:
+            sentiment = document_data['overall_sentiment']
+            document_data['overall_sentiment'] = {"parts": {custom_id: {
+                "polarity": sentiment["polarity"],
+                "subjectivity": sentiment["subjectivity"],
+                "tokens": part_tokens(custom_id),
+            }}}
+    elif batch_type == "key_points":
+        document_data['detailed_summary'] = response_content.get('key_points', [])
+    return document_data
+
+def update_document(custom_id, batch_type, response_content):
+    """Merges one document's results into the frontmatter of its markdown file; parts go to their day file."""
+    file_name = source_file_name(custom_id)
+    log.info(f"Processing batch result for {custom_id} - Type: {batch_type}")
+    log.debug(f"Response content: {response_content}")
+
+    document_data = document_data_for(batch_type, response_content, custom_id)
+
+    md_file_path = MD_DIR / file_name
+    if md_file_path.exists():
+        log.info(f"Updating {md_file_path} with new {batch_type}.")
+        new_frontmatter, body = merge_existing_data(md_file_path, document_data)
+        update_markdown_frontmatter(md_file_path, new_frontmatter, body)
+        log.info(f"Successfully updated {file_name}")
+    else:
+        log.error(f"Markdown file {file_name} not found in {MD_DIR}. Skipping update.")
+
+def unpack_packed_result(result, document_ids):
+    """Unpacks a packed response into its documents. Returns (unpacked, documents that need an individual retry)."""
+    try:
+        content = result['response']['body']['choices'][0]['message']['content']
+    except (KeyError, IndexError, TypeError):
+        log.error(f"Packed request {result.get('custom_id')} failed; retrying its documents individually.")
+        return {}, list(document_ids)
 
+    unpacked, failed = unpack_response(content, document_ids)
+    if failed:
+        log.error(f"Could not unpack {len(failed)} documents from {result.get('custom_id')}.")
+    return unpacked, failed
 
-def process_batch_result(batch_data, batch_type):
-    """Processes batch results and updates the corresponding markdown file."""
+def iter_document_results(batch_data, packs, retries):
+    """
+    Yields (custom_id, response_content) for every document in batch results.
+    Packed results are split back into their documents; documents whose packed
+    result is unusable are appended to retries as (pack_id, document_id).
+    """
     for result in batch_data:
+        custom_id = result.get('custom_id', "")
         try:
-            file_name = result['custom_id']
-            response_content = json.loads(result['response']['body']['choices'][0]['message']['content'])
-
-            log.info(f"Processing batch result for {file_name} - Type: {batch_type}")
-            log.debug(f"Response content: {response_content}")
-
-            document_data = {}
-            if batch_type == "topics":
-                document_data['topics'] = response_content.get('topics', [])
-            elif batch_type == "entities":
-                document_data['entity_relationships'] = response_content.get('entities', [])
-            elif batch_type == "sentiment":
-                document_data['overall_sentiment'] = {
-                    "sentiment": response_content.get('sentiment', "Unknown"),
-                    "polarity": response_content.get('polarity', 0),
-                    "subjectivity": response_content.get('subjectivity', 0)
-                }
-            elif batch_type == "key_points":
-                document_data['detailed_summary'] = response_content.get('key_points', [])
-
-            md_file_path = MD_DIR / file_name
-            if md_file_path.exists():
-                log.info(f"Updating {md_file_path} with new {batch_type}.")
-                new_frontmatter, body = merge_existing_data(md_file_path, document_data)
-                update_markdown_frontmatter(md_file_path, new_frontmatter, body)
-                log.info(f"Successfully updated {file_name}")
-            else:
-                log.error(f"Markdown file {file_name} not found in {MD_DIR}. Skipping update.")
+            if custom_id in packs:
+                unpacked, failed = unpack_packed_result(result, packs[custom_id]["documents"])
+                retries.extend((custom_id, document_id) for document_id in failed)
+                for document_id, response_content in unpacked.items():
+                    yield document_id, response_content
+                continue
+
+            response_content = loads(result['response']['body']['choices'][0]['message']['content'])
+        except Exception as e:
+            log.error(f"Error processing result for {custom_id}: {e}")
+            continue
+        yield custom_id, response_content
+
+def queue_retries(retries, batch_type):
+    """
+    Queues the original requests of documents whose packed result was unusable,
+    given as (pack_id, document_id), for an individual retry. Failures are
+    logged, so they never stop the results from being processed.
+    """
+    failed = defaultdict(list)
+    for pack_id, document_id in retries:
+        failed[pack_id].append(document_id)
+
+    requests = []
+    for pack_id, document_ids in failed.items():
+        try:
+            requests.extend(pack_document_requests(pack_id, document_ids))
+        except Exception as e:
+            log.error(f"Could not load the requests of {pack_id} to retry {', '.join(document_ids)}: {e}")
+    if not requests:
+        return
+
+    try:
+        write_retry_requests(requests, batch_type)
+    except Exception as e:
+        log.error(f"Could not queue {len(requests)} {batch_type} retries: {e}")
+
+def process_batch_result(batch_data, batch_type, packs=None):
+    """
+    Processes batch results and updates the corresponding markdown file.
+    Packed results are split back into their documents; documents whose packed
+    result is unusable are queued for an individual retry and returned as
+    (pack_id, document_id).
+    """
+    packs = load_packs() if packs is None else packs
+    retries = []
+
+    for custom_id, response_content in iter_document_results(batch_data, packs, retries):
+        try:
+            update_document(custom_id, batch_type, response_content)
+        except Exception as e:
+            log.error(f"Error processing result for {custom_id}: {e}")
+
+    queue_retries(retries, batch_type)
+    return retries
 
+def process_cached_results(cached_results, batch_type):
+    """
+    Updates the markdown files from responses served by the response cache, as
+    (custom_id, content) pairs. Returns the custom_ids whose cached content is
+    not a JSON object, to be submitted again as cache misses.
+    """
+    unusable = []
+    for custom_id, content in cached_results:
+        try:
+            response_content = loads(content)
         except Exception as e:
-            log.error(f"Error processing result for {file_name}: {e}")
+            response_content = None
+            log.error(f"Error parsing cached result for {custom_id}: {e}")
+        if not isinstance(response_content, dict):
+            unusable.append(custom_id)
+            continue
+
+        try:
+            update_document(custom_id, batch_type, response_content)
+        except Exception as e:
+            log.error(f"Error processing cached result for {custom_id}: {e}")
+    return unusable
 
 # -------------------------------
 # Batch Result Processing
 # -------------------------------
 
-def process_results():
-    """Process batch results for all types."""
-    batches = {
-        "topics": "topics_results.jsonl",
-        "entities": "entities_results.jsonl",
-        "sentiment": "sentiment_results.jsonl",
-        "key_points": "key_points_results.jsonl"
-    }
-
-    for batch_type, result_file in batches.items():
-        result_file_path = BATCH_OUTPUT_DIR / result_file
+def process_results_file(result_file_path):
+    """
+    Processes one stitched results file, named "<job_type>_<submission>_results.jsonl"
+    (or "<job_type>_results.jsonl"), as soon as it is ready.
+    """
+    batch_type = results_job_type(result_file_path)
+    log.info(f"Processing {batch_type} results from {result_file_path}")
+
+    batch_data = load_jsonl_file(result_file_path)
+    if batch_data:
+        process_batch_result(batch_data, batch_type)
+    else:
+        log.error(f"No data found or failed to load {result_file_path}.")
+
+# Job types whose results files are processed by process_results, in the order they are merged
+RESULT_JOB_TYPES = ["analysis", "topics", "entities", "sentiment", "key_points"]
+
+def find_result_files(output_dir=BATCH_OUTPUT_DIR):
+    """
+    Lists (batch_type, path) for every results file in output_dir, in the order
+    of RESULT_JOB_TYPES and, within a job type, oldest submission first.
+    """
+    result_files = [(results_job_type(file_path), file_path) for file_path in Path(output_dir).glob("*_results.jsonl")]
+    return sorted(((batch_type, file_path) for batch_type, file_path in result_files if batch_type in RESULT_JOB_TYPES),
+                  key=lambda item: (RESULT_JOB_TYPES.index(item[0]), item[1].name))
+
+def process_results(output_dir=BATCH_OUTPUT_DIR):
+    """Process batch results for all types, one results file after another."""
+    result_files = find_result_files(output_dir)
+    if not result_files:
+        log.info("No results to process.")
+
+    for batch_type, result_file_path in result_files:
         log.info(f"Processing {batch_type} results from {result_file_path}")
 
         batch_data = load_jsonl_file(result_file_path)
@@ -137,14 +322,87 @@ def process_results():
         else:
             log.error(f"No data found or failed to load {result_file_path}.")
 
+# -------------------------------
+# Joined Result Processing
+# -------------------------------
+
+def join_results(result_files, packs=None):
+    """
+    Streams results files, given as (batch_type, path), and joins their
+    document data by markdown file name, in the order of result_files. Returns
+    the joined updates and the documents to retry per batch type.
+    """
+    packs = load_packs() if packs is None else packs
+    updates = defaultdict(list)
+    retries = defaultdict(list)
+
+    for batch_type, result_file_path in result_files:
+        try:
+            for custom_id, response_content in iter_document_results(iter_jsonl(result_file_path), packs,
+                                                                     retries[batch_type]):
+                try:
+                    # Results for continuation parts are merged into their day file
+                    updates[source_file_name(custom_id)].append(
+                        document_data_for(batch_type, response_content, custom_id))
+                except Exception as e:
+                    log.error(f"Error processing result for {custom_id}: {e}")
+        except Exception as e:
+            log.error(f"Failed to load {result_file_path}: {e}")
+
+    return updates, retries
+
+def apply_document_updates(item):
+    """Merges every joined result of one markdown file into its frontmatter with a single read and write."""
+    file_name, updates = item
+    md_file_path = MD_DIR / file_name
+    if not md_file_path.exists():
+        log.error(f"Markdown file {file_name} not found in {MD_DIR}. Skipping update.")
+        return False
+
+    def merge_all(frontmatter):
+        for document_data in updates:
+            merge_frontmatter(frontmatter, document_data)
+        return frontmatter
+
+    return rewrite_markdown_frontmatter(md_file_path, merge_all)
+
+def process_results_joined(output_dir=BATCH_OUTPUT_DIR, workers=None, packs=None):
+    """
+    Process batch results for all types in one pass: every results file is
+    streamed and joined by document, then each markdown file is rewritten once
+    with all of its results, across a pool of worker processes.
+    """
+    result_files = find_result_files(output_dir)
+    if not result_files:
+        log.info("No results to process.")
+        return [], []
+
+    log.info(f"Joining {', '.join(file_path.name for _, file_path in result_files)} from {output_dir}")
+    updates, retries = join_results(result_files, packs)
+    results, errors = run_parallel(apply_document_updates, list(updates.items()), workers,
+                                   description="markdown files")
+
+    for batch_type, batch_retries in retries.items():
+        queue_retries(batch_retries, batch_type)
+    return results, errors
+
 # -------------------------------
 # Script Entry Point
 # -------------------------------
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Merge batch results into the frontmatter of the markdown files.")
+    parser.add_argument("--sequential", action="store_true",
+                        help="Process one results file after another instead of joining them by document.")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes for joined processing.")
+    args = parser.parse_args()
+
     if DEBUG:
         log.info("Running in DEBUG mode.")
 
     log.info("Starting to process batch results.")
-    process_results()
+    if args.sequential:
+        process_results()
+    else:
+        process_results_joined(workers=args.workers)
     log.info("Finished processing batch results.")
@@ -0,0 +1,201 @@
+import os
+import re
+import shutil
+import logging
+from collections import defaultdict
+from pathlib import Path
+from WAAnalysis.config import (
+    BATCH_INPUT_DIR,
+    BATCH_OUTPUT_DIR,
+    SUBMITTED_INPUT_DIR,
+    PACK_REQUESTS_DIR,
+    BATCH_TRACKING_FILE,
+    BATCH_MAX_REQUESTS,
+    BATCH_MAX_BYTES,
+    BATCH_MAX_ENQUEUED_TOKENS,
+    TOKEN_CACHE_FILE,
+)
+from WAAnalysis.json_codec import dumps_bytes, read_json, iter_jsonl
+from WAAnalysis.utils import save_to_json
+from WAAnalysis.cost_forecast import count_input_tokens
+from WAAnalysis.request_packer import load_packs, expand_packed_requests, write_retry_requests
+
+# -------------------------------
+# Setup Logging
+# -------------------------------
+log = logging.getLogger(__name__)
+
+# -------------------------------
+# Sharding
+# -------------------------------
+
+def shard_lines(lines, token_counts, max_requests=BATCH_MAX_REQUESTS, max_bytes=BATCH_MAX_BYTES,
+                max_enqueued_tokens=BATCH_MAX_ENQUEUED_TOKENS):
+    """
+    Splits encoded JSONL lines, in order, into shards that each stay within the
+    request count, byte size and enqueued prompt token limits of one batch.
+    Returns a list of (start, end) line ranges.
+    """
+    shards = []
+    start = 0
+    size = tokens = 0
+    for index, (line, token_count) in enumerate(zip(lines, token_counts)):
+        if index > start and (index - start == max_requests or size + len(line) > max_bytes
+                              or tokens + token_count > max_enqueued_tokens):
+            shards.append((start, index))
+            start, size, tokens = index, 0, 0
+        size += len(line)
+        tokens += token_count
+    if start < len(lines):
+        shards.append((start, len(lines)))
+    return shards
+
+def shard_file_name(batch_file_path, shard_number):
+    """Names a shard of a batch input file, e.g. topics_batch_shard_002.jsonl."""
+    return f"{Path(batch_file_path).stem}_shard_{shard_number:03}.jsonl"
+
+def write_shards(batch_file_path, requests, cache_file=TOKEN_CACHE_FILE, **limits):
+    """
+    Writes a job type's requests to its batch input file and, if they exceed
+    the limits of one batch, to shard files beside it, removing stale shards.
+    Returns the files to submit, one batch each.
+    """
+    batch_file_path = Path(batch_file_path)
+    lines = [dumps_bytes(request) + b"\n" for request in requests]
+    shards = shard_lines(lines, count_input_tokens([request["body"] for request in requests], cache_file), **limits)
+
+    with open(batch_file_path, "wb") as batch_file:
+        batch_file.writelines(lines)
+    for stale_shard in batch_file_path.parent.glob(f"{batch_file_path.stem}_shard_*.jsonl"):
+        stale_shard.unlink()
+
+    if len(shards) <= 1:
+        return [batch_file_path]
+
+    shard_paths = []
+    for shard_number, (start, end) in enumerate(shards, start=1):
+        shard_path = batch_file_path.with_name(shard_file_name(batch_file_path, shard_number))
+        with open(shard_path, "wb") as shard_file:
+            shard_file.writelines(lines[start:end])
+        shard_paths.append(shard_path)
+    log.info(f"Split {len(lines)} requests in {batch_file_path.name} into {len(shard_paths)} shards.")
+    return shard_paths
+
+def archive_input(input_file, batch_id, archive_dir=SUBMITTED_INPUT_DIR):
+    """
+    Copies a submitted batch input file to the archive under its batch ID, as
+    the next submission of the job type overwrites it. Returns the copy's path.
+    """
+    Path(archive_dir).mkdir(parents=True, exist_ok=True)
+    archived = Path(archive_dir) / f"{batch_id}.jsonl"
+    shutil.copyfile(input_file, archived)
+    return archived
+
+# -------------------------------
+# Stitching
+# -------------------------------
+# Batches that will never complete; any partial output they have is still downloaded
+TERMINAL_STATUSES = {"failed", "expired", "cancelled"}
+
+# Each submission is stitched into its own results file, e.g.
+# analysis_20240301T120000_results.jsonl; results files written before
+# submissions were tracked are named <job_type>_results.jsonl
+RESULTS_FILE_PATTERN = re.compile(r"^(?P<job_type>.+?)(?:_(?P<submission>\d{8}T\d{6}))?_results\.jsonl$")
+
+def results_file_name(job_type, submission=None):
+    """Names the results file a submission's shard outputs are stitched into."""
+    return f"{job_type}_{submission}_results.jsonl" if submission else f"{job_type}_results.jsonl"
+
+def results_job_type(file_name):
+    """Returns the job type of a results file from its name, or None if it is not one."""
+    match = RESULTS_FILE_PATTERN.match(Path(file_name).name)
+    return match.group("job_type") if match else None
+
+def stitch_outputs(output_files, results_file):
+    """Concatenates shard output files into one results file, replacing it atomically."""
+    results_file = Path(results_file)
+    tmp_path = results_file.with_name(f".{results_file.name}.{os.getpid()}.tmp")
+    with open(tmp_path, "wb") as results:
+        for output_file in output_files:
+            with open(output_file, "rb") as output:
+                shutil.copyfileobj(output, results)
+    os.replace(tmp_path, results_file)
+
+def answered_custom_ids(output_file):
+    """Returns the custom_ids with a successful response in a batch output file."""
+    return {result.get("custom_id") for result in iter_jsonl(output_file)
+            if not result.get("error") and (result.get("response") or {}).get("status_code") == 200}
+
+def unanswered_requests(job, input_dir=BATCH_INPUT_DIR, output_dir=BATCH_OUTPUT_DIR, submitted_dir=SUBMITTED_INPUT_DIR):
+    """
+    Returns the requests of a finished shard without a successful response, read
+    from its archived input file (or, for shards tracked before inputs were
+    archived, its input file if still present).
+    """
+    input_file = Path(submitted_dir) / Path(job["input_file"]).name if job.get("input_file") \
+        else Path(input_dir) / job["filename"]
+    if not input_file.exists():
+        log.error(f"Input {input_file} of batch {job['batch_id']} is missing; its failed requests cannot be retried.")
+        return []
+
+    output_file = Path(output_dir) / Path(job.get("output_file") or "").name
+    answered = answered_custom_ids(output_file) if job.get("output_file") and output_file.exists() else set()
+    return [request for request in iter_jsonl(input_file) if request["custom_id"] not in answered]
+
+def shard_finished(job):
+    """Checks whether a shard will not change any more: it completed, or ended in a terminal status."""
+    return job["completed"] or job.get("status") in TERMINAL_STATUSES
+
+def stitch_completed_shards(tracking_file=BATCH_TRACKING_FILE, output_dir=BATCH_OUTPUT_DIR, input_dir=BATCH_INPUT_DIR,
+                            submitted_dir=SUBMITTED_INPUT_DIR, packs=None, requests_dir=PACK_REQUESTS_DIR):
+    """
+    Stitches the outputs of every submission whose shards have all finished
+    into the submission's results file read by batch_result_processor, and marks
+    the shards as stitched. Shards that failed, expired or were cancelled
+    contribute whatever partial output they have; shards without an output
+    file on disk contribute none. Requests of any shard left
+    without a successful response are queued in the job type's retry file, as
+    the original request of each document. Returns the results files written.
+    """
+    if not Path(tracking_file).exists():
+        return []
+    data = read_json(tracking_file)
+
+    submissions = defaultdict(list)
+    for job in data["jobs"]:
+        if job.get("shard_of"):
+            submissions[(job["job_type"], job["shard_of"], job.get("submission"))].append(job)
+
+    stitched = []
+    updated = False
+    for (job_type, shard_of, submission), shards in submissions.items():
+        if any(job.get("stitched_into") for job in shards):
+            continue
+        if not all(shard_finished(job) for job in shards):
+            log.info(f"{sum(shard_finished(job) for job in shards)}/{len(shards)} shards of {shard_of} finished.")
+            continue
+
+        shards.sort(key=lambda job: job["filename"])
+        results_file = Path(output_dir) / results_file_name(job_type, submission)
+        output_files = [Path(output_dir) / Path(job["output_file"]).name for job in shards if job.get("output_file")]
+        output_files = [output_file for output_file in output_files if output_file.exists()]
+        if output_files:
+            stitch_outputs(output_files, results_file)
+            stitched.append(results_file)
+        for job in shards:
+            job["stitched_into"] = results_file.name
+        updated = True
+        log.info(f"Stitched {len(output_files)} of {len(shards)} shard outputs of {shard_of} into {results_file.name}")
+
+        unanswered = [request for job in shards
+                      for request in unanswered_requests(job, input_dir, output_dir, submitted_dir)]
+        if unanswered:
+            packs = load_packs() if packs is None else packs
+            try:
+                write_retry_requests(expand_packed_requests(unanswered, packs, requests_dir), job_type, input_dir)
+            except Exception as e:
+                log.error(f"Could not queue the {len(unanswered)} unanswered {job_type} requests of {shard_of}: {e}")
+
+    if updated:
+        save_to_json(data, tracking_file)
+    return stitched
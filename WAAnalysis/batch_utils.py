@@ -1,14 +1,15 @@
-import json
 from openai import OpenAI
-from WAAnalysis.config import OPENAI_API_KEY
+from WAAnalysis.config import OPENAI_API_KEY, OPENAI_BASE_URL
+from WAAnalysis.json_codec import dumps, read_json
 
-client = OpenAI(api_key=OPENAI_API_KEY)
+client = OpenAI(api_key=OPENAI_API_KEY, base_url=OPENAI_BASE_URL)
 import logging
 from WAAnalysis.prompts import (
     create_topics_prompt,
     create_key_points_prompt,
     create_sentiment_prompt,
-    create_entities_prompt
+    create_entities_prompt,
+    create_analysis_prompt
 )
 from WAAnalysis.utils import (
     clean_conversation,
@@ -25,6 +26,7 @@ from WAAnalysis.config import (
     DEBUG,
     MANUAL_TESTING
 )
+from WAAnalysis.batch_sharder import TERMINAL_STATUSES
 
 # Set OpenAI API key
 
@@ -35,16 +37,19 @@ log = logging.getLogger(__name__)
 # --------------------------------------
 # Batch Input Generation Functions
 # --------------------------------------
+# Output token limits by prompt type; the combined analysis returns all four results
+MAX_TOKENS = {"analysis": 1200}
+DEFAULT_MAX_TOKENS = 300
+
 # Safely escape the content before saving
 def escape_json_string(input_string):
     return input_string
 
-def generate_batch_input(file_name, prompt_type):
-    file_path = MD_DIR / file_name
-    document = file_path.read_text()
-
-    # Clean the conversation text for processing
-    clean_text = clean_conversation(document)
+def generate_batch_input(file_name, prompt_type, clean_text=None):
+    # Clean the conversation text for processing, unless the caller already did
+    if clean_text is None:
+        file_path = MD_DIR / file_name
+        clean_text = clean_conversation(file_path.read_text())
 
     # Select the appropriate prompt based on prompt_type
     if prompt_type == "topics":
@@ -56,6 +61,9 @@ def generate_batch_input(file_name, prompt_type):
     elif prompt_type == "key_points":
         # Key Points generation uses the context from the frontmatter
         prompts = create_key_points_prompt(clean_text)
+    elif prompt_type == "analysis":
+        # Topics, entities, sentiment and key points from a single read of the conversation
+        prompts = create_analysis_prompt(clean_text)
     else:
         raise ValueError("Invalid prompt type")
 
@@ -67,12 +75,14 @@ def generate_batch_input(file_name, prompt_type):
         "body": {
             "model": "gpt-4o-mini",
             "messages": [
-                {"role": "system", "content": json.dumps(prompts["system"], ensure_ascii=False)},
-                {"role": "user", "content": json.dumps(prompts["user"], ensure_ascii=False)}
+                {"role": "system", "content": dumps(prompts["system"])},
+                {"role": "user", "content": dumps(prompts["user"])}
             ],
-            "max_tokens": 300
+            "max_tokens": MAX_TOKENS.get(prompt_type, DEFAULT_MAX_TOKENS)
         }
     }
+    if prompt_type == "analysis":
+        jsonl_line["body"]["response_format"] = {"type": "json_object"}
     return jsonl_line
 
 def write_jsonl_file(prompt_type, jsonl_line):
@@ -112,7 +122,7 @@ def create_batch(input_file_id, description="Batch job"):
         log.info(f"Skipping batch creation in MANUAL_TESTING mode for input file ID: {input_file_id}")
         return None
 
-    response = openai.Batch.create(
+    response = client.batches.create(
         input_file_id=input_file_id,
         endpoint="/v1/chat/completions",
         completion_window=COMPLETION_WINDOW,
@@ -127,27 +137,40 @@ def create_batch(input_file_id, description="Batch job"):
 
 def check_batch_status(batch_id):
     """Checks the status of a batch."""
-    response = openai.Batch.retrieve(batch_id)
+    response = client.batches.retrieve(batch_id)
     return response.status  # Return batch status
 
 
-def download_batch_results(batch_id):
-    """Downloads batch results after completion."""
-    batch = openai.Batch.retrieve(batch_id)
+def get_batch_timestamps(batch_id):
+    """Returns the Unix times at which a batch was created, started and completed."""
+    batch = client.batches.retrieve(batch_id)
+    return {
+        "created_at": batch.created_at,
+        "in_progress_at": batch.in_progress_at,
+        "completed_at": batch.completed_at
+    }
+
 
-    if batch['status'] == "completed":
-        output_file_id = batch['output_file_id']
+def download_batch_results(batch_id):
+    """
+    Downloads batch results once the batch has finished, streaming the output
+    file to disk. Batches that failed, expired or were cancelled have any
+    partial output downloaded. Returns the output path, or None without one.
+    """
+    batch = client.batches.retrieve(batch_id)
+
+    if batch.status == "completed" or batch.status in TERMINAL_STATUSES:
+        output_file_id = batch.output_file_id
         if output_file_id:
-            output_response = client.files.download(output_file_id)
             output_path = BATCH_OUTPUT_DIR / f"{batch_id}_output.jsonl"
-            with open(output_path, 'wb') as f:
-                f.write(output_response)
+            with client.files.with_streaming_response.content(output_file_id) as response:
+                response.stream_to_file(output_path)
             log.info(f"Results saved to {output_path}")
             return output_path
         else:
             log.warning("No output file found for this batch.")
     else:
-        log.info(f"Batch is not completed yet. Current status: {batch['status']}")
+        log.info(f"Batch is not completed yet. Current status: {batch.status}")
 
 
 def cancel_batch(batch_id):
@@ -156,7 +179,7 @@ def cancel_batch(batch_id):
         log.info(f"Skipping batch cancellation in MANUAL_TESTING mode for batch ID: {batch_id}")
         return None
 
-    response = openai.Batch.cancel(batch_id)
+    response = client.batches.cancel(batch_id)
     log.info(f"Batch {batch_id} status: {response.status}")
 
 
@@ -172,8 +195,7 @@ def update_markdown_from_results(job):
 
     # Load the results from the output JSONL file
     output_file_path = BATCH_OUTPUT_DIR / output_file
-    with open(output_file_path, 'r') as f:
-        result_data = json.load(f)  # Assuming the batch output is stored as JSON
+    result_data = read_json(output_file_path)  # Assuming the batch output is stored as JSON
 
     # Parse the result data to update the markdown frontmatter
     md_file_path = MD_DIR / file_name
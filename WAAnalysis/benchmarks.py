@@ -0,0 +1,152 @@
+import re
+import json
+import time
+import tempfile
+import logging
+import argparse
+from pathlib import Path
+import tiktoken
+from WAAnalysis.config import MD_DIR, BATCH_OUTPUT_DIR
+from WAAnalysis.utils import clean_conversation, clean_conversations
+from WAAnalysis.json_codec import read_jsonl, write_jsonl
+
+# -------------------------------
+# Setup Logging
+# -------------------------------
+log = logging.getLogger(__name__)
+
+# -------------------------------
+# Helper Functions
+# -------------------------------
+
+def timed(func, *args, **kwargs):
+    """Calls func and returns its result along with the elapsed wall time in seconds."""
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+def rate(count, seconds):
+    """Returns count per second, guarding against a zero duration."""
+    return count / seconds if seconds else float('inf')
+
+# -------------------------------
+# Conversation Cleaning Benchmark
+# -------------------------------
+
+def legacy_clean_conversation(document):
+    """The previous clean_conversation implementation, kept as the benchmark baseline."""
+    clean_doc = re.sub(r'---[\s\S]*?---', '', document).strip()
+    clean_doc = re.sub(r'\d{2}:\d{2} [APM]{2}', '', clean_doc).strip()
+    return clean_doc
+
+def benchmark_clean_conversation(directory=MD_DIR, workers=None):
+    """
+    Benchmarks conversation cleaning over a directory of markdown files, reporting
+    throughput in documents/s and the tokens removed from the prompts.
+    """
+    documents = [file.read_text() for file in sorted(Path(directory).glob("*.md"))]
+    total = len(documents)
+    if not total:
+        log.warning(f"No markdown files found in {directory}.")
+        return None
+
+    legacy, legacy_time = timed(lambda: [legacy_clean_conversation(d) for d in documents])
+    single, single_time = timed(lambda: [clean_conversation(d) for d in documents])
+    parallel, parallel_time = timed(clean_conversations, documents, workers)
+
+    tokenizer = tiktoken.get_encoding("cl100k_base")
+    raw_tokens = sum(len(tokens) for tokens in tokenizer.encode_ordinary_batch(documents))
+    legacy_tokens = sum(len(tokens) for tokens in tokenizer.encode_ordinary_batch(legacy))
+    clean_tokens = sum(len(tokens) for tokens in tokenizer.encode_ordinary_batch(single))
+
+    results = {
+        "documents": total,
+        "legacy_docs_per_second": rate(total, legacy_time),
+        "single_docs_per_second": rate(total, single_time),
+        "parallel_docs_per_second": rate(total, parallel_time),
+        "raw_tokens": raw_tokens,
+        "legacy_tokens": legacy_tokens,
+        "clean_tokens": clean_tokens,
+        "tokens_saved_vs_raw": raw_tokens - clean_tokens,
+        "tokens_saved_vs_legacy": legacy_tokens - clean_tokens,
+    }
+
+    log.info(f"Cleaned {total} documents from {directory}")
+    log.info(f"Legacy:   {results['legacy_docs_per_second']:.0f} docs/s")
+    log.info(f"Single:   {results['single_docs_per_second']:.0f} docs/s")
+    log.info(f"Parallel: {results['parallel_docs_per_second']:.0f} docs/s")
+    log.info(f"Tokens: raw {raw_tokens}, legacy {legacy_tokens}, cleaned {clean_tokens} "
+             f"(saved {results['tokens_saved_vs_raw']} vs raw, {results['tokens_saved_vs_legacy']} vs legacy)")
+    return results
+
+# -------------------------------
+# JSON Codec Benchmark
+# -------------------------------
+
+def stdlib_read_jsonl(file_path):
+    """Reads a JSONL file line by line with the standard library, as the package used to."""
+    with open(file_path, 'r') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+def stdlib_write_jsonl(file_path, records):
+    """Writes a JSONL file with the standard library, as the package used to."""
+    with open(file_path, 'w') as f:
+        for record in records:
+            f.write(json.dumps(record) + "\n")
+
+def benchmark_json_codec(directory=BATCH_OUTPUT_DIR):
+    """
+    Benchmarks reading and writing the batch output JSONL files in a directory with
+    the shared codec against the standard library, reporting throughput in MB/s.
+    """
+    files = sorted(Path(directory).glob("*.jsonl"))
+    total_bytes = sum(file.stat().st_size for file in files)
+    if not total_bytes:
+        log.warning(f"No JSONL files found in {directory}.")
+        return None
+    megabytes = total_bytes / (1024 * 1024)
+
+    records, codec_read_time = timed(lambda: [read_jsonl(file) for file in files])
+    _, stdlib_read_time = timed(lambda: [stdlib_read_jsonl(file) for file in files])
+
+    with tempfile.TemporaryDirectory() as scratch:
+        scratch_file = Path(scratch) / "output.jsonl"
+        _, codec_write_time = timed(lambda: [write_jsonl(scratch_file, batch) for batch in records])
+        _, stdlib_write_time = timed(lambda: [stdlib_write_jsonl(scratch_file, batch) for batch in records])
+
+    results = {
+        "files": len(files),
+        "megabytes": megabytes,
+        "codec_read_mb_per_second": rate(megabytes, codec_read_time),
+        "stdlib_read_mb_per_second": rate(megabytes, stdlib_read_time),
+        "codec_write_mb_per_second": rate(megabytes, codec_write_time),
+        "stdlib_write_mb_per_second": rate(megabytes, stdlib_write_time),
+    }
+
+    log.info(f"Read and wrote {len(files)} files ({megabytes:.1f} MB) from {directory}")
+    log.info(f"Read:  codec {results['codec_read_mb_per_second']:.1f} MB/s, "
+             f"stdlib {results['stdlib_read_mb_per_second']:.1f} MB/s")
+    log.info(f"Write: codec {results['codec_write_mb_per_second']:.1f} MB/s, "
+             f"stdlib {results['stdlib_write_mb_per_second']:.1f} MB/s")
+    return results
+
+# -------------------------------
+# Main Execution
+# -------------------------------
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run WAAnalysis performance benchmarks.")
+    subparsers = parser.add_subparsers(dest="benchmark", required=True)
+
+    clean_parser = subparsers.add_parser("clean", help="Conversation cleaning throughput and tokens saved.")
+    clean_parser.add_argument("--directory", type=Path, default=MD_DIR)
+    clean_parser.add_argument("--workers", type=int, default=None)
+
+    json_parser = subparsers.add_parser("json", help="JSONL read/write throughput, codec vs stdlib.")
+    json_parser.add_argument("--directory", type=Path, default=BATCH_OUTPUT_DIR)
+
+    args = parser.parse_args()
+    if args.benchmark == "clean":
+        benchmark_clean_conversation(args.directory, args.workers)
+    elif args.benchmark == "json":
+        benchmark_json_codec(args.directory)
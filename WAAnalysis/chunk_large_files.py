@@ -1,10 +1,15 @@
 import os
-import tiktoken
+import shutil
+import hashlib
 import logging
+import argparse
 from pathlib import Path
 import re
-from WAAnalysis.config import MD_DIR2
-from WAAnalysis.utils import ensure_directories_exist
+import numpy as np
+from WAAnalysis.config import MD_DIR2, CHUNK_MANIFEST_FILE
+from WAAnalysis.utils import ensure_directories_exist, atomic_write, is_unchanged, save_to_json
+from WAAnalysis.json_codec import read_json
+from WAAnalysis.token_cache import get_encoding
 
 # -------------------------------
 # Setup Directories
@@ -13,21 +18,25 @@ CHUNKED_DIR = Path("chunked")
 ensure_directories_exist([CHUNKED_DIR])
 
 # -------------------------------
-# Tokenizer Initialization
+# Chunking Config
 # -------------------------------
-tokenizer = tiktoken.get_encoding("cl100k_base")
 TOKEN_LIMIT = 20000  # 20k tokens per chunk
 
+# Zero-width positions where a chunk may end, from most to least preferred:
+# before a user turn, after a paragraph break, after a line break, then before
+# the space between two words. A chunk is only cut mid-word if none of these
+# fall within the limit.
+CHUNK_BOUNDARY_PATTERNS = [
+    re.compile(r'^(?=\*\*User\*\*)', re.MULTILINE),
+    re.compile(r'(?<=\n\n)(?=\S)'),
+    re.compile(r'(?<=\n)(?=\S)'),
+    re.compile(r'(?<=\S)(?=[ \t])'),
+]
+
 # -------------------------------
 # Helper Functions
 # -------------------------------
 
-def count_tokens(text):
-    """Count tokens in a given text using the tokenizer."""
-    tokens = tokenizer.encode(text)
-    logging.info(f"Token count for text: {len(tokens)}")
-    return len(tokens)
-
 def extract_frontmatter(text):
     """Extract and return the YAML frontmatter from the file content."""
     frontmatter_match = re.match(r'^---\n(.*?)\n---', text, re.DOTALL)
@@ -42,35 +51,96 @@ def extract_system_message_link(text):
         return system_message_match.group(0), text[:system_message_match.start()].strip()
     return "", text
 
-def split_text_by_user(messages):
+def boundary_token_offsets(text, char_offsets, pattern):
     """
-    Split the conversation by 'User' messages, ensuring that each chunk starts with a 'User' message.
+    Returns the token offsets at which the pattern's boundaries fall, given the
+    character offset where each token of the text starts.
     """
-    user_indices = [i for i, msg in enumerate(messages) if msg.startswith("**User**")]
-    return [messages[i:j] for i, j in zip(user_indices, user_indices[1:] + [None])]
+    positions = [match.start() for match in pattern.finditer(text)]
+    return np.unique(np.searchsorted(char_offsets, positions, side="left"))
 
-def write_chunked_file(base_filename, part_number, part_total, chunk, output_dir, frontmatter, system_message):
-    """Write each chunk to a markdown file with frontmatter, updated title, and system message."""
+def pack_token_ranges(total_tokens, limit, boundary_levels):
+    """
+    Packs [0, total_tokens) into consecutive (start, end) token ranges of at most
+    limit tokens each.
+
+    boundary_levels holds sorted arrays of token offsets where a range may end,
+    from most to least preferred. Each range ends at the furthest boundary of the
+    most preferred level that fits, or exactly at the limit if none does.
+    """
+    ranges = []
+    start = 0
+    while total_tokens - start > limit:
+        end = start + limit
+        for boundaries in boundary_levels:
+            i = np.searchsorted(boundaries, end, side="right") - 1
+            if i >= 0 and boundaries[i] > start:
+                end = int(boundaries[i])
+                break
+        ranges.append((start, end))
+        start = end
+    ranges.append((start, total_tokens))
+    return ranges
+
+def split_text_by_tokens(text, limit=TOKEN_LIMIT, encoding=None, tokens=None):
+    """
+    Splits text into chunks of at most limit tokens with a single encode.
+
+    The text is encoded once (or not at all if its tokens are passed in) and each
+    token's character offset recovered. Message boundaries are mapped to token
+    offsets, and chunks are packed from those offsets, falling back to
+    paragraph, line and word breaks for oversized turns.
+    """
+    if limit <= 0:
+        raise ValueError(f"No room for content in a chunk: the token budget is {limit}.")
+    encoding = encoding or get_encoding()
+    tokens = encoding.encode_ordinary(text) if tokens is None else tokens
+    if len(tokens) <= limit:
+        return [text]
+
+    decoded, char_offsets = encoding.decode_with_offsets(tokens)
+    char_offsets = np.asarray(char_offsets)
+    boundary_levels = [boundary_token_offsets(decoded, char_offsets, pattern) for pattern in CHUNK_BOUNDARY_PATTERNS]
+
+    char_offsets = np.append(char_offsets, len(decoded))
+    return [decoded[char_offsets[start]:char_offsets[end]]
+            for start, end in pack_token_ranges(len(tokens), limit, boundary_levels)]
+
+def chunk_wrapper(base_filename, part_number, part_total, frontmatter, system_message):
+    """Returns the text written before and after each chunk's content."""
     # Inject the updated title with continuation part in the frontmatter
     updated_title = re.sub(r'title: "(.*?)"', f'title: "{base_filename} (continued: Part {part_number} of {part_total})"', frontmatter)
     
     # Create a # Title header based on the base_filename and part number
     title_header = f"# {base_filename} (continued: Part {part_number} of {part_total})"
     
+    return f"{updated_title}\n\n{title_header}\n\n", f"\n\n{system_message}"
+
+def write_chunked_file(base_filename, part_number, part_total, chunk, output_dir, frontmatter, system_message):
+    """Write each chunk to a markdown file with frontmatter, updated title, and system message."""
     # Add the frontmatter, title header, chunk content, and system message to the file
-    chunk_content = f"{updated_title}\n\n{title_header}\n\n" + "\n".join(chunk) + f"\n\n{system_message}"
+    prefix, suffix = chunk_wrapper(base_filename, part_number, part_total, frontmatter, system_message)
+    chunk_content = f"{prefix}{chunk.strip()}{suffix}"
 
     chunk_filename = f"{base_filename}_part_{part_number}.md"
     chunk_filepath = output_dir / chunk_filename
 
-    with open(chunk_filepath, 'w', encoding='utf-8') as chunk_file:
-        chunk_file.write(chunk_content)
+    atomic_write(chunk_filepath, chunk_content)
     
     logging.info(f"Chunk written: {chunk_filename}")
+    return chunk_filename
 
-def process_and_chunk_file(filepath, output_dir):
-    """Process each markdown file, split it into 20k token chunks, and save them."""
+def process_and_chunk_file(filepath, output_dir, encoding=None):
+    """
+    Process each markdown file, split it into 20k token chunks, and save them.
+
+    The content is encoded once, both to count it and to split it. Files that
+    fit within the limit are copied as-is. Each chunk's budget leaves room for
+    the frontmatter, title and system message written around it. Returns the
+    file's token count and the names of the files written, or None on failure.
+    """
     try:
+        encoding = encoding or get_encoding()
         with open(filepath, 'r', encoding='utf-8') as file:
             text = file.read()
 
@@ -80,89 +150,161 @@ def process_and_chunk_file(filepath, output_dir):
         frontmatter, content = extract_frontmatter(text)
         system_message, content = extract_system_message_link(content)
 
-        # Split the conversation into messages
-        messages = content.split("\n")
+        tokens = encoding.encode_ordinary(content)
+        token_count = len(tokens) + len(encoding.encode_ordinary(frontmatter + system_message))
+        if token_count <= TOKEN_LIMIT:
+            logging.info(f"File {filepath.name} is under 20k tokens. Copying as-is.")
+            output = copy_file(filepath, output_dir)
+            return (token_count, [output]) if output else None
 
-        # Split by user messages
-        chunks = split_text_by_user(messages)
-        
-        current_chunk = []
-        current_token_count = 0
-        chunked_messages = []
-        chunk_counter = 1
-
-        # Create chunks of messages until the token limit is reached
-        for chunk in chunks:
-            chunk_tokens = count_tokens("\n".join(chunk))
-            
-            if current_token_count + chunk_tokens > TOKEN_LIMIT:
-                chunked_messages.append(current_chunk)
-                current_chunk = chunk
-                current_token_count = chunk_tokens
-                chunk_counter += 1
-            else:
-                current_chunk.extend(chunk)
-                current_token_count += chunk_tokens
-        
-        # Add the final chunk
-        if current_chunk:
-            chunked_messages.append(current_chunk)
+        # The wrapper is measured with the widest part numbers possible, one part per token
+        logging.info(f"File {filepath.name} exceeds 20k tokens. Token count: {token_count}")
+        widest = len(tokens)
+        overhead = len(encoding.encode_ordinary("".join(
+            chunk_wrapper(base_filename, widest, widest, frontmatter, system_message))))
+
+        # Pack chunks at message boundaries within what the limit leaves for content
+        chunked_messages = split_text_by_tokens(content, TOKEN_LIMIT - overhead, encoding, tokens)
 
         # Write each chunk to a file
         part_total = len(chunked_messages)
-        for part_number, chunk in enumerate(chunked_messages, start=1):
+        return token_count, [
             write_chunked_file(base_filename, part_number, part_total, chunk, output_dir, frontmatter, system_message)
+            for part_number, chunk in enumerate(chunked_messages, start=1)
+        ]
 
     except Exception as e:
         logging.error(f"Failed to process {filepath.name}: {e}")
+        return None
 
 # -------------------------------
 # Copy File If Under 20k Tokens
 # -------------------------------
 
 def copy_file(filepath, output_dir):
-    """Copy files under 20k tokens without modification."""
+    """
+    Pass files under 20k tokens through without modification. The output is a
+    hardlink to the source where possible, otherwise a copy made by
+    shutil.copyfile, which uses copy_file_range/sendfile in the kernel rather
+    than a read and write in Python. Chunk outputs are only ever rewritten by
+    atomic replacement, so a hardlinked output never modifies its source.
+    Returns the name of the output file, or None on failure.
+    """
     try:
         destination = output_dir / filepath.name
-        with open(filepath, 'r', encoding='utf-8') as source_file:
-            content = source_file.read()
-        
-        with open(destination, 'w', encoding='utf-8') as dest_file:
-            dest_file.write(content)
+        destination.unlink(missing_ok=True)
+        try:
+            os.link(filepath, destination)
+        except OSError:
+            shutil.copyfile(filepath, destination)
         
         logging.info(f"File copied as-is: {filepath.name}")
+        return filepath.name
 
     except Exception as e:
         logging.error(f"Failed to copy {filepath.name}: {e}")
+        return None
+
+# -------------------------------
+# Chunk Manifest
+# -------------------------------
+
+def load_chunk_manifest():
+    """Loads the chunk manifest, or returns an empty one."""
+    if CHUNK_MANIFEST_FILE.exists():
+        return read_json(CHUNK_MANIFEST_FILE)
+    return {"files": {}}
+
+def file_sha256(file_path):
+    """Returns the SHA-256 hex digest of a file, read in blocks."""
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as file:
+        for block in iter(lambda: file.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def outputs_exist(entry, output_dir):
+    """Checks that every output recorded for a source file is still present."""
+    return all((output_dir / output).exists() for output in entry.get("outputs", []))
+
+def prune_outputs(previous_entries, entries, output_dir):
+    """Removes outputs recorded for deleted or rechunked sources that the current run did not produce."""
+    current = {output for entry in entries.values() for output in entry["outputs"]}
+    pruned = 0
+    for entry in previous_entries.values():
+        for output in set(entry.get("outputs", [])) - current:
+            (output_dir / output).unlink(missing_ok=True)
+            pruned += 1
+    return pruned
 
 # -------------------------------
 # Main Chunking Function
 # -------------------------------
 
-def chunk_large_files():
-    """Process all files in MD_DIR2 and chunk those larger than 20k tokens."""
-    markdown_files = [f for f in MD_DIR2.iterdir() if f.suffix == '.md']
+def chunk_large_files(source_dir=MD_DIR2, output_dir=CHUNKED_DIR, incremental=True):
+    """
+    Process all files in MD_DIR2 and chunk those larger than 20k tokens.
+
+    In incremental mode, sources whose size and modification time (or, failing
+    that, content hash) match the manifest and whose outputs still exist are
+    skipped without being tokenized. Outputs of deleted sources are pruned.
+
+    Every token covers at least one byte, so files of at most TOKEN_LIMIT bytes
+    are copied without being tokenized. Larger files are encoded once, and the
+    same tokens are used to split them if they exceed the limit.
+    """
+    markdown_files = sorted(f for f in Path(source_dir).iterdir() if f.suffix == '.md')
+    previous_entries = load_chunk_manifest()["files"] if incremental else {}
+    entries = {}
+    pending = []
 
     logging.info("Starting chunking process for files larger than 20k tokens...")
 
     for filepath in markdown_files:
+        stat = filepath.stat()
+        entry = previous_entries.get(filepath.name)
+        if entry and outputs_exist(entry, output_dir):
+            if is_unchanged(entry, stat):
+                entries[filepath.name] = entry
+                continue
+            digest = file_sha256(filepath)
+            if entry["sha256"] == digest:
+                entries[filepath.name] = {**entry, "size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+                continue
+        else:
+            digest = file_sha256(filepath)
+        pending.append((filepath, stat, digest))
+
+    logging.info(f"{len(markdown_files) - len(pending)} files unchanged, {len(pending)} to process.")
+
+    for filepath, stat, digest in pending:
         try:
-            # Read the file and count tokens
-            with open(filepath, 'r', encoding='utf-8') as file:
-                text = file.read()
-                token_count = count_tokens(text)
-
-            # Chunk files larger than 20k tokens
-            if token_count > TOKEN_LIMIT:
-                logging.info(f"File {filepath.name} exceeds 20k tokens. Token count: {token_count}")
-                process_and_chunk_file(filepath, CHUNKED_DIR)
+            if stat.st_size <= TOKEN_LIMIT:
+                logging.info(f"File {filepath.name} is under 20k bytes. Copying as-is.")
+                output = copy_file(filepath, output_dir)
+                processed = (None, [output]) if output else None
             else:
-                logging.info(f"File {filepath.name} is under 20k tokens. Copying as-is.")
-                copy_file(filepath, CHUNKED_DIR)
+                processed = process_and_chunk_file(filepath, output_dir)
+
+            # Failed files are left out of the manifest so the next run retries them
+            if processed:
+                token_count, outputs = processed
+                entries[filepath.name] = {
+                    "size": stat.st_size,
+                    "mtime_ns": stat.st_mtime_ns,
+                    "sha256": digest,
+                    "token_count": token_count,
+                    "outputs": outputs,
+                }
                 
         except Exception as e:
             logging.error(f"Failed to process {filepath.name}: {e}")
 
+    pruned = prune_outputs(previous_entries, entries, output_dir)
+    if pruned:
+        logging.info(f"Pruned {pruned} outputs of deleted or rechunked sources.")
+
+    save_to_json({"files": entries}, CHUNK_MANIFEST_FILE)
     logging.info("Chunking process completed.")
 
 # -------------------------------
@@ -170,4 +312,8 @@ def chunk_large_files():
 # -------------------------------
 
 if __name__ == "__main__":
-    chunk_large_files()
+    parser = argparse.ArgumentParser(description="Chunk exported conversations larger than the token limit.")
+    parser.add_argument("--full", action="store_true", help="Reprocess every file, ignoring the chunk manifest.")
+    args = parser.parse_args()
+
+    chunk_large_files(incremental=not args.full)
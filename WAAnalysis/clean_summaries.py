@@ -1,19 +1,183 @@
 import re
+import hashlib
 import logging
+from collections import defaultdict
 from WAAnalysis.config import PROJECT_ROOT
+from WAAnalysis.parallel import run_parallel
+from WAAnalysis.utils import atomic_write
 
 # Define the directory containing the markdown files
 MARKDOWN_DIR = PROJECT_ROOT / "./chunked"
 
 log = logging.getLogger(__name__)
 
+# A section runs from its "## Summary" header to the next heading, the next
+# message line (e.g. "**User**: Hello") or the end of the file. Bold lines
+# without a speaker colon are part of the summary.
+SUMMARY_HEADER_PATTERN = re.compile(r'^## Summary[^\n]*(?:\n|\Z)', re.MULTILINE)
+SECTION_END_PATTERN = re.compile(r'^(?:#{1,6} |\*\*[^*\n]+\*\*:)', re.MULTILINE)
+PART_SUFFIX_PATTERN = re.compile(r'_part_(\d+)$')
+
+# Number of words per shingle used for containment detection
+SHINGLE_WORDS = 8
+
+# Modulus and base for the polynomial rolling hash over word hashes
+ROLLING_HASH_MODULUS = (1 << 61) - 1
+ROLLING_HASH_BASE = 1_000_003
+
 def find_summary_sections(content):
     """
     Find all sections of the content that start with ## Summary and their positions.
+
+    Returns a list of (start, end) offsets, where start is the header position and
+    end is where the section's content stops.
+    """
+    headers = list(SUMMARY_HEADER_PATTERN.finditer(content))
+    sections = []
+    for i, header in enumerate(headers):
+        limit = headers[i + 1].start() if i + 1 < len(headers) else len(content)
+        section_end = SECTION_END_PATTERN.search(content, header.end(), limit)
+        sections.append((header.start(), section_end.start() if section_end else limit))
+    return sections
+
+def normalize_summary(text):
+    """Normalizes a summary for comparison: drops the header, lowercases and collapses whitespace."""
+    text = SUMMARY_HEADER_PATTERN.sub('', text, count=1)
+    return text.lower().split()
+
+def rolling_shingles(words, k=SHINGLE_WORDS):
+    """Returns the set of rolling hashes of every k-word window, computed in one linear pass."""
+    word_hashes = [hash(word) % ROLLING_HASH_MODULUS for word in words]
+    if len(word_hashes) < k:
+        return set()
+
+    shingle_hash = 0
+    for word_hash in word_hashes[:k]:
+        shingle_hash = (shingle_hash * ROLLING_HASH_BASE + word_hash) % ROLLING_HASH_MODULUS
+    shingles = {shingle_hash}
+
+    # Weight of the word leaving the window
+    leading_weight = pow(ROLLING_HASH_BASE, k - 1, ROLLING_HASH_MODULUS)
+    for i in range(k, len(word_hashes)):
+        shingle_hash = (shingle_hash - word_hashes[i - k] * leading_weight) % ROLLING_HASH_MODULUS
+        shingle_hash = (shingle_hash * ROLLING_HASH_BASE + word_hashes[i]) % ROLLING_HASH_MODULUS
+        shingles.add(shingle_hash)
+    return shingles
+
+def find_duplicate_sections(contents):
     """
-    pattern = re.compile(r'^## Summary', re.MULTILINE)
-    matches = [(m.start(), m.end()) for m in pattern.finditer(content)]
-    return matches
+    Finds duplicate summary sections across a group of documents.
+
+    Sections are normalized and hashed. Exact duplicates of an earlier section are
+    marked, as are sections whose text is contained in a larger section. Containment
+    candidates come from an index of rolling word-shingle hashes and are verified
+    against the normalized text.
+
+    Returns a list with the set of duplicate (start, end) spans for each document.
+    """
+    sections = []
+    seen_digests = set()
+    duplicates = [set() for _ in contents]
+
+    for doc_index, content in enumerate(contents):
+        for span in find_summary_sections(content):
+            words = normalize_summary(content[span[0]:span[1]])
+            if not words:
+                continue
+            digest = hashlib.blake2b(" ".join(words).encode("utf-8"), digest_size=16).digest()
+            if digest in seen_digests:
+                duplicates[doc_index].add(span)
+                continue
+            seen_digests.add(digest)
+            sections.append((doc_index, span, words))
+
+    if len(sections) < 2:
+        return duplicates
+
+    # Index every section's shingles, and its words for sections shorter than
+    # one shingle, so containers can be looked up by hash
+    section_shingles = [rolling_shingles(words) for _, _, words in sections]
+    section_words = [set(words) for _, _, words in sections]
+    postings = defaultdict(list)
+    word_postings = defaultdict(list)
+    for section_id, (shingles, words) in enumerate(zip(section_shingles, section_words)):
+        for shingle in shingles:
+            postings[shingle].append(section_id)
+        for word in words:
+            word_postings[word].append(section_id)
+    padded_texts = [f" {' '.join(words)} " for _, _, words in sections]
+
+    for section_id, (doc_index, span, words) in enumerate(sections):
+        shingles = section_shingles[section_id]
+        if shingles:
+            # Only sections sharing the rarest shingle can contain this one
+            rarest = min(shingles, key=lambda shingle: len(postings[shingle]))
+            candidates = [
+                other for other in postings[rarest]
+                if other != section_id and shingles <= section_shingles[other]
+            ]
+        else:
+            # Sections shorter than one shingle are looked up by their rarest word
+            word_set = section_words[section_id]
+            rarest = min(word_set, key=lambda word: len(word_postings[word]))
+            candidates = [
+                other for other in word_postings[rarest]
+                if other != section_id and word_set <= section_words[other]
+            ]
+
+        for other in candidates:
+            if other != section_id and len(sections[other][2]) > len(words) \
+                    and padded_texts[section_id] in padded_texts[other]:
+                duplicates[doc_index].add(span)
+                break
+
+    return duplicates
+
+def remove_spans(content, spans):
+    """Removes the given (start, end) spans from the content."""
+    pieces = []
+    position = 0
+    for start, end in sorted(spans):
+        pieces.append(content[position:start])
+        position = end
+    pieces.append(content[position:])
+    return "".join(pieces)
+
+def remove_duplicate_summaries(content, name=""):
+    """
+    Removes ## Summary sections that duplicate, or are contained in, another
+    summary section of the same content.
+
+    Returns the cleaned content, or None if no changes were made.
+    """
+    duplicates = find_duplicate_sections([content])[0]
+    if not duplicates:
+        return None
+    log.info(f"Removing {len(duplicates)} duplicate summaries from '{name}'.")
+    return remove_spans(content, duplicates)
+
+def conversation_key(file_path):
+    """Returns the conversation a file belongs to, and its continuation part number."""
+    match = PART_SUFFIX_PATTERN.search(file_path.stem)
+    if match:
+        return file_path.stem[:match.start()], int(match.group(1))
+    return file_path.stem, 0
+
+def clean_conversation_files(file_paths):
+    """
+    Removes duplicate summaries across the files of one conversation (the original
+    file and its continuation parts). Returns the number of files cleaned.
+    """
+    contents = [file_path.read_text(encoding='utf-8') for file_path in file_paths]
+    duplicates = find_duplicate_sections(contents)
+
+    total_cleaned = 0
+    for file_path, content, spans in zip(file_paths, contents, duplicates):
+        if spans:
+            atomic_write(file_path, remove_spans(content, spans))
+            log.info(f"Cleaned {len(spans)} duplicate summaries from {file_path}")
+            total_cleaned += 1
+    return total_cleaned
 
 def clean_markdown_file(file_path):
     """
@@ -21,62 +185,24 @@ def clean_markdown_file(file_path):
     comparing content between them, and removing duplicates if applicable.
     """
     try:
-        with open(file_path, 'r', encoding='utf-8') as file:
-            content = file.read()
-
-        # Find the positions of all "## Summary" sections
-        summary_positions = find_summary_sections(content)
-
-        if len(summary_positions) < 2:
-            # Skip files with fewer than 2 summary sections
-            # log.info(f"File '{file_path.name}' has less than 2 '## Summary'. Skipping.")
-            return False  # Indicate no changes were made
-
-        # Extract the content between each "## Summary" section
-        summaries = []
-        for i in range(len(summary_positions) - 1):
-            start = summary_positions[i][1]  # End of the current summary header
-            end = summary_positions[i + 1][0]  # Start of the next summary header
-            summaries.append(content[start:end].strip())
-
-        # Add the last summary chunk from the last "## Summary" to the end of the file
-        summaries.append(content[summary_positions[-1][1]:].strip())
-
-        # Compare the smaller chunk with the larger chunk to find duplicates
-        cleaned_summaries = []
-        for i in range(len(summaries)):
-            smaller_chunk = summaries[i]
-            if i + 1 < len(summaries):
-                larger_chunk = summaries[i + 1]
-                if smaller_chunk in larger_chunk:
-                    log.info(f"Duplicate summary found in file '{file_path.name}'. Removing smaller chunk.")
-                    continue  # Skip the smaller duplicate chunk
-            cleaned_summaries.append(smaller_chunk)
-
-        # Rebuild the content with the cleaned summaries
-        new_content = content[:summary_positions[0][0]]  # Content before the first summary
-        for summary in cleaned_summaries:
-            new_content += "## Summary\n" + summary + "\n"
-
-        # Save the cleaned content back to the file
-        with open(file_path, 'w', encoding='utf-8') as file:
-            file.write(new_content)
-
-        log.info(f"Cleaned: {file_path}")
-        return True  # Indicate changes were made
-
+        return clean_conversation_files([file_path]) > 0
     except Exception as e:
         log.error(f"Failed to clean {file_path}: {e}")
         return False
 
-def clean_all_markdown_files(directory):
+def clean_all_markdown_files(directory, workers=None):
     """
-    Cleans all markdown files in the specified directory by removing duplicate summaries.
+    Cleans all markdown files in the specified directory by removing duplicate
+    summaries, both within a file and across the continuation parts of a conversation.
     """
-    total_cleaned = 0
+    conversations = defaultdict(list)
     for file_path in directory.glob("*.md"):
-        if clean_markdown_file(file_path):
-            total_cleaned += 1
+        key, part = conversation_key(file_path)
+        conversations[key].append((part, file_path))
+    groups = [[file_path for _, file_path in sorted(parts)] for _, parts in sorted(conversations.items())]
+
+    results, errors = run_parallel(clean_conversation_files, groups, workers, description="conversations")
+    total_cleaned = sum(cleaned for cleaned in results if cleaned)
     log.info(f"Total cleaned files: {total_cleaned}")
 
 if __name__ == "__main__":
@@ -3,6 +3,8 @@ import yaml
 import logging
 from pathlib import Path
 from WAAnalysis.config import PROJECT_ROOT
+from WAAnalysis.parallel import run_parallel
+from WAAnalysis.utils import atomic_write
 
 # Define the directory containing the markdown files
 MARKDOWN_DIR = PROJECT_ROOT / "./chunked"
@@ -63,8 +65,7 @@ def process_markdown_file(file_path):
 
         # Write the updated content back to the file if changes were made
         if updated:
-            with open(file_path, 'w', encoding='utf-8') as file:
-                file.write(new_content)
+            atomic_write(file_path, new_content)
             log.info(f"Updated and sanitized: {file_path}")
             return True
 
@@ -74,14 +75,12 @@ def process_markdown_file(file_path):
         log.error(f"Failed to process {file_path}: {e}")
         return False
 
-def process_all_markdown_files(directory):
+def process_all_markdown_files(directory, workers=None):
     """
     Process all markdown files in the specified directory by sanitizing their YAML frontmatter.
     """
-    total_updated = 0
-    for file_path in directory.glob("*.md"):
-        if process_markdown_file(file_path):
-            total_updated += 1
+    results, errors = run_parallel(process_markdown_file, sorted(directory.glob("*.md")), workers)
+    total_updated = sum(1 for updated in results if updated)
     log.info(f"Total updated files: {total_updated}")
 
 if __name__ == "__main__":
@@ -31,6 +31,10 @@ OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 if not OPENAI_API_KEY:
     raise EnvironmentError("OpenAI API key not found in environment variables.")
 
+# Base URL of the OpenAI API, e.g. http://127.0.0.1:8765/v1 to run against the
+# local stand-in server (local_openai_server.py). Unset uses the live API.
+OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL") or None
+
 
 # -------------------------------
 # Participant and Messaging Config
@@ -57,8 +61,22 @@ DATA_DIR = PROJECT_ROOT / 'data'
 # Directories for batch input/output files
 BATCH_INPUT_DIR = DATA_DIR / "batch_inputs"
 BATCH_OUTPUT_DIR = DATA_DIR / "batch_outputs"
+# A copy of every submitted batch input file, named by its batch ID
+SUBMITTED_INPUT_DIR = BATCH_INPUT_DIR / "submitted"
 BATCH_TRACKING_FILE = DATA_DIR / 'tracking.json'
 
+# Provider limits per batch: requests and bytes per input file, and the prompt
+# tokens one batch may enqueue (set to the organization's queue limit for the model)
+BATCH_MAX_REQUESTS = 50_000
+BATCH_MAX_BYTES = 200 * 1024 * 1024
+BATCH_MAX_ENQUEUED_TOKENS = 2_000_000
+
+# Batch poller: shortest and longest wait between checks of one batch, and the
+# number of API calls or downloads it runs at once
+POLL_MIN_INTERVAL = 10
+POLL_MAX_INTERVAL = 600
+POLL_CONCURRENCY = 8
+
 
 # -------------------------------
 # Data and Storage Config
@@ -75,6 +93,83 @@ STORAGE_DIR = PROJECT_ROOT / 'storage'
 DATABASE_PATH = STORAGE_DIR / 'ChatStorage.sqlite'
 CHUNKED_DIR = PROJECT_ROOT / "chunked"
 SUMMARY_DIR = PROJECT_ROOT / "summarized_chunked"
+# Per-chunk hash, token count and summary state, used to skip unchanged chunks
+SUMMARY_MANIFEST_FILE = DATA_DIR / 'summarization_manifest.json'
+# Per-source hash and chunk outputs, used to skip unchanged exports when chunking
+CHUNK_MANIFEST_FILE = DATA_DIR / 'chunk_manifest.json'
+
+# -------------------------------
+# Token Counting Config
+# -------------------------------
+# Tokenizer encoding used for all token counts
+TOKEN_ENCODING = "cl100k_base"
+# Token counts keyed by (encoding, content hash), so unchanged text is never re-tokenized
+TOKEN_CACHE_FILE = STORAGE_DIR / 'token_cache.sqlite'
+# Least recently used entries are evicted beyond this many
+TOKEN_CACHE_MAX_ENTRIES = 500_000
+# Texts tokenized per batch, and threads tiktoken spreads each batch across
+TOKEN_BATCH_SIZE = 256
+TOKENIZER_THREADS = os.cpu_count() or 1
+
+# -------------------------------
+# Response Cache Config
+# -------------------------------
+# Successful responses keyed by a hash of their request body, so identical requests are never resubmitted
+RESPONSE_CACHE_FILE = STORAGE_DIR / 'response_cache.sqlite'
+
+# -------------------------------
+# Output Sizing Config
+# -------------------------------
+# Per-job-type max_tokens limits learned from past batch outputs
+OUTPUT_PROFILES_FILE = DATA_DIR / 'output_profiles.json'
+# Share of past responses each limit must fit, and the headroom added on top
+MAX_TOKENS_QUANTILE = 0.99
+MAX_TOKENS_HEADROOM = 1.1
+# Input-size bands a job type's limits are learned for
+MAX_TOKENS_BINS = 4
+# Never size a request's output below this
+MAX_TOKENS_FLOOR = 64
+
+# -------------------------------
+# Request Packing Config
+# -------------------------------
+# Documents of at most this many tokens are packed several to a request
+PACK_DOCUMENT_LIMIT = 500
+# Conversation tokens and documents per packed request
+PACK_TOKEN_BUDGET = 4000
+PACK_MAX_DOCUMENTS = 20
+# Documents in each packed request, used to unpack its response
+PACK_MANIFEST_FILE = DATA_DIR / 'packs.json'
+# The original request of every packed document, one JSONL file per pack, so documents can be retried on their own
+PACK_REQUESTS_DIR = DATA_DIR / 'pack_requests'
+# Requests queued for an individual retry are kept in <job_type> + this suffix in BATCH_INPUT_DIR
+RETRY_FILE_SUFFIX = "_retry_batch.jsonl"
+
+# -------------------------------
+# Day Chunking Config
+# -------------------------------
+# Token budget for one day file's conversation in a batch request; heavier days are split into parts
+DAY_CHUNK_TOKEN_LIMIT = 8000
+# Tokens of trailing messages repeated at the start of the next part for context
+DAY_CHUNK_OVERLAP_TOKENS = 300
+# Continuation parts of day files in MD_DIR that exceed the budget
+DAY_CHUNK_DIR = DATA_DIR / 'markdown_parts'
+
+# -------------------------------
+# Local API Server Config
+# -------------------------------
+# Address of the local stand-in for the OpenAI Files, Batches and Chat Completions endpoints
+LOCAL_API_HOST = "127.0.0.1"
+LOCAL_API_PORT = 8765
+# Seconds the stand-in spends on each request in a batch, and the share of requests it fails
+LOCAL_API_LATENCY = 0.01
+LOCAL_API_ERROR_RATE = 0.0
+
+# -------------------------------
+# Parallel Processing Config
+# -------------------------------
+# Number of worker processes/threads used for per-file corpus work
+CORPUS_WORKERS = os.cpu_count() or 1
 
 # -------------------------------
 # Summarization Config
@@ -1,7 +1,8 @@
 import logging
 import re
-from WAAnalysis.utils import load_markdown, update_markdown_frontmatter
+from WAAnalysis.utils import rewrite_markdown_frontmatter
 from WAAnalysis.config import MD_DIR
+from WAAnalysis.parallel import run_parallel
 
 # -------------------------------
 # Setup Logging
@@ -31,21 +32,16 @@ def convert_topics_to_tags(frontmatter):
 # -------------------------------
 # Process Markdown Files to Update Tags
 # -------------------------------
-def process_markdown_for_tags():
-    """Iterate over markdown files and convert 'topics' to sluggified 'tags'."""
-    md_files = [f for f in MD_DIR.iterdir() if f.suffix == '.md']
-
-    for file in md_files:
-        log.info(f"Processing file: {file}")
-        frontmatter, body = load_markdown(file)
-
-        # Convert topics to tags
-        frontmatter = convert_topics_to_tags(frontmatter)
-
-        # Update markdown frontmatter
-        update_markdown_frontmatter(file, frontmatter)
+def update_file_tags(file):
+    """Convert topics to tags and update the frontmatter of a file in a single read."""
+    if rewrite_markdown_frontmatter(file, convert_topics_to_tags):
         log.info(f"Updated topics to tags for {file}")
 
+def process_markdown_for_tags(workers=None):
+    """Iterate over markdown files and convert 'topics' to sluggified 'tags'."""
+    md_files = sorted(f for f in MD_DIR.iterdir() if f.suffix == '.md')
+    run_parallel(update_file_tags, md_files, workers)
+
 if __name__ == "__main__":
     log.info("Starting process to convert topics to tags.")
     process_markdown_for_tags()
@@ -1,8 +1,9 @@
 import logging
 import yaml
 from pathlib import Path
-from WAAnalysis.utils import load_markdown, update_markdown_frontmatter
+from WAAnalysis.utils import read_frontmatter, update_markdown_frontmatter
 from WAAnalysis.config import MD_DIR
+from WAAnalysis.parallel import run_parallel
 
 # -------------------------------
 # Setup Logging
@@ -61,25 +62,27 @@ def update_entity_relationships(entity_relationships):
 # -------------------------------
 # Process Markdown Files to Update Roles and Names
 # -------------------------------
-def process_markdown_for_entity_relationships():
-    """Iterate over markdown files and update entity_relationships' names and roles."""
-    md_files = [f for f in MD_DIR.iterdir() if f.suffix == '.md']
+def update_file_entity_relationships(file):
+    """Updates entity_relationships' names and roles in a single markdown file."""
+    log.debug(f"Processing file: {file}")
+    frontmatter = read_frontmatter(file)
 
-    for file in md_files:
-        log.info(f"Processing file: {file}")
-        frontmatter, body = load_markdown(file)
+    entity_relationships = frontmatter.get('entity_relationships', [])
+    if entity_relationships:
+        log.debug(f"Original entity_relationships for {file}: {entity_relationships}")
 
-        entity_relationships = frontmatter.get('entity_relationships', [])
-        if entity_relationships:
-            log.debug(f"Original entity_relationships for {file}: {entity_relationships}")
+        # Update the names and roles in entity_relationships
+        updated_entities = update_entity_relationships(entity_relationships)
+        frontmatter['entity_relationships'] = updated_entities
 
-            # Update the names and roles in entity_relationships
-            updated_entities = update_entity_relationships(entity_relationships)
-            frontmatter['entity_relationships'] = updated_entities
+        log.debug(f"Updated entity_relationships for {file}: {updated_entities}")
+        update_markdown_frontmatter(file, frontmatter)
+        log.info(f"Updated names and roles for {file}")
 
-            log.debug(f"Updated entity_relationships for {file}: {updated_entities}")
-            update_markdown_frontmatter(file, frontmatter)
-            log.info(f"Updated names and roles for {file}")
+def process_markdown_for_entity_relationships(workers=None):
+    """Iterate over markdown files and update entity_relationships' names and roles."""
+    md_files = sorted(f for f in MD_DIR.iterdir() if f.suffix == '.md')
+    run_parallel(update_file_entity_relationships, md_files, workers)
 
 if __name__ == "__main__":
     log.info("Starting process to update names and roles in entity_relationships.")
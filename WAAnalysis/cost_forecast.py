@@ -0,0 +1,211 @@
+import time
+import logging
+import argparse
+from collections import defaultdict
+from functools import lru_cache
+from pathlib import Path
+import tiktoken
+from WAAnalysis.config import BATCH_INPUT_DIR, TOKEN_ENCODING, TOKEN_BATCH_SIZE, TOKEN_CACHE_FILE, RETRY_FILE_SUFFIX
+from WAAnalysis.token_cache import count_tokens_many
+from WAAnalysis.json_codec import iter_jsonl, write_json
+from WAAnalysis.pricing import pricing_model, model_costs
+
+# -------------------------------
+# Setup Logging
+# -------------------------------
+log = logging.getLogger(__name__)
+
+# -------------------------------
+# Chat Format Overhead
+# -------------------------------
+# Each chat message costs its content plus a fixed wrapper of about three
+# tokens and one for the role, and every request is primed with three more
+# tokens for the reply
+TOKENS_PER_MESSAGE = 4
+TOKENS_PER_REQUEST = 3
+
+COST_KEYS = ("input_cost_normal", "output_cost_normal", "total_cost_normal",
+             "input_cost_batch", "output_cost_batch", "total_cost_batch")
+
+# -------------------------------
+# Request Parsing
+# -------------------------------
+
+@lru_cache(maxsize=None)
+def encoding_for_model(model):
+    """Returns the tokenizer encoding a model uses, or TOKEN_ENCODING for unknown models."""
+    try:
+        return tiktoken.encoding_name_for_model(model)
+    except KeyError:
+        log.warning(f"No known encoding for model {model}. Counting with {TOKEN_ENCODING}.")
+        return TOKEN_ENCODING
+
+def message_text(message):
+    """Returns the text of a chat message, whether its content is a string or a list of parts."""
+    content = message.get("content") or ""
+    if isinstance(content, str):
+        return content
+    return "".join(part.get("text", "") for part in content if isinstance(part, dict))
+
+def output_token_limit(body):
+    """Returns the request's output token cap, or None if it has none."""
+    return body.get("max_completion_tokens", body.get("max_tokens"))
+
+def batch_input_files(input_dir=BATCH_INPUT_DIR):
+    """
+    Lists the job types' batch input files, leaving out retry files, whose
+    requests are submitted as part of the next batch input file.
+    """
+    return sorted(file_path for file_path in Path(input_dir).glob("*_batch.jsonl")
+                  if not file_path.name.endswith(RETRY_FILE_SUFFIX))
+
+def job_type_for_file(file_path):
+    """Names the job type of a batch input file, e.g. topics_batch.jsonl -> topics."""
+    return Path(file_path).stem.removesuffix("_batch")
+
+# -------------------------------
+# Token Counting
+# -------------------------------
+
+def count_input_tokens(bodies, cache_file=TOKEN_CACHE_FILE):
+    """
+    Returns the prompt tokens of each request body. The messages of all the
+    requests are counted with one cached, batched call per encoding, so prompts
+    shared by every request (such as the system prompt) are tokenized once.
+    """
+    totals = [TOKENS_PER_REQUEST] * len(bodies)
+    by_encoding = defaultdict(list)
+    for index, body in enumerate(bodies):
+        messages = body.get("messages", [])
+        totals[index] += TOKENS_PER_MESSAGE * len(messages)
+        by_encoding[encoding_for_model(body.get("model"))].extend((index, message_text(m)) for m in messages)
+
+    for encoding_name, items in by_encoding.items():
+        counts = count_tokens_many([text for _, text in items], encoding_name, cache_file)
+        for (index, _), count in zip(items, counts):
+            totals[index] += count
+    return totals
+
+def new_group():
+    """Returns empty running totals for one job type and model."""
+    return {"requests": 0, "input_tokens": 0, "max_output_tokens": 0, "unbounded_requests": 0}
+
+def forecast_batch_file(file_path, job_type=None, batch_size=TOKEN_BATCH_SIZE, cache_file=TOKEN_CACHE_FILE,
+                        groups=None):
+    """
+    Streams a batch input file and adds its requests' token totals to groups,
+    keyed by (job_type, model). Output is bounded by each request's max_tokens;
+    requests without one are counted as unbounded. Returns the groups.
+    """
+    job_type = job_type or job_type_for_file(file_path)
+    groups = defaultdict(new_group) if groups is None else groups
+
+    def add_batch(bodies):
+        for body, input_tokens in zip(bodies, count_input_tokens(bodies, cache_file)):
+            group = groups[(job_type, body.get("model"))]
+            group["requests"] += 1
+            group["input_tokens"] += input_tokens
+            limit = output_token_limit(body)
+            if limit is None:
+                group["unbounded_requests"] += 1
+            else:
+                group["max_output_tokens"] += limit
+
+    bodies = []
+    for request in iter_jsonl(file_path):
+        bodies.append(request.get("body", {}))
+        if len(bodies) == batch_size:
+            add_batch(bodies)
+            bodies = []
+    add_batch(bodies)
+    return groups
+
+# -------------------------------
+# Cost Report
+# -------------------------------
+
+def group_costs(model, group):
+    """Returns the upper-bound costs of a group, or None if the model is not in the pricing table."""
+    if pricing_model(model) is None:
+        return None
+    return model_costs(model, group["input_tokens"], group["max_output_tokens"])
+
+def rollup(rows, key):
+    """Sums rows' token totals and costs by one of their fields."""
+    totals = {}
+    for row in rows:
+        total = totals.setdefault(row[key], {**new_group(), "costs": dict.fromkeys(COST_KEYS, 0.0)})
+        for field in new_group():
+            total[field] += row[field]
+        if row["costs"] is None:
+            total["costs"] = None
+        elif total["costs"] is not None:
+            for cost_key in COST_KEYS:
+                total["costs"][cost_key] = round(total["costs"][cost_key] + row["costs"][cost_key], 2)
+    return totals
+
+def forecast_report(groups):
+    """Builds the forecast from grouped totals: one row per job type and model, with rollups."""
+    rows = []
+    for (job_type, model), group in sorted(groups.items(), key=lambda item: (item[0][0], str(item[0][1]))):
+        costs = group_costs(model, group)
+        if costs is None:
+            log.warning(f"No pricing for model {model}; its {group['requests']} requests are not costed.")
+        rows.append({"job_type": job_type, "model": model, **group, "costs": costs})
+
+    return {
+        "groups": rows,
+        "by_job_type": rollup(rows, "job_type"),
+        "by_model": rollup(rows, "model"),
+    }
+
+def log_forecast(report):
+    """Logs the forecast as tables of batch and normal (synchronous) costs."""
+    log.info(f"{'Job Type':<15} {'Model':<20} {'Requests':>10} {'Input':>12} {'Max Output':>12} "
+             f"{'Batch Cost':>12} {'Normal Cost':>12}")
+    log.info("-" * 99)
+    for row in report["groups"]:
+        costs = row["costs"] or {}
+        batch_cost = f"${costs['total_cost_batch']:.2f}" if costs else "n/a"
+        normal_cost = f"${costs['total_cost_normal']:.2f}" if costs else "n/a"
+        log.info(f"{row['job_type']:<15} {str(row['model']):<20} {row['requests']:>10} {row['input_tokens']:>12} "
+                 f"{row['max_output_tokens']:>12} {batch_cost:>12} {normal_cost:>12}")
+        if row["unbounded_requests"]:
+            log.warning(f"{row['unbounded_requests']} {row['job_type']} requests have no max_tokens; "
+                        f"their output is not included.")
+
+    for field in ("by_job_type", "by_model"):
+        for name, total in report[field].items():
+            costs = total["costs"]
+            if costs:
+                log.info(f"{field.replace('_', ' ').capitalize()} {name}: batch ${costs['total_cost_batch']:.2f}, "
+                         f"normal ${costs['total_cost_normal']:.2f} (at most)")
+
+def forecast_costs(file_paths, output_file=None, cache_file=TOKEN_CACHE_FILE):
+    """Forecasts the token usage and cost of batch input files before they are submitted."""
+    start = time.perf_counter()
+    groups = defaultdict(new_group)
+    for file_path in file_paths:
+        forecast_batch_file(file_path, cache_file=cache_file, groups=groups)
+
+    report = forecast_report(groups)
+    requests = sum(group["requests"] for group in groups.values())
+    log.info(f"Forecast {requests} requests in {time.perf_counter() - start:.1f}s.")
+    log_forecast(report)
+
+    if output_file:
+        write_json(output_file, report)
+        log.info(f"Cost forecast saved to {output_file}")
+    return report
+
+# -------------------------------
+# Main Execution
+# -------------------------------
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Forecast the token usage and cost of batch input files.")
+    parser.add_argument("files", nargs="*", type=Path, help="Batch input JSONL files (default: every *_batch.jsonl).")
+    parser.add_argument("--output", type=Path, default=None, help="Write the forecast to this JSON file.")
+    args = parser.parse_args()
+
+    forecast_costs(args.files or batch_input_files(), args.output)
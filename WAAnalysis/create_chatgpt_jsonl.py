@@ -1,23 +1,35 @@
-import json
+import hashlib
 import logging
 from pathlib import Path
-import tiktoken  # Import tokenizer for counting tokens
 from WAAnalysis.utils import (
     clean_conversation,
-    load_markdown,
+    strip_frontmatter,
+    save_to_json,
+    is_unchanged,
 )
+from WAAnalysis.json_codec import read_json, write_jsonl
+from WAAnalysis.token_cache import count_tokens
+from WAAnalysis.output_sizing import size_requests
 from WAAnalysis.config import (
     BATCH_INPUT_DIR,
     CHUNKED_DIR,
+    SUMMARY_MANIFEST_FILE,
     DEBUG
 )
 
 log = logging.getLogger(__name__)
 
-# Tokenizer initialization (for token counting)
-tokenizer = tiktoken.get_encoding("cl100k_base")
 TOKEN_LIMIT = 5000  # 5k tokens
 
+# Summary states recorded in the manifest
+STATE_SUMMARIZED = "summarized"
+STATE_BELOW_LIMIT = "below_limit"
+STATE_EMPTY = "empty"
+STATE_PENDING = "pending"
+
+# Unchanged chunks in these states never need a summarization request
+SKIP_STATES = {STATE_SUMMARIZED, STATE_BELOW_LIMIT, STATE_EMPTY}
+
 # --------------------------------------
 # Helper Functions
 # --------------------------------------
@@ -56,18 +68,12 @@ Assistant: For backups, you can consider cloud storage or RAID solutions.
     return system_prompt
 
 
-def count_tokens(text):
-    """
-    Count tokens using the tokenizer.
-    """
-    return len(tokenizer.encode(text))
-
-
 def has_summary_after_title(content):
     """
     Check if the document has a `## Summary` header within the first 5 lines after the main `# Title`.
     """
-    lines = content.strip().split("\n")
+    # Only the first few lines are needed, so avoid splitting the whole document
+    lines = content.strip().split("\n", 6)
     
     # We're only interested in the first 5 lines after the frontmatter
     for i, line in enumerate(lines[:5]):  # Limit to first 5 lines
@@ -78,31 +84,70 @@ def has_summary_after_title(content):
     return False
 
 
-def generate_batch_input(file_name):
+# --------------------------------------
+# Summarization Manifest
+# --------------------------------------
+
+def load_manifest():
+    """Loads the summarization manifest, or returns an empty one."""
+    if SUMMARY_MANIFEST_FILE.exists():
+        return read_json(SUMMARY_MANIFEST_FILE)
+    return {"files": {}, "token_limit": TOKEN_LIMIT}
+
+
+def inspect_chunk(file_path, previous_entry=None):
     """
-    Create a batch input for summarizing markdown chunks.
+    Reads a markdown chunk and determines its summary state.
+
+    Returns the chunk's manifest entry and, for chunks that still need a summary,
+    the cleaned text to send. Token counts are reused from the previous entry when
+    the content hash is unchanged.
     """
-    file_path = CHUNKED_DIR / file_name
-    frontmatter, document_body = load_markdown(file_path)
+    stat = file_path.stat()
+    data = file_path.read_bytes()
+    entry = {
+        "size": stat.st_size,
+        "mtime_ns": stat.st_mtime_ns,
+        "sha256": hashlib.sha256(data).hexdigest(),
+        "token_count": None,
+    }
+    same_content = bool(previous_entry) and previous_entry.get("sha256") == entry["sha256"]
 
+    document_body = strip_frontmatter(data.decode("utf-8")).strip()
     if not document_body:
-        log.error(f"Failed to retrieve content from {file_name}. Skipping...")
-        return None
+        log.error(f"Failed to retrieve content from {file_path.name}. Skipping...")
+        entry["state"] = STATE_EMPTY
+        return entry, None
 
     # Check if the file already has a summary after the main title
     if has_summary_after_title(document_body):
-        log.info(f"Skipping {file_name} as it already has a `## Summary` after the title.")
-        return None
+        log.info(f"Skipping {file_path.name} as it already has a `## Summary` after the title.")
+        entry["state"] = STATE_SUMMARIZED
+        return entry, None
 
     # Clean the conversation text for processing
     clean_text = clean_conversation(document_body)
 
     # Check token count
-    token_count = count_tokens(clean_text)
+    if same_content and previous_entry.get("token_count") is not None:
+        token_count = previous_entry["token_count"]
+    else:
+        token_count = count_tokens(clean_text)
+    entry["token_count"] = token_count
+
     if token_count < TOKEN_LIMIT:
-        log.info(f"Skipping {file_name} as it has fewer than {TOKEN_LIMIT} tokens (actual: {token_count}).")
-        return None
+        log.info(f"Skipping {file_path.name} as it has fewer than {TOKEN_LIMIT} tokens (actual: {token_count}).")
+        entry["state"] = STATE_BELOW_LIMIT
+        return entry, None
+
+    entry["state"] = STATE_PENDING
+    return entry, clean_text
+
 
+def build_batch_request(file_name, clean_text):
+    """
+    Create the JSONL structure for summarizing a cleaned markdown chunk.
+    """
     # Generate system prompt with instructions
     system_prompt = generate_system_prompt()
 
@@ -123,6 +168,16 @@ def generate_batch_input(file_name):
     return jsonl_line
 
 
+def generate_batch_input(file_name):
+    """
+    Create a batch input for summarizing markdown chunks.
+    """
+    entry, clean_text = inspect_chunk(CHUNKED_DIR / file_name)
+    if clean_text is None:
+        return None
+    return build_batch_request(file_name, clean_text)
+
+
 def write_jsonl_file(jsonl_data):
     """
     Write the generated batch input to a JSONL file.
@@ -132,12 +187,8 @@ def write_jsonl_file(jsonl_data):
 
     batch_file_path = batch_folder / "summarization_batch_input.jsonl"
 
-    # Write the JSONL lines to the file
-    with open(batch_file_path, mode='w', encoding='utf-8') as jsonl_file:
-        for jsonl_line in jsonl_data:
-            if jsonl_line:  # Ensure no None values are written
-                json.dump(jsonl_line, jsonl_file)
-                jsonl_file.write('\n')
+    # Write the JSONL lines to the file, skipping None values
+    write_jsonl(batch_file_path, (jsonl_line for jsonl_line in jsonl_data if jsonl_line))
 
     if DEBUG:
         log.debug(f"JSONL file written to {batch_file_path}")
@@ -152,6 +203,11 @@ def write_jsonl_file(jsonl_data):
 def create_jsonl_for_chunks():
     """
     Generate JSONL input for all markdown chunks in CHUNKED_DIR.
+
+    Chunks whose size and modification time match the manifest and that are already
+    summarized (or too short to summarize) are skipped without being opened. The
+    manifest records the TOKEN_LIMIT its states were decided under; if the limit
+    has changed since, every chunk is inspected again.
     """
     try:
         chunked_files = list(Path(CHUNKED_DIR).glob("*.md"))
@@ -160,16 +216,41 @@ def create_jsonl_for_chunks():
             log.warning(f"No markdown files found in {CHUNKED_DIR}.")
             return
 
+        manifest = load_manifest()
+        previous_entries = manifest["files"]
+        limit_changed = manifest.get("token_limit") != TOKEN_LIMIT
+        if limit_changed and previous_entries:
+            log.info(f"TOKEN_LIMIT changed from {manifest.get('token_limit')} to {TOKEN_LIMIT}; inspecting every chunk.")
+        entries = {}
         jsonl_data = []
+        skipped_unopened = 0
 
         for chunk_file in chunked_files:
-            log.info(f"Processing file: {chunk_file.name}")
-            batch_input = generate_batch_input(chunk_file.name)
-            if batch_input:
-                jsonl_data.append(batch_input)
+            file_name = chunk_file.name
+            previous_entry = previous_entries.get(file_name)
+
+            if not limit_changed and is_unchanged(previous_entry, chunk_file.stat()) \
+                    and previous_entry["state"] in SKIP_STATES:
+                entries[file_name] = previous_entry
+                skipped_unopened += 1
+                continue
+
+            log.info(f"Processing file: {file_name}")
+            entry, clean_text = inspect_chunk(chunk_file, previous_entry)
+            entries[file_name] = entry
+            if clean_text is not None:
+                jsonl_data.append(build_batch_request(file_name, clean_text))
+
+        log.info(f"Skipped {skipped_unopened} unchanged chunks without opening them.")
+
+        # Entries for deleted chunks are dropped
+        manifest["files"] = entries
+        manifest["token_limit"] = TOKEN_LIMIT
+        save_to_json(manifest, SUMMARY_MANIFEST_FILE)
 
         # Write to JSONL file
         if jsonl_data:
+            size_requests(jsonl_data, "summarization")
             jsonl_file_path = write_jsonl_file(jsonl_data)
             log.info(f"JSONL file created at: {jsonl_file_path}")
         else:
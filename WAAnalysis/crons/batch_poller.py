@@ -0,0 +1,194 @@
+import os
+import time
+import asyncio
+import logging
+import argparse
+from openai import AsyncOpenAI
+from WAAnalysis.config import (
+    OPENAI_API_KEY,
+    OPENAI_BASE_URL,
+    BATCH_OUTPUT_DIR,
+    BATCH_TRACKING_FILE,
+    POLL_MIN_INTERVAL,
+    POLL_MAX_INTERVAL,
+    POLL_CONCURRENCY,
+)
+from WAAnalysis.utils import ensure_directories_exist, load_json_file, save_to_json
+from WAAnalysis.batch_sharder import stitch_completed_shards, TERMINAL_STATUSES
+from WAAnalysis.batch_result_processor import process_results_file
+from WAAnalysis.response_cache import ingest_batch_output
+
+# -------------------------------
+# Setup Logging
+# -------------------------------
+log = logging.getLogger(__name__)
+
+# -------------------------------
+# Batch Statuses
+# -------------------------------
+# Short-lived statuses, checked again at the shortest interval
+SHORT_STATUSES = {"validating", "finalizing", "cancelling"}
+
+# -------------------------------
+# Adaptive Backoff
+# -------------------------------
+
+def next_interval(status, done, total, previous_done, elapsed, interval):
+    """
+    Returns the seconds to wait before checking a batch again.
+
+    A batch that made progress since its last check is checked again at a
+    quarter of its estimated remaining time, from the rate at which its
+    request_counts advanced. A batch with no progress backs off exponentially.
+    """
+    if status in SHORT_STATUSES:
+        return POLL_MIN_INTERVAL
+    if previous_done is None or not total or done <= previous_done or elapsed <= 0:
+        return min(max(interval * 2, POLL_MIN_INTERVAL), POLL_MAX_INTERVAL)
+
+    rate = (done - previous_done) / elapsed
+    remaining = (total - done) / rate
+    return min(max(remaining / 4, POLL_MIN_INTERVAL), POLL_MAX_INTERVAL)
+
+# -------------------------------
+# Tracking File
+# -------------------------------
+
+def open_jobs():
+    """Returns the tracked batches that are neither completed nor in a terminal status."""
+    data = load_json_file(BATCH_TRACKING_FILE) or {"jobs": []}
+    return [job for job in data["jobs"]
+            if job.get("batch_id") and not job["completed"] and job.get("status") not in TERMINAL_STATUSES]
+
+def update_job(batch_id, **fields):
+    """Updates one tracked batch by its ID."""
+    data = load_json_file(BATCH_TRACKING_FILE)
+    for job in data["jobs"]:
+        if job["batch_id"] == batch_id:
+            job.update(fields)
+            break
+    save_to_json(data, BATCH_TRACKING_FILE)
+
+# -------------------------------
+# Polling
+# -------------------------------
+
+async def download_output(client, file_id, output_path, semaphore):
+    """Streams an output file to disk in chunks, through a temporary file and an atomic rename."""
+    tmp_path = output_path.with_name(f".{output_path.name}.{os.getpid()}.tmp")
+    async with semaphore:
+        async with client.files.with_streaming_response.content(file_id) as response:
+            with open(tmp_path, "wb") as output:
+                async for chunk in response.iter_bytes():
+                    output.write(chunk)
+    os.replace(tmp_path, output_path)
+    return output_path
+
+async def check_batch(client, job, schedule, semaphore, tracking_lock):
+    """
+    Checks one batch and schedules its next check. A finished batch has its
+    output streamed to disk, its responses cached, and is marked completed in
+    the tracking file; outputs that could not be cached are left for the
+    response cache's backfill. Returns True once the batch needs no more checks.
+    """
+    batch_id = job["batch_id"]
+    async with semaphore:
+        batch = await client.batches.retrieve(batch_id)
+
+    counts = batch.request_counts
+    done = counts.completed + counts.failed if counts else 0
+    total = counts.total if counts else 0
+
+    if batch.status != "completed" and batch.status not in TERMINAL_STATUSES:
+        now = time.monotonic()
+        state = schedule.get(batch_id, {})
+        interval = next_interval(batch.status, done, total, state.get("done"),
+                                 now - state.get("time", now), state.get("interval", POLL_MIN_INTERVAL))
+        schedule[batch_id] = {"due": now + interval, "interval": interval, "done": done, "time": now}
+        log.info(f"Batch {batch_id} ({job['job_type']}) is {batch.status}: {done}/{total} requests; "
+                 f"checking again in {interval:.0f}s.")
+        return False
+
+    output_file = None
+    cached = 0
+    if batch.output_file_id:
+        output_file = await download_output(client, batch.output_file_id,
+                                            BATCH_OUTPUT_DIR / f"{batch_id}_output.jsonl", semaphore)
+        log.info(f"Batch {batch_id} ({job['job_type']}) {batch.status}: {done}/{total} requests saved to {output_file}")
+        try:
+            cached = await asyncio.to_thread(ingest_batch_output, batch_id, output_file)
+        except Exception as e:
+            log.warning(f"Could not cache the responses of batch {batch_id}: {e}")
+    else:
+        log.warning(f"Batch {batch_id} ({job['job_type']}) {batch.status} without an output file.")
+
+    async with tracking_lock:
+        update_job(
+            batch_id,
+            status=batch.status,
+            completed=batch.status == "completed",
+            output_file=str(output_file) if output_file else None,
+            response_cached=cached > 0,
+            created_at=batch.created_at,
+            in_progress_at=batch.in_progress_at,
+            completed_at=batch.completed_at,
+        )
+    schedule.pop(batch_id, None)
+    return True
+
+async def process_finished(tracking_lock):
+    """Stitches the outputs of completed submissions and processes each results file off the event loop."""
+    async with tracking_lock:
+        results_files = stitch_completed_shards()
+    for results_file in results_files:
+        await asyncio.to_thread(process_results_file, results_file)
+
+async def poll(once=False):
+    """
+    Polls every open batch concurrently until none are left (or once, with once
+    set). Batches added to the tracking file while running are picked up at the
+    next check, and finished outputs are processed as soon as they are stitched.
+    """
+    ensure_directories_exist([BATCH_OUTPUT_DIR])
+    client = AsyncOpenAI(api_key=OPENAI_API_KEY, base_url=OPENAI_BASE_URL)
+    semaphore = asyncio.Semaphore(POLL_CONCURRENCY)
+    tracking_lock = asyncio.Lock()
+    schedule = {}
+
+    while True:
+        jobs = open_jobs()
+        if not jobs:
+            log.info("No open batches to poll.")
+            break
+
+        now = time.monotonic()
+        due = [job for job in jobs if schedule.get(job["batch_id"], {}).get("due", 0) <= now]
+        outcomes = await asyncio.gather(*(check_batch(client, job, schedule, semaphore, tracking_lock) for job in due),
+                                        return_exceptions=True)
+        for job, outcome in zip(due, outcomes):
+            if isinstance(outcome, Exception):
+                log.error(f"Error checking batch {job['batch_id']} ({job['job_type']}): {outcome}")
+                schedule[job["batch_id"]] = {"due": time.monotonic() + POLL_MAX_INTERVAL / 4}
+
+        if any(outcome is True for outcome in outcomes):
+            await process_finished(tracking_lock)
+        if once:
+            break
+
+        # Sleep until the next batch is due, waking at least every POLL_MIN_INTERVAL for new batches
+        next_due = min((state["due"] for state in schedule.values()), default=time.monotonic())
+        await asyncio.sleep(min(max(next_due - time.monotonic(), 1), POLL_MIN_INTERVAL))
+
+    await client.close()
+
+# -------------------------------
+# Script Entry Point
+# -------------------------------
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Poll open batches and process their results as they complete.")
+    parser.add_argument("--once", action="store_true", help="Check every open batch once and exit.")
+    args = parser.parse_args()
+
+    log.info("Starting the batch poller.")
+    asyncio.run(poll(args.once))
+    log.info("Batch poller stopped.")
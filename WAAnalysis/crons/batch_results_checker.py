@@ -1,6 +1,9 @@
 import logging
-from WAAnalysis.batch_utils import check_batch_status, download_batch_results, update_markdown_from_results
+from WAAnalysis.batch_utils import check_batch_status, download_batch_results, get_batch_timestamps
 from WAAnalysis.utils import load_json_file, save_to_json
+from WAAnalysis.batch_sharder import stitch_completed_shards, TERMINAL_STATUSES
+from WAAnalysis.batch_result_processor import process_results_file
+from WAAnalysis.response_cache import ingest_batch_output
 from WAAnalysis.config import BATCH_OUTPUT_DIR, BATCH_TRACKING_FILE, ERROR_LOGS_DIRECTORY
 
 
@@ -25,14 +28,22 @@ logging.getLogger().addHandler(console_handler)
 # -------------------------------
 # Update Job Completion
 # -------------------------------
-def update_job_completion(job_type, output_file):
-    """Marks the job as completed and updates the output file path in the tracking file."""
+def update_job_completion(batch_id, status, output_file, timestamps=None, response_cached=False):
+    """
+    Records a finished batch's status and output file path in the tracking file,
+    along with the batch's creation and completion times used by the usage report.
+    Only a completed batch is marked completed; a failed, expired or cancelled one
+    keeps its terminal status, so its submission is still stitched.
+    """
     data = load_json_file(BATCH_TRACKING_FILE)
     
     for job in data["jobs"]:
-        if job["job_type"] == job_type:
-            job["completed"] = True
-            job["output_file"] = str(output_file)
+        if job["batch_id"] == batch_id:
+            job["status"] = status
+            job["completed"] = status == "completed"
+            job["output_file"] = str(output_file) if output_file else None
+            job["response_cached"] = response_cached
+            job.update(timestamps or {})
             break
     
     save_to_json(data, BATCH_TRACKING_FILE)
@@ -42,33 +53,43 @@ def update_job_completion(job_type, output_file):
 # Check and Download Batch Results
 # -------------------------------
 def check_and_download_results():
-    """Checks the status of each job type in the tracking file and downloads results if the batch is completed."""
+    """
+    Checks the status of each open batch in the tracking file and downloads its
+    results, or any partial output, once it has finished.
+    """
     data = load_json_file(BATCH_TRACKING_FILE)
 
     for job in data["jobs"]:
-        if not job["completed"] and job["batch_id"]:
+        if not job["completed"] and job["batch_id"] and job.get("status") not in TERMINAL_STATUSES:
             # Check the batch status
             try:
                 status = check_batch_status(job["batch_id"])
                 logging.info(f"Checked status for batch {job['batch_id']}: {status}")
 
-                if status == "completed":
+                if status == "completed" or status in TERMINAL_STATUSES:
                     # Download the results and save them in BATCH_OUTPUT_DIR
                     output_file = download_batch_results(job["batch_id"])
+                    cached = 0
+                    if output_file:
+                        # Cache the responses so identical requests are not submitted again
+                        cached = ingest_batch_output(job["batch_id"], output_file)
                     
-                    # Update the markdown file with the results
-                    update_markdown_from_results(job)  # Update markdown with the results
-                    
-                    # Update the tracking file with the completed status and result path
-                    update_job_completion(job["job_type"], output_file)
-                    logging.info(f"Batch {job['batch_id']} for {job['job_type']} completed and results saved to {output_file}")
+                    # Update the tracking file with the batch's status and result path
+                    update_job_completion(job["batch_id"], status, output_file, get_batch_timestamps(job["batch_id"]),
+                                          cached > 0)
+                    logging.info(f"Batch {job['batch_id']} for {job['job_type']} {status} and results saved to {output_file}")
                 else:
                     logging.info(f"Batch {job['batch_id']} for {job['job_type']} is still {status}.")
             
             except Exception as e:
                 logging.error(f"Error checking or downloading results for batch {job['batch_id']} ({job['job_type']}): {str(e)}")
         else:
-            logging.info(f"Job for {job['job_type']} is already completed or has no batch_id.")
+            logging.info(f"Job for {job['job_type']} is already finished or has no batch_id.")
+
+    # Shard outputs are joined into one results file per submission once all
+    # shards are done, and the markdown files are updated from it
+    for results_file in stitch_completed_shards():
+        process_results_file(results_file)
 
 
 # -------------------------------
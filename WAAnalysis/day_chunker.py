@@ -0,0 +1,161 @@
+import re
+import logging
+import argparse
+from pathlib import Path
+from WAAnalysis.config import MD_DIR, DAY_CHUNK_DIR, DAY_CHUNK_TOKEN_LIMIT, DAY_CHUNK_OVERLAP_TOKENS
+from WAAnalysis.utils import atomic_write, frontmatter_block
+from WAAnalysis.token_cache import count_tokens_many
+
+# -------------------------------
+# Setup Logging
+# -------------------------------
+log = logging.getLogger(__name__)
+
+# -------------------------------
+# Day File Structure
+# -------------------------------
+# Each message in a day file starts with a "**Name**: " line. Reply quote blocks
+# ("> **Name**: ..."), timestamps and attachments follow on their own lines, so
+# everything up to the next message start belongs to the same message.
+MESSAGE_START_PATTERN = re.compile(r'^\*\*[^*\n]+\*\*: ', re.MULTILINE)
+
+# Continuation parts are named "<day>_part_<n>.md"
+PART_SUFFIX_PATTERN = re.compile(r'_part_\d+(?=\.md$)')
+
+def split_day_file(text):
+    """
+    Splits a day file into its frontmatter block, the text before the first
+    message (the title) and the list of message blocks.
+    """
+    header = frontmatter_block(text)
+    body = text[len(header):]
+    starts = [match.start() for match in MESSAGE_START_PATTERN.finditer(body)]
+    if not starts:
+        return header, body, []
+    messages = [body[start:end] for start, end in zip(starts, starts[1:] + [len(body)])]
+    return header, body[:starts[0]], messages
+
+def source_file_name(custom_id):
+    """Maps a batch custom_id, which may name a continuation part, back to its day file."""
+    return PART_SUFFIX_PATTERN.sub("", custom_id)
+
+# -------------------------------
+# Packing
+# -------------------------------
+
+def pack_messages(message_tokens, budget, overlap=0):
+    """
+    Packs whole messages into parts of at most budget tokens.
+
+    Returns a list of (start, end) message index ranges. Each part after the
+    first begins with the trailing messages of the previous part that fit in
+    overlap tokens, as long as the next new message still fits alongside them.
+    A message larger than the budget gets a part to itself.
+    """
+    ranges = []
+    start = 0
+    while start < len(message_tokens):
+        end = start + 1
+        used = message_tokens[start]
+        while end < len(message_tokens) and used + message_tokens[end] <= budget:
+            used += message_tokens[end]
+            end += 1
+        ranges.append((start, end))
+        if end == len(message_tokens):
+            break
+
+        # Step back over trailing messages to repeat them as context
+        next_start = end
+        carried = 0
+        while next_start - 1 > start and carried + message_tokens[next_start - 1] <= overlap:
+            next_start -= 1
+            carried += message_tokens[next_start]
+        if carried + message_tokens[end] > budget:
+            next_start = end
+        start = next_start
+    return ranges
+
+def split_oversized_messages(messages, message_tokens, budget):
+    """Splits any single message larger than the budget at line and word breaks."""
+    if max(message_tokens, default=0) <= budget:
+        return messages, message_tokens
+
+    # Imported here as only unusually long messages need it
+    from WAAnalysis.chunk_large_files import split_text_by_tokens
+    pieces = []
+    for message, tokens in zip(messages, message_tokens):
+        pieces.extend(split_text_by_tokens(message, budget) if tokens > budget else [message])
+    return pieces, count_tokens_many(pieces)
+
+# -------------------------------
+# Chunking
+# -------------------------------
+
+def chunk_day_text(text, budget=DAY_CHUNK_TOKEN_LIMIT, overlap=DAY_CHUNK_OVERLAP_TOKENS):
+    """
+    Splits a day file's text into continuation parts whose messages fit the budget.
+    Every part keeps the frontmatter and a numbered title. Returns [text] if the
+    day already fits.
+    """
+    header, preamble, messages = split_day_file(text)
+    message_tokens = count_tokens_many(messages)
+    if sum(message_tokens) <= budget:
+        return [text]
+
+    messages, message_tokens = split_oversized_messages(messages, message_tokens, budget)
+    ranges = pack_messages(message_tokens, budget, overlap)
+    title = preamble.strip()
+
+    parts = []
+    for part_number, (start, end) in enumerate(ranges, start=1):
+        part_title = f"{title} (Part {part_number} of {len(ranges)})" if title else f"# Part {part_number} of {len(ranges)}"
+        parts.append(f"{header}\n{part_title}\n\n" + "".join(messages[start:end]))
+    return parts
+
+def chunk_day_file(file_path, output_dir=DAY_CHUNK_DIR, budget=DAY_CHUNK_TOKEN_LIMIT,
+                   overlap=DAY_CHUNK_OVERLAP_TOKENS):
+    """
+    Writes the continuation parts of a day file that exceeds the budget, removing
+    stale parts from earlier runs. Returns (name, text) for each document to send:
+    the day file itself if it fits, otherwise its parts.
+    """
+    file_path = Path(file_path)
+    text = file_path.read_text(encoding="utf-8")
+    parts = chunk_day_text(text, budget, overlap)
+
+    part_names = [f"{file_path.stem}_part_{part_number}.md" for part_number in range(1, len(parts) + 1)]
+    for stale_part in Path(output_dir).glob(f"{file_path.stem}_part_*.md"):
+        if len(parts) == 1 or stale_part.name not in part_names:
+            stale_part.unlink()
+
+    if len(parts) == 1:
+        return [(file_path.name, text)]
+
+    Path(output_dir).mkdir(parents=True, exist_ok=True)
+    for part_name, part in zip(part_names, parts):
+        atomic_write(Path(output_dir) / part_name, part)
+    log.info(f"Split {file_path.name} into {len(parts)} parts.")
+    return list(zip(part_names, parts))
+
+def batch_documents(md_files, output_dir=DAY_CHUNK_DIR, budget=DAY_CHUNK_TOKEN_LIMIT,
+                    overlap=DAY_CHUNK_OVERLAP_TOKENS):
+    """Returns (custom_id, text) for every document to send, with heavy days replaced by their parts."""
+    documents = []
+    for file_path in md_files:
+        documents.extend(chunk_day_file(file_path, output_dir, budget, overlap))
+    return documents
+
+# -------------------------------
+# Main Execution
+# -------------------------------
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Split heavy WhatsApp day files into parts within a token budget.")
+    parser.add_argument("--directory", type=Path, default=MD_DIR)
+    parser.add_argument("--output", type=Path, default=DAY_CHUNK_DIR)
+    parser.add_argument("--budget", type=int, default=DAY_CHUNK_TOKEN_LIMIT)
+    parser.add_argument("--overlap", type=int, default=DAY_CHUNK_OVERLAP_TOKENS)
+    args = parser.parse_args()
+
+    documents = batch_documents(sorted(args.directory.glob("*.md")), args.output, args.budget, args.overlap)
+    log.info(f"{len(documents)} documents to send.")
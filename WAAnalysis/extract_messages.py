@@ -1,5 +1,4 @@
 import sqlite3
-import json
 import pandas as pd
 import logging
 from WAAnalysis.config import PARTICIPANT_JID, DATABASE_PATH, BLOB_INFO_DIRECTORY, ERROR_LOGS_DIRECTORY, WHATSAPP_MESSAGES_FILE
@@ -1,8 +1,9 @@
 import logging
 import yaml
 from pathlib import Path
-from WAAnalysis.utils import load_markdown
+from WAAnalysis.utils import read_frontmatter
 from WAAnalysis.config import MD_DIR, DATA_DIR
+from WAAnalysis.parallel import run_parallel
 
 # -------------------------------
 # Setup Logging
@@ -12,19 +13,22 @@ log = logging.getLogger(__name__)
 # -------------------------------
 # Function to Collect Unique Tags
 # -------------------------------
-def collect_unique_tags():
+def read_tags(file):
+    """Read the tags from a markdown file's frontmatter."""
+    tags = read_frontmatter(file).get('tags') or []
+    if tags:
+        log.debug(f"Found tags in {file}: {tags}")
+    return tags
+
+def collect_unique_tags(workers=None):
     """Collect all unique tags from markdown files and return a sorted list."""
     unique_tags = set()  # Use a set to avoid duplicates
 
     md_files = [f for f in MD_DIR.iterdir() if f.suffix == '.md']
 
-    for file in md_files:
-        log.info(f"Processing file: {file}")
-        frontmatter, _ = load_markdown(file)
-
-        tags = frontmatter.get('tags', [])
+    results, errors = run_parallel(read_tags, md_files, workers)
+    for tags in results:
         if tags:
-            log.debug(f"Found tags in {file}: {tags}")
             unique_tags.update(tags)
 
     log.info(f"Collected {len(unique_tags)} unique tags.")
@@ -1,13 +1,13 @@
-import json
 import os
 from pathlib import Path
 from WAAnalysis.config import WHATSAPP_MESSAGES_FILE, OUTPUT_DIR
 from WAAnalysis.utils import generate_markdown_for_day
+from WAAnalysis.json_codec import loads
 
 # Load conversation data from the JSON file
 def load_conversation_data(file_path):
     with open(file_path, 'r') as f:
-        return json.load(f)
+        return loads(f.read())
 
 # Save markdown to a file
 def save_markdown(file_name, markdown_content):
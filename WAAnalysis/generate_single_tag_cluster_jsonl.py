@@ -1,7 +1,20 @@
+import math
 import yaml
-import json
 from pathlib import Path
-from WAAnalysis.config import DATA_DIR
+from WAAnalysis.config import DATA_DIR, MAX_TOKENS_FLOOR, MAX_TOKENS_HEADROOM, TOKEN_CACHE_FILE
+from WAAnalysis.json_codec import dumps, write_jsonl
+from WAAnalysis.token_cache import count_tokens
+from WAAnalysis.cost_forecast import encoding_for_model
+
+# -------------------------------
+# Output Sizing
+# -------------------------------
+# The response lists every tag once, in clusters of roughly this many tags,
+# each with a name of about this many tokens including its JSON structure
+TAGS_PER_CLUSTER = 10
+CLUSTER_NAME_TOKENS = 20
+# The model's output token limit, which the request never exceeds
+TAG_CLUSTER_MAX_TOKENS = 16384
 
 # -------------------------------
 # Load Tags from YAML
@@ -12,6 +25,16 @@ def load_tags(yaml_file):
         data = yaml.safe_load(f)
     return data.get('tags', [])
 
+def tag_cluster_max_tokens(tags, model="gpt-4o-mini", cache_file=TOKEN_CACHE_FILE):
+    """
+    Sizes the clustering response from its input: the tokens of every tag as a
+    JSON list, plus a name per cluster, with the usual headroom.
+    """
+    tag_tokens = count_tokens(dumps(tags), encoding_for_model(model), cache_file)
+    cluster_tokens = CLUSTER_NAME_TOKENS * math.ceil(len(tags) / TAGS_PER_CLUSTER)
+    estimate = math.ceil((tag_tokens + cluster_tokens) * MAX_TOKENS_HEADROOM)
+    return min(max(estimate, MAX_TOKENS_FLOOR), TAG_CLUSTER_MAX_TOKENS)
+
 # -------------------------------
 # Create JSONL Entry for Tag Clustering
 # -------------------------------
@@ -67,8 +90,7 @@ Here is the list of tags:
 # -------------------------------
 def write_to_jsonl(output_file, entry):
     """Write the single entry to a JSONL file."""
-    with open(output_file, 'w') as f:
-        f.write(json.dumps(entry) + "\n")
+    write_jsonl(output_file, [entry])
 
 # -------------------------------
 # Main Process
@@ -83,7 +105,7 @@ def process_tags_to_single_jsonl():
     
     # Create a single JSONL entry
     custom_id = "tag-cluster-full"
-    jsonl_entry = create_jsonl_entry(custom_id, tags, max_tokens=16384)  # Adjust max_tokens if needed
+    jsonl_entry = create_jsonl_entry(custom_id, tags, max_tokens=tag_cluster_max_tokens(tags))
 
     # Write the entry to a JSONL file
     write_to_jsonl(output_file, jsonl_entry)
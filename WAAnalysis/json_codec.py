@@ -0,0 +1,100 @@
+"""
+Shared JSON and JSONL codec.
+
+Uses orjson when it is installed and falls back to the standard library otherwise.
+Output is UTF-8 and compact by default; pretty (indented) output is available for
+human-facing files such as the tracking file.
+"""
+import json
+import logging
+from datetime import date, datetime
+from pathlib import Path
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - depends on the environment
+    orjson = None
+
+# -------------------------------
+# Setup Logging
+# -------------------------------
+log = logging.getLogger(__name__)
+
+# orjson.JSONDecodeError subclasses this, so callers can catch either backend's errors
+JSONDecodeError = json.JSONDecodeError
+
+if orjson is not None:
+    ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+
+# -------------------------------
+# Encoding and Decoding
+# -------------------------------
+
+def default(obj):
+    """Serializes types neither backend handles natively, such as pandas objects."""
+    if hasattr(obj, "to_dict"):
+        return obj.to_dict()
+    if isinstance(obj, (datetime, date)):
+        return obj.isoformat()
+    if isinstance(obj, (set, frozenset)):
+        return list(obj)
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+def dumps_bytes(data, pretty=False, sort_keys=False):
+    """Serializes data to UTF-8 JSON bytes, indented if pretty is set and with sorted keys if sort_keys is set."""
+    if orjson is not None:
+        options = ORJSON_OPTIONS | (orjson.OPT_INDENT_2 if pretty else 0) | (orjson.OPT_SORT_KEYS if sort_keys else 0)
+        return orjson.dumps(data, default=default, option=options)
+    return dumps(data, pretty, sort_keys).encode("utf-8")
+
+def dumps(data, pretty=False, sort_keys=False):
+    """Serializes data to a JSON string, indented if pretty is set and with sorted keys if sort_keys is set."""
+    if orjson is not None:
+        return dumps_bytes(data, pretty, sort_keys).decode("utf-8")
+    if pretty:
+        return json.dumps(data, indent=2, ensure_ascii=False, sort_keys=sort_keys, default=default)
+    return json.dumps(data, separators=(",", ":"), ensure_ascii=False, sort_keys=sort_keys, default=default)
+
+def loads(data):
+    """Parses JSON from a str or bytes."""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+# -------------------------------
+# JSON Files
+# -------------------------------
+
+def read_json(file_path):
+    """Reads and parses a JSON file."""
+    return loads(Path(file_path).read_bytes())
+
+def write_json(file_path, data, compact=False):
+    """Writes data to a JSON file, indented unless compact is set (for machine-only artifacts)."""
+    with open(file_path, "wb") as f:
+        f.write(dumps_bytes(data, pretty=not compact))
+
+# -------------------------------
+# JSONL Files
+# -------------------------------
+
+def iter_jsonl(file_path):
+    """Streams the records of a JSONL file one line at a time, skipping blank lines."""
+    with open(file_path, "rb") as f:
+        for line in f:
+            if line.strip():
+                yield loads(line)
+
+def read_jsonl(file_path):
+    """Reads every record of a JSONL file into a list."""
+    return list(iter_jsonl(file_path))
+
+def write_jsonl(file_path, records, append=False):
+    """Writes records to a JSONL file, one compact object per line. Returns the number written."""
+    count = 0
+    with open(file_path, "ab" if append else "wb") as f:
+        for record in records:
+            f.write(dumps_bytes(record))
+            f.write(b"\n")
+            count += 1
+    return count
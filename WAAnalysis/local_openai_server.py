@@ -0,0 +1,355 @@
+import re
+import time
+import uuid
+import random
+import hashlib
+import logging
+import argparse
+import threading
+from collections import Counter
+from email import message_from_bytes
+from email.policy import HTTP
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from WAAnalysis.config import LOCAL_API_HOST, LOCAL_API_PORT, LOCAL_API_LATENCY, LOCAL_API_ERROR_RATE
+from WAAnalysis.json_codec import dumps, dumps_bytes, loads, JSONDecodeError
+
+# -------------------------------
+# Setup Logging
+# -------------------------------
+log = logging.getLogger(__name__)
+
+# -------------------------------
+# Synthetic Responses
+# -------------------------------
+# Job types recognised from their system prompts, checked in order; the combined
+# analysis prompt also mentions entities, so it is matched first
+JOB_MARKERS = [
+    ("analysis", "in a single json object"),
+    ("topics", "extracting topics"),
+    ("entities", "extracting named entities"),
+    ("sentiment", "analyzing sentiment"),
+    ("key_points", "summarizing conversations"),
+]
+
+DOCUMENT_PATTERN = re.compile(r"=== DOCUMENT (.+?) ===\n(.*?)\n=== END DOCUMENT \1 ===", re.DOTALL)
+SPEAKER_PATTERN = re.compile(r"^\W*([A-Z][\w]+):", re.MULTILINE)
+WORD_PATTERN = re.compile(r"[a-z]{5,}")
+SENTIMENTS = ["Positive", "Neutral", "Negative"]
+
+def message_text(message):
+    """Returns a message's content as text; batch requests store prompts JSON-encoded."""
+    content = message.get("content") or ""
+    if isinstance(content, list):
+        return " ".join(part.get("text", "") for part in content if isinstance(part, dict))
+    try:
+        decoded = loads(content)
+        return decoded if isinstance(decoded, str) else content
+    except JSONDecodeError:
+        return content
+
+def job_type_for(system_prompt):
+    """Names the job type of a request from its system prompt, or None for free-text prompts."""
+    lowered = system_prompt.lower()
+    for job_type, marker in JOB_MARKERS:
+        if marker in lowered:
+            return job_type
+    return None
+
+def synthetic_result(job_type, text):
+    """Returns a deterministic output for one conversation that conforms to the job type's schema."""
+    seed = int.from_bytes(hashlib.blake2b(text.encode("utf-8"), digest_size=8).digest(), "big")
+    rng = random.Random(seed)
+    words = [word for word, _ in Counter(WORD_PATTERN.findall(text.lower())).most_common(5)] or ["conversation"]
+    speakers = list(dict.fromkeys(SPEAKER_PATTERN.findall(text)))[:3] or ["Unknown"]
+    lines = [line.strip() for line in text.splitlines() if line.strip()][:3] or [text[:80]]
+
+    if job_type == "topics":
+        return {"topics": words[:3]}
+    if job_type == "entities":
+        return {"entities": [{"person": speaker, "role": "participant",
+                              "relationships": [f"talks about {rng.choice(words)}"]} for speaker in speakers]}
+    if job_type == "sentiment":
+        polarity = round(rng.uniform(-1, 1), 2)
+        return {"sentiment": SENTIMENTS[0 if polarity > 0.2 else 2 if polarity < -0.2 else 1],
+                "polarity": polarity, "subjectivity": round(rng.uniform(0, 1), 2)}
+    if job_type == "key_points":
+        return {"key_points": [line[:120] for line in lines]}
+    if job_type == "analysis":
+        result = {}
+        for field_type in ("topics", "entities", "sentiment", "key_points"):
+            field = synthetic_result(field_type, text)
+            result[field_type] = field if field_type == "sentiment" else field[field_type]
+        return result
+    return None
+
+def completion_content(body):
+    """Returns the synthetic assistant message for a chat completion request body."""
+    messages = body.get("messages") or []
+    system_prompt = message_text(messages[0]) if messages and messages[0].get("role") == "system" else ""
+    user_text = message_text(messages[-1]) if messages else ""
+    job_type = job_type_for(system_prompt)
+
+    if job_type is None:
+        # Free-text prompts such as summaries get a short bullet list of the conversation's first lines
+        lines = [line.strip() for line in user_text.splitlines() if line.strip()][:3]
+        return "\n".join(f"- {line[:120]}" for line in lines) or "- No content."
+
+    documents = DOCUMENT_PATTERN.findall(user_text)
+    if documents:
+        # Packed requests are answered per document, keyed by document ID
+        return dumps({document_id: synthetic_result(job_type, text) for document_id, text in documents})
+    return dumps(synthetic_result(job_type, user_text))
+
+def estimate_tokens(text):
+    """Estimates a token count at four characters per token; the stand-in does not need exact counts."""
+    return max(1, len(text) // 4)
+
+def chat_completion(body):
+    """Builds a chat.completion object for a request body, truncated at its max_tokens."""
+    content = completion_content(body)
+    prompt_tokens = sum(estimate_tokens(message_text(message)) for message in body.get("messages") or [])
+    completion_tokens = estimate_tokens(content)
+    finish_reason = "stop"
+
+    max_tokens = body.get("max_tokens") or body.get("max_completion_tokens")
+    if max_tokens and completion_tokens > max_tokens:
+        content = content[:max_tokens * 4]
+        completion_tokens = max_tokens
+        finish_reason = "length"
+
+    return {
+        "id": f"chatcmpl-{uuid.uuid4().hex[:24]}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": body.get("model", "gpt-4o-mini"),
+        "choices": [{"index": 0, "message": {"role": "assistant", "content": content},
+                     "finish_reason": finish_reason}],
+        "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                  "total_tokens": prompt_tokens + completion_tokens},
+    }
+
+def is_failure(request, error_rate):
+    """Decides deterministically, from the request itself, whether the stand-in fails it."""
+    if error_rate <= 0:
+        return False
+    digest = hashlib.blake2b(dumps_bytes(request, sort_keys=True), digest_size=8).digest()
+    return int.from_bytes(digest, "big") / 2 ** 64 < error_rate
+
+# -------------------------------
+# Files and Batches
+# -------------------------------
+
+def new_id(prefix):
+    """Returns an ID in the style of the API's object IDs."""
+    return f"{prefix}-{uuid.uuid4().hex[:24]}"
+
+def store_file(server, content, filename, purpose):
+    """Stores file content on the server and returns its file object."""
+    file_object = {"id": new_id("file"), "object": "file", "bytes": len(content), "created_at": int(time.time()),
+                   "filename": filename, "purpose": purpose, "status": "processed"}
+    with server.lock:
+        server.files[file_object["id"]] = {"object": file_object, "content": content}
+    return file_object
+
+def new_batch(input_file_id, endpoint, completion_window, metadata):
+    """Returns a batch object in the validating status."""
+    return {
+        "id": new_id("batch"), "object": "batch", "endpoint": endpoint, "errors": None,
+        "input_file_id": input_file_id, "completion_window": completion_window, "status": "validating",
+        "output_file_id": None, "error_file_id": None, "created_at": int(time.time()),
+        "in_progress_at": None, "expires_at": int(time.time()) + 24 * 3600, "finalizing_at": None,
+        "completed_at": None, "failed_at": None, "expired_at": None, "cancelling_at": None, "cancelled_at": None,
+        "request_counts": {"total": 0, "completed": 0, "failed": 0}, "metadata": metadata,
+    }
+
+def result_line(custom_id, status_code, body, error=None):
+    """Returns one line of a batch output or error file."""
+    return {"id": new_id("batch_req"), "custom_id": custom_id, "error": error,
+            "response": {"status_code": status_code, "request_id": uuid.uuid4().hex, "body": body}}
+
+def run_batch(server, batch_id):
+    """
+    Works through a batch's requests in the background, one request every
+    server.latency seconds, updating its request_counts as it goes so pollers
+    see realistic progress. Writes an output file and, if any requests failed,
+    an error file.
+    """
+    with server.lock:
+        batch = server.batches[batch_id]
+        content = server.files[batch["input_file_id"]]["content"]
+
+    try:
+        requests = [loads(line) for line in content.splitlines() if line.strip()]
+    except JSONDecodeError as e:
+        with server.lock:
+            batch.update(status="failed", failed_at=int(time.time()),
+                         errors={"object": "list", "data": [{"code": "invalid_json", "message": str(e)}]})
+        return
+
+    with server.lock:
+        batch.update(status="in_progress", in_progress_at=int(time.time()))
+        batch["request_counts"]["total"] = len(requests)
+
+    outputs = []
+    errors = []
+    for request in requests:
+        time.sleep(server.latency)
+        if batch["status"] == "cancelling":
+            break
+        if is_failure(request, server.error_rate):
+            errors.append(result_line(request.get("custom_id"), 500,
+                                      {"error": {"message": "Synthetic server error.", "type": "server_error"}}))
+            counter = "failed"
+        else:
+            outputs.append(result_line(request.get("custom_id"), 200, chat_completion(request.get("body") or {})))
+            counter = "completed"
+        with server.lock:
+            batch["request_counts"][counter] += 1
+
+    with server.lock:
+        batch.update(status="finalizing" if batch["status"] != "cancelling" else "cancelling",
+                     finalizing_at=int(time.time()))
+    output_file = store_file(server, b"".join(dumps_bytes(line) + b"\n" for line in outputs),
+                             f"{batch_id}_output.jsonl", "batch_output")
+    error_file = store_file(server, b"".join(dumps_bytes(line) + b"\n" for line in errors),
+                            f"{batch_id}_errors.jsonl", "batch_output") if errors else None
+
+    with server.lock:
+        batch["output_file_id"] = output_file["id"] if outputs else None
+        batch["error_file_id"] = error_file["id"] if error_file else None
+        if batch["status"] == "cancelling":
+            batch.update(status="cancelled", cancelled_at=int(time.time()))
+        else:
+            batch.update(status="completed", completed_at=int(time.time()))
+    log.info(f"Batch {batch_id} {batch['status']}: {batch['request_counts']}")
+
+# -------------------------------
+# HTTP Handling
+# -------------------------------
+
+class LocalOpenAIHandler(BaseHTTPRequestHandler):
+    """Serves the Files, Batches and Chat Completions endpoints used by batch_utils and the batch poller."""
+
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        log.debug(f"{self.address_string()} {format % args}")
+
+    def send_json(self, status, data):
+        payload = dumps_bytes(data)
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def send_error_json(self, status, message):
+        self.send_json(status, {"error": {"message": message, "type": "invalid_request_error"}})
+
+    def read_body(self):
+        return self.rfile.read(int(self.headers.get("Content-Length", 0)))
+
+    def do_GET(self):
+        server = self.server
+        if match := re.fullmatch(r"/v1/files/([\w-]+)/content", self.path):
+            stored = server.files.get(match.group(1))
+            if stored is None:
+                return self.send_error_json(404, f"No such file: {match.group(1)}")
+            self.send_response(200)
+            self.send_header("Content-Type", "application/octet-stream")
+            self.send_header("Content-Length", str(len(stored["content"])))
+            self.end_headers()
+            self.wfile.write(stored["content"])
+        elif match := re.fullmatch(r"/v1/files/([\w-]+)", self.path):
+            stored = server.files.get(match.group(1))
+            if stored is None:
+                return self.send_error_json(404, f"No such file: {match.group(1)}")
+            self.send_json(200, stored["object"])
+        elif match := re.fullmatch(r"/v1/batches/([\w-]+)", self.path):
+            with server.lock:
+                batch = server.batches.get(match.group(1))
+                batch = loads(dumps(batch)) if batch else None
+            if batch is None:
+                return self.send_error_json(404, f"No such batch: {match.group(1)}")
+            self.send_json(200, batch)
+        else:
+            self.send_error_json(404, f"Unknown endpoint: GET {self.path}")
+
+    def do_POST(self):
+        server = self.server
+        body = self.read_body()
+        if self.path == "/v1/files":
+            # Files are uploaded as multipart/form-data with "purpose" and "file" fields
+            form = message_from_bytes(b"Content-Type: " + self.headers["Content-Type"].encode() + b"\r\n\r\n" + body,
+                                      policy=HTTP)
+            fields = {part.get_param("name", header="content-disposition"): part for part in form.iter_parts()}
+            if "file" not in fields:
+                return self.send_error_json(400, "Missing file.")
+            purpose = fields["purpose"].get_content() if "purpose" in fields else "batch"
+            content = fields["file"].get_payload(decode=True)
+            self.send_json(200, store_file(server, content, fields["file"].get_filename() or "upload.jsonl",
+                                           purpose.strip()))
+        elif self.path == "/v1/batches":
+            params = loads(body)
+            if params.get("input_file_id") not in server.files:
+                return self.send_error_json(400, f"No such file: {params.get('input_file_id')}")
+            batch = new_batch(params["input_file_id"], params.get("endpoint"), params.get("completion_window"),
+                              params.get("metadata"))
+            with server.lock:
+                server.batches[batch["id"]] = batch
+                snapshot = loads(dumps(batch))
+            threading.Thread(target=run_batch, args=(server, batch["id"]), daemon=True).start()
+            self.send_json(200, snapshot)
+        elif match := re.fullmatch(r"/v1/batches/([\w-]+)/cancel", self.path):
+            with server.lock:
+                batch = server.batches.get(match.group(1))
+                if batch and batch["status"] in ("validating", "in_progress"):
+                    batch.update(status="cancelling", cancelling_at=int(time.time()))
+                snapshot = loads(dumps(batch)) if batch else None
+            if snapshot is None:
+                return self.send_error_json(404, f"No such batch: {match.group(1)}")
+            self.send_json(200, snapshot)
+        elif self.path == "/v1/chat/completions":
+            request = loads(body)
+            time.sleep(server.latency)
+            if is_failure(request, server.error_rate):
+                return self.send_json(500, {"error": {"message": "Synthetic server error.", "type": "server_error"}})
+            self.send_json(200, chat_completion(request))
+        else:
+            self.send_error_json(404, f"Unknown endpoint: POST {self.path}")
+
+def make_server(host=LOCAL_API_HOST, port=LOCAL_API_PORT, latency=LOCAL_API_LATENCY, error_rate=LOCAL_API_ERROR_RATE):
+    """Returns a threaded server with empty file and batch stores. Port 0 picks a free port."""
+    server = ThreadingHTTPServer((host, port), LocalOpenAIHandler)
+    server.daemon_threads = True
+    server.files = {}
+    server.batches = {}
+    server.lock = threading.Lock()
+    server.latency = latency
+    server.error_rate = error_rate
+    return server
+
+# -------------------------------
+# Script Entry Point
+# -------------------------------
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Serve a local stand-in for the OpenAI Files, Batches and Chat Completions endpoints.")
+    parser.add_argument("--host", default=LOCAL_API_HOST)
+    parser.add_argument("--port", type=int, default=LOCAL_API_PORT)
+    parser.add_argument("--latency", type=float, default=LOCAL_API_LATENCY,
+                        help="Seconds spent on each request.")
+    parser.add_argument("--error-rate", type=float, default=LOCAL_API_ERROR_RATE,
+                        help="Share of requests that fail.")
+    args = parser.parse_args()
+
+    server = make_server(args.host, args.port, args.latency, args.error_rate)
+    log.info(f"Serving the local OpenAI stand-in at http://{args.host}:{server.server_port}/v1 "
+             f"(set OPENAI_BASE_URL to use it).")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        log.info("Local OpenAI stand-in stopped.")
+    finally:
+        server.server_close()
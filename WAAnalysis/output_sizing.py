@@ -0,0 +1,164 @@
+import logging
+import argparse
+from collections import defaultdict
+from pathlib import Path
+import numpy as np
+from WAAnalysis.config import (
+    BATCH_OUTPUT_DIR,
+    BATCH_TRACKING_FILE,
+    TOKEN_CACHE_FILE,
+    OUTPUT_PROFILES_FILE,
+    MAX_TOKENS_QUANTILE,
+    MAX_TOKENS_HEADROOM,
+    MAX_TOKENS_BINS,
+    MAX_TOKENS_FLOOR,
+)
+from WAAnalysis.json_codec import iter_jsonl, read_json, write_json
+from WAAnalysis.usage_report import load_batch_jobs, job_type_for_output, output_files
+from WAAnalysis.cost_forecast import count_input_tokens
+from WAAnalysis.request_packer import load_packs
+
+# -------------------------------
+# Setup Logging
+# -------------------------------
+log = logging.getLogger(__name__)
+
+# -------------------------------
+# Sizing Config
+# -------------------------------
+# Job types with fewer successful responses than this keep their fixed max_tokens
+MIN_PROFILE_SAMPLES = 50
+
+# Responses cut off at max_tokens only show a lower bound of their length, so a
+# band with more truncations than the quantile allows grows by this factor
+TRUNCATION_GROWTH = 1.5
+
+# -------------------------------
+# Observed Output Lengths
+# -------------------------------
+
+def collect_output_lengths(output_dir=BATCH_OUTPUT_DIR, tracking_file=BATCH_TRACKING_FILE, packs=None):
+    """
+    Streams every batch output file and returns, per job type, an array of
+    (prompt_tokens, completion_tokens, truncated) rows from successful responses.
+    Packed responses cover several documents, so they are left out of the
+    single-document profiles.
+    """
+    jobs = load_batch_jobs(tracking_file)
+    packs = load_packs() if packs is None else packs
+    rows = defaultdict(list)
+    for file_path in output_files(output_dir, tracking_file):
+        job_type = job_type_for_output(file_path, jobs)
+        for result in iter_jsonl(file_path):
+            response = result.get("response") or {}
+            if result.get("error") or response.get("status_code") != 200 or result.get("custom_id") in packs:
+                continue
+            body = response.get("body") or {}
+            usage = body.get("usage") or {}
+            truncated = any(choice.get("finish_reason") == "length" for choice in body.get("choices", []))
+            rows[job_type].append((usage.get("prompt_tokens", 0), usage.get("completion_tokens", 0), truncated))
+    return {job_type: np.array(values, dtype=np.int64).reshape(-1, 3) for job_type, values in rows.items()}
+
+# -------------------------------
+# Profile Fitting
+# -------------------------------
+
+def fit_profile(prompt_tokens, completion_tokens, truncated, bins=MAX_TOKENS_BINS,
+                quantile=MAX_TOKENS_QUANTILE, headroom=MAX_TOKENS_HEADROOM, floor=MAX_TOKENS_FLOOR):
+    """
+    Learns the max_tokens limits of one job type.
+
+    Requests are split into input-size bands at the prompt-token quantiles.
+    Each band's limit is the given quantile of its completion tokens plus
+    headroom, grown further if too many of its responses were truncated.
+    Limits never shrink as inputs grow. Returns the band edges (inclusive upper
+    bounds in prompt tokens) and one limit per band.
+    """
+    prompt_tokens = np.asarray(prompt_tokens)
+    completion_tokens = np.asarray(completion_tokens)
+    truncated = np.asarray(truncated, dtype=bool)
+
+    edges = np.unique(np.quantile(prompt_tokens, np.linspace(0, 1, bins + 1)[1:-1]).astype(np.int64))
+    bands = np.searchsorted(edges, prompt_tokens, side="left")
+
+    limits = []
+    for band in range(len(edges) + 1):
+        in_band = bands == band
+        if not in_band.any():
+            # Empty bands borrow the whole job type's distribution
+            in_band = np.ones(len(prompt_tokens), dtype=bool)
+        limit = np.quantile(completion_tokens[in_band], quantile) * headroom
+        if truncated[in_band].mean() > 1 - quantile:
+            limit *= TRUNCATION_GROWTH
+        limits.append(max(int(np.ceil(limit)), floor))
+
+    return {
+        "edges": edges.tolist(),
+        "limits": np.maximum.accumulate(limits).tolist(),
+        "samples": len(prompt_tokens),
+        "truncation_rate": round(float(truncated.mean()), 4),
+    }
+
+def learn_output_profiles(output_dir=BATCH_OUTPUT_DIR, tracking_file=BATCH_TRACKING_FILE,
+                          profiles_file=OUTPUT_PROFILES_FILE):
+    """Fits a profile for every job type with enough past responses and saves them."""
+    profiles = {}
+    for job_type, rows in collect_output_lengths(output_dir, tracking_file).items():
+        if len(rows) < MIN_PROFILE_SAMPLES:
+            log.info(f"Only {len(rows)} {job_type} responses; keeping its fixed max_tokens.")
+            continue
+        profiles[job_type] = fit_profile(rows[:, 0], rows[:, 1], rows[:, 2])
+        log.info(f"{job_type}: max_tokens {profiles[job_type]['limits']} for inputs up to "
+                 f"{profiles[job_type]['edges']} tokens ({len(rows)} responses, "
+                 f"{profiles[job_type]['truncation_rate']:.1%} truncated)")
+
+    write_json(profiles_file, profiles)
+    log.info(f"Output profiles saved to {profiles_file}")
+    return profiles
+
+# -------------------------------
+# Request Sizing
+# -------------------------------
+
+def load_output_profiles(profiles_file=OUTPUT_PROFILES_FILE):
+    """Loads the learned profiles, or returns none if they have not been learned yet."""
+    if Path(profiles_file).exists():
+        return read_json(profiles_file)
+    return {}
+
+def max_tokens_for(profile, prompt_tokens):
+    """Returns the learned max_tokens of each request from its prompt tokens."""
+    bands = np.searchsorted(profile["edges"], prompt_tokens, side="left")
+    return np.asarray(profile["limits"])[bands]
+
+def size_requests(requests, job_type, profiles=None, cache_file=TOKEN_CACHE_FILE):
+    """
+    Sets each batch request's max_tokens from its job type's learned profile
+    and its prompt size. Requests of job types without a profile keep their
+    fixed max_tokens. Returns the requests.
+    """
+    profile = (load_output_profiles() if profiles is None else profiles).get(job_type)
+    if not profile or not requests:
+        return requests
+
+    bodies = [request["body"] for request in requests]
+    limits = max_tokens_for(profile, count_input_tokens(bodies, cache_file))
+    reserved = sum(body.get("max_tokens", 0) for body in bodies)
+    for body, limit in zip(bodies, limits):
+        body["max_tokens"] = int(limit)
+
+    log.info(f"Sized {len(requests)} {job_type} requests: {int(limits.sum())} output tokens reserved "
+             f"(was {reserved}).")
+    return requests
+
+# -------------------------------
+# Main Execution
+# -------------------------------
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Learn per-job-type max_tokens limits from past batch outputs.")
+    parser.add_argument("--directory", type=Path, default=BATCH_OUTPUT_DIR)
+    parser.add_argument("--output", type=Path, default=OUTPUT_PROFILES_FILE)
+    args = parser.parse_args()
+
+    learn_output_profiles(args.directory, profiles_file=args.output)
@@ -1,10 +1,10 @@
 import os
-import json
-import tiktoken
 import logging
 from pathlib import Path
 from WAAnalysis.config import DATA_DIR, ERROR_LOGS_DIRECTORY
 from WAAnalysis.utils import ensure_directories_exist
+from WAAnalysis.json_codec import dumps, read_json
+from WAAnalysis.token_cache import count_tokens
 
 # -------------------------------
 # Setup Logging
@@ -25,13 +25,6 @@ console_handler.setFormatter(formatter)
 
 logging.getLogger().addHandler(console_handler)
 
-# -------------------------------
-# Tokenization Setup
-# -------------------------------
-
-# Initialize tokenizer using cl100k_base (modify this if needed)
-tokenizer = tiktoken.get_encoding("cl100k_base")
-
 # List of JSON files (adjust paths relative to DATA_DIR)
 json_files = [
     DATA_DIR / "2024-03-09.json",
@@ -46,11 +39,8 @@ json_files = [
 def compute_token_size(file_path):
     """Compute the token size for a given JSON file."""
     try:
-        with open(file_path, "r") as f:
-            content = json.load(f)
-        json_str = json.dumps(content)
-        tokens = tokenizer.encode(json_str)
-        token_count = len(tokens)
+        json_str = dumps(read_json(file_path))
+        token_count = count_tokens(json_str)
         logging.info(f"Token count for {file_path.name}: {token_count}")
         return token_count
     except Exception as e:
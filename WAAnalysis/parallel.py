@@ -0,0 +1,77 @@
+import logging
+from functools import partial
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from WAAnalysis.config import CORPUS_WORKERS
+
+# -------------------------------
+# Setup Logging
+# -------------------------------
+log = logging.getLogger(__name__)
+
+# -------------------------------
+# Parallel Per-Item Execution
+# -------------------------------
+
+def call_safely(func, item):
+    """Calls func on a single item, returning (result, error) instead of raising."""
+    try:
+        return func(item), None
+    except Exception as e:
+        return None, f"{type(e).__name__}: {e}"
+
+def run_parallel(func, items, workers=None, use_threads=False, description="files"):
+    """
+    Runs func over every item in a process or thread pool.
+
+    Results come back in input order, and progress is logged in that order. A failing
+    item does not stop the run; its error is collected instead.
+
+    Args:
+        func (callable): Module-level function taking one item (must be picklable for processes).
+        items (iterable): Items to process, typically file paths.
+        workers (int, optional): Number of workers. Defaults to CORPUS_WORKERS; 1 runs inline.
+        use_threads (bool): Use a thread pool instead of a process pool, for I/O-bound work.
+        description (str): Label used in progress messages.
+
+    Returns:
+        tuple: (results, errors) where results is a list aligned with items (None for
+        failed items) and errors is a list of (item, error message) tuples.
+    """
+    items = list(items)
+    total = len(items)
+    workers = min(workers or CORPUS_WORKERS, total) or 1
+    task = partial(call_safely, func)
+
+    log.info(f"Processing {total} {description} with {workers} worker(s).")
+
+    if workers == 1:
+        outcomes = map(task, items)
+        return collect_outcomes(items, outcomes, description)
+
+    if use_threads:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            return collect_outcomes(items, executor.map(task, items), description)
+
+    # Hand out work in chunks so small per-file tasks are not dominated by IPC
+    chunksize = max(1, total // (workers * 8))
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        return collect_outcomes(items, executor.map(task, items, chunksize=chunksize), description)
+
+def collect_outcomes(items, outcomes, description):
+    """Collects ordered outcomes into results and errors, logging progress as it goes."""
+    total = len(items)
+    progress_interval = max(1, total // 20)
+    results = []
+    errors = []
+
+    for i, (item, (result, error)) in enumerate(zip(items, outcomes), start=1):
+        results.append(result)
+        if error:
+            log.error(f"Failed to process {item}: {error}")
+            errors.append((item, error))
+        if i % progress_interval == 0 or i == total:
+            log.info(f"Processed {i}/{total} {description}")
+
+    if errors:
+        log.warning(f"{len(errors)} of {total} {description} failed.")
+    return results, errors
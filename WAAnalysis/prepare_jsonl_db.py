@@ -1,7 +1,6 @@
-import json
-import jsonlines
 import logging
 from WAAnalysis.config import BATCH_OUTPUT_DIR, DATA_DIR
+from WAAnalysis.json_codec import iter_jsonl, read_json, write_jsonl
 
 # File paths
 WHATSAPP_MESSAGES_FILE = DATA_DIR / 'whatsapp_messages_by_day.json'
@@ -16,10 +15,9 @@ OUTPUT_FILE = DATA_DIR / 'messages.jsonl'
 def load_jsonl_to_dict(file_path, file_type):
     data_dict = {}
     try:
-        with jsonlines.open(file_path) as reader:
-            for obj in reader:
-                custom_id = obj['custom_id']
-                data_dict[custom_id] = obj['response']['body']['choices'][0]['message']['content']
+        for obj in iter_jsonl(file_path):
+            custom_id = obj['custom_id']
+            data_dict[custom_id] = obj['response']['body']['choices'][0]['message']['content']
         logging.info(f"{file_type} results loaded successfully.")
     except Exception as e:
         logging.error(f"Failed to load {file_type} results from {file_path}: {e}")
@@ -38,14 +36,13 @@ def process_whatsapp_messages():
         
         # Process WhatsApp messages
         logging.info("Processing WhatsApp messages...")
-        with open(WHATSAPP_MESSAGES_FILE, 'r') as file:
-            whatsapp_data = json.load(file)
+        whatsapp_data = read_json(WHATSAPP_MESSAGES_FILE)
         logging.info(f"Loaded WhatsApp messages from {WHATSAPP_MESSAGES_FILE}")
 
-        # Open the output file for writing
-        with jsonlines.open(OUTPUT_FILE, mode='w') as writer:
+        # Stream one output object per day into the output file
+        def output_objects():
             for day, messages in whatsapp_data.items():
-                output_object = {
+                yield {
                     'id': day,
                     'sentiment': sentiment_data.get(day, {}),
                     'topics': topics_data.get(day, {}),
@@ -53,9 +50,10 @@ def process_whatsapp_messages():
                     'entity_relationships': entities_data.get(day, {}),
                     'messages': messages
                 }
-                writer.write(output_object)
                 logging.debug(f"Processed data for {day}")
 
+        write_jsonl(OUTPUT_FILE, output_objects())
+
         logging.info(f"Processed messages saved to {OUTPUT_FILE}")
 
     except Exception as e:
@@ -6,20 +6,27 @@ from WAAnalysis.utils import ensure_directories_exist
 # Setup Logging
 # -------------------------------
 log_file = ERROR_LOGS_DIRECTORY / "pricing_analysis.log"
-ensure_directories_exist([ERROR_LOGS_DIRECTORY])
 
-logging.basicConfig(
-    filename=log_file,
-    level=logging.INFO,
-    format="%(asctime)s - %(levelname)s - %(message)s",
-)
+def setup_logging():
+    """
+    Logs the cost analysis to its own file and the console. Only run as a
+    script, as the pricing table is imported by the batch pipeline, which has
+    its own handlers.
+    """
+    ensure_directories_exist([ERROR_LOGS_DIRECTORY])
 
-console_handler = logging.StreamHandler()
-console_handler.setLevel(logging.INFO)
-formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
-console_handler.setFormatter(formatter)
+    logging.basicConfig(
+        filename=log_file,
+        level=logging.INFO,
+        format="%(asctime)s - %(levelname)s - %(message)s",
+    )
 
-logging.getLogger().addHandler(console_handler)
+    console_handler = logging.StreamHandler()
+    console_handler.setLevel(logging.INFO)
+    formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
+    console_handler.setFormatter(formatter)
+
+    logging.getLogger().addHandler(console_handler)
 
 # -------------------------------
 # Pricing Configuration
@@ -59,31 +66,43 @@ pricing_table = {
 # Cost Calculation Function
 # -------------------------------
 
+def pricing_model(model):
+    """
+    Returns the pricing table entry that applies to a model, matching dated
+    snapshots such as gpt-4o-mini-2024-07-18 to their base model, or None.
+    """
+    if model in pricing_table:
+        return model
+    prefixes = [name for name in pricing_table if model and model.startswith(f"{name}-")]
+    return max(prefixes, key=len, default=None)
+
+def model_costs(model, input_tokens, output_tokens):
+    """Returns the normal and batch costs of a number of input and output tokens on a model."""
+    pricing = pricing_table[pricing_model(model)]
+
+    # Normal cost
+    input_cost_normal = (input_tokens / 1_000_000 * pricing["input_token_price"])
+    output_cost_normal = (output_tokens / 1_000_000 * pricing["output_token_price"])
+    total_cost_normal = input_cost_normal + output_cost_normal
+
+    # Batch cost
+    input_cost_batch = (input_tokens / 1_000_000 * pricing["input_token_price_batch"])
+    output_cost_batch = (output_tokens / 1_000_000 * pricing["output_token_price_batch"])
+    total_cost_batch = input_cost_batch + output_cost_batch
+
+    return {
+        "input_cost_normal": round(input_cost_normal, 2),
+        "output_cost_normal": round(output_cost_normal, 2),
+        "total_cost_normal": round(total_cost_normal, 2),
+        "input_cost_batch": round(input_cost_batch, 2),
+        "output_cost_batch": round(output_cost_batch, 2),
+        "total_cost_batch": round(total_cost_batch, 2)
+    }
+
 def calculate_costs():
     """Calculates and logs cost analysis for each model."""
-    costs = {}
-    
     # Calculate cost for each model
-    for model, pricing in pricing_table.items():
-        # Normal cost
-        input_cost_normal = (input_tokens / 1_000_000 * pricing["input_token_price"])
-        output_cost_normal = (output_tokens / 1_000_000 * pricing["output_token_price"])
-        total_cost_normal = input_cost_normal + output_cost_normal
-        
-        # Batch cost
-        input_cost_batch = (input_tokens / 1_000_000 * pricing["input_token_price_batch"])
-        output_cost_batch = (output_tokens / 1_000_000 * pricing["output_token_price_batch"])
-        total_cost_batch = input_cost_batch + output_cost_batch
-        
-        # Store costs in dictionary
-        costs[model] = {
-            "input_cost_normal": round(input_cost_normal, 2),
-            "output_cost_normal": round(output_cost_normal, 2),
-            "total_cost_normal": round(total_cost_normal, 2),
-            "input_cost_batch": round(input_cost_batch, 2),
-            "output_cost_batch": round(output_cost_batch, 2),
-            "total_cost_batch": round(total_cost_batch, 2)
-        }
+    costs = {model: model_costs(model, input_tokens, output_tokens) for model in pricing_table}
 
     # Log the analysis results
     log_cost_analysis(costs)
@@ -111,4 +130,5 @@ def log_cost_analysis(costs):
 # -------------------------------
 
 if __name__ == "__main__":
+    setup_logging()
     calculate_costs()
@@ -6,10 +6,10 @@ from WAAnalysis.prompts import (
     create_entities_prompt
 )
 from WAAnalysis.utils import read_file_content
-from WAAnalysis.config import OPENAI_API_KEY, DATA_DIR
+from WAAnalysis.config import OPENAI_API_KEY, OPENAI_BASE_URL, DATA_DIR
 from openai import OpenAI
 
-client = OpenAI(api_key=OPENAI_API_KEY)
+client = OpenAI(api_key=OPENAI_API_KEY, base_url=OPENAI_BASE_URL)
 
 # Set up OpenAI API key from config
 
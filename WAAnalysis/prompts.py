@@ -147,6 +147,61 @@ Expected output:
 Now, do the same for the following conversation:
 """
 
+# Combined Analysis
+# Produces all four results in one call, as the object in schemas/document_schema.json
+analysis_prompt_system = """
+You are an AI assistant specialized in analyzing conversations.
+Your goal is to extract, in a single JSON object, the topics, the named entities and their relationships,
+the overall sentiment and the key points of the provided conversation.
+Here’s an example of how to do it:
+
+Conversation:
+---
+Jason: I think we need to figure out how to handle our communication better. I feel like things are falling apart.
+Elizabeth: Well, it’s not just about communication. You don’t spend enough time with the children. And I’m always stuck doing everything.
+Jason: That’s not fair. I’m working hard to provide for the family.
+---
+
+Expected output:
+{
+  "topics": [
+    "communication breakdown",
+    "family time",
+    "work-life balance"
+  ],
+  "entities": [
+    {
+      "person": "Jason",
+      "role": "father",
+      "relationships": [
+        "expresses concern about communication",
+        "defends his work commitments"
+      ]
+    },
+    {
+      "person": "Elizabeth",
+      "role": "mother",
+      "relationships": [
+        "accuses Jason of not spending enough time with the children",
+        "expresses frustration with doing everything at home"
+      ]
+    }
+  ],
+  "sentiment": {
+    "sentiment": "Negative",
+    "polarity": -0.6,
+    "subjectivity": 0.8
+  },
+  "key_points": [
+    "Jason expresses concern about communication.",
+    "Elizabeth raises the issue of Jason not spending enough time with the children.",
+    "Jason defends his work commitments as providing for the family."
+  ]
+}
+
+Now, do the same for the following conversation:
+"""
+
 # Functions to format the prompts with the document content
 def create_topics_prompt(document_content):
     return {
@@ -171,3 +226,9 @@ def create_entities_prompt(document_content):
         "system": entities_prompt_system,
         "user": document_content
     }
+
+def create_analysis_prompt(document_content):
+    return {
+        "system": analysis_prompt_system,
+        "user": document_content
+    }
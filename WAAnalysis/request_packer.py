@@ -0,0 +1,194 @@
+import copy
+import hashlib
+import logging
+from pathlib import Path
+from WAAnalysis.config import (
+    BATCH_INPUT_DIR,
+    TOKEN_CACHE_FILE,
+    PACK_DOCUMENT_LIMIT,
+    PACK_TOKEN_BUDGET,
+    PACK_MAX_DOCUMENTS,
+    PACK_MANIFEST_FILE,
+    PACK_REQUESTS_DIR,
+    RETRY_FILE_SUFFIX,
+)
+from WAAnalysis.json_codec import JSONDecodeError, loads, read_json, iter_jsonl, write_jsonl
+from WAAnalysis.utils import save_to_json
+from WAAnalysis.token_cache import count_tokens_many
+from WAAnalysis.cost_forecast import encoding_for_model, message_text
+
+# -------------------------------
+# Setup Logging
+# -------------------------------
+log = logging.getLogger(__name__)
+
+# -------------------------------
+# Packed Request Format
+# -------------------------------
+# Appended to the job's own system prompt, so each document gets the same
+# instructions and example it would get on its own
+PACK_INSTRUCTIONS = """
+The conversation below contains several separate documents. Each one starts with a line
+"=== DOCUMENT <id> ===" and ends with a line "=== END DOCUMENT <id> ===".
+Analyze each document on its own, exactly as described above, and return a single JSON object
+with one key per document ID whose value is the output for that document.
+"""
+
+def document_block(document_id, text):
+    """Wraps one document's conversation in its delimiters."""
+    return f"=== DOCUMENT {document_id} ===\n{text}\n=== END DOCUMENT {document_id} ==="
+
+def pack_id(job_type, document_ids):
+    """Returns a custom_id for a pack, derived from its documents so it is stable across runs."""
+    digest = hashlib.blake2b("\n".join(document_ids).encode("utf-8"), digest_size=6).hexdigest()
+    return f"{job_type}_pack_{digest}"
+
+# -------------------------------
+# Packing
+# -------------------------------
+
+def group_small_documents(token_counts, document_limit=PACK_DOCUMENT_LIMIT, budget=PACK_TOKEN_BUDGET,
+                          max_documents=PACK_MAX_DOCUMENTS):
+    """
+    Groups the indices of documents of at most document_limit tokens, in order,
+    into packs within the token budget. Larger documents and packs of one are
+    returned as single-index groups, to be sent on their own.
+    """
+    groups = []
+    pack = None
+    used = 0
+    for index, tokens in enumerate(token_counts):
+        if tokens > document_limit:
+            groups.append([index])
+            continue
+        if pack is None or used + tokens > budget or len(pack) == max_documents:
+            # Packs are placed at their first document, keeping the input order
+            pack, used = [], 0
+            groups.append(pack)
+        pack.append(index)
+        used += tokens
+    return groups
+
+def build_pack(job_type, requests):
+    """Combines individual batch requests of one job type into a single packed request."""
+    document_ids = [request["custom_id"] for request in requests]
+    packed = copy.deepcopy(requests[0])
+    body = packed["body"]
+    messages = body["messages"]
+
+    messages[0]["content"] = message_text(messages[0]) + PACK_INSTRUCTIONS
+    messages[-1]["content"] = "\n\n".join(
+        document_block(document_id, message_text(request["body"]["messages"][-1]))
+        for document_id, request in zip(document_ids, requests)
+    )
+    # Each document keeps the output budget it would have had on its own
+    body["max_tokens"] = sum(request["body"].get("max_tokens", 0) for request in requests)
+    body["response_format"] = {"type": "json_object"}
+    packed["custom_id"] = pack_id(job_type, document_ids)
+    return packed, document_ids
+
+def load_packs(manifest_file=PACK_MANIFEST_FILE):
+    """Loads the documents of every packed request, keyed by its custom_id."""
+    if Path(manifest_file).exists():
+        return read_json(manifest_file)["packs"]
+    return {}
+
+def pack_requests(requests, job_type, manifest_file=PACK_MANIFEST_FILE, cache_file=TOKEN_CACHE_FILE,
+                  requests_dir=PACK_REQUESTS_DIR, unpacked_ids=(), **limits):
+    """
+    Packs small documents' requests several to a request, so they share one
+    system prompt. Each request's last message is taken as the document.
+    Requests whose custom_id is in unpacked_ids are always sent on their own.
+    Records the documents of each pack in the manifest, and their original
+    requests in requests_dir, and returns the requests to send.
+    """
+    if not requests:
+        return requests
+
+    model = requests[0]["body"].get("model")
+    token_counts = count_tokens_many([message_text(request["body"]["messages"][-1]) for request in requests],
+                                     encoding_for_model(model), cache_file)
+    token_counts = [float("inf") if request["custom_id"] in unpacked_ids else tokens
+                    for request, tokens in zip(requests, token_counts)]
+
+    packs = load_packs(manifest_file)
+    Path(requests_dir).mkdir(parents=True, exist_ok=True)
+    packed_requests = []
+    for group in group_small_documents(token_counts, **limits):
+        if len(group) == 1:
+            packed_requests.append(requests[group[0]])
+            continue
+        group_requests = [requests[index] for index in group]
+        packed, document_ids = build_pack(job_type, group_requests)
+        packs[packed["custom_id"]] = {"job_type": job_type, "documents": document_ids}
+        write_jsonl(Path(requests_dir) / f"{packed['custom_id']}.jsonl", group_requests)
+        packed_requests.append(packed)
+
+    save_to_json({"packs": packs}, manifest_file)
+    log.info(f"Packed {len(requests)} {job_type} requests into {len(packed_requests)}.")
+    return packed_requests
+
+# -------------------------------
+# Unpacking
+# -------------------------------
+
+def unpack_response(content, document_ids):
+    """
+    Splits a packed response into per-document results. Returns a dict of
+    document ID -> result and the IDs whose result is missing or unparsable.
+    """
+    try:
+        results = loads(content)
+    except JSONDecodeError:
+        return {}, list(document_ids)
+    if not isinstance(results, dict):
+        return {}, list(document_ids)
+
+    unpacked = {document_id: results[document_id] for document_id in document_ids
+                if isinstance(results.get(document_id), dict)}
+    return unpacked, [document_id for document_id in document_ids if document_id not in unpacked]
+
+# -------------------------------
+# Retries
+# -------------------------------
+# Requests whose result could not be used are queued in the job type's retry
+# file; batch_processing submits them on their own with the next batch.
+
+def retry_file_path(job_type, output_dir=BATCH_INPUT_DIR):
+    """Returns the job type's retry batch file, e.g. topics_retry_batch.jsonl."""
+    return Path(output_dir) / f"{job_type}{RETRY_FILE_SUFFIX}"
+
+def pack_document_requests(pack_id, document_ids, requests_dir=PACK_REQUESTS_DIR):
+    """Returns the original requests of the given documents of a pack, as recorded when it was packed."""
+    wanted = set(document_ids)
+    return [request for request in iter_jsonl(Path(requests_dir) / f"{pack_id}.jsonl")
+            if request["custom_id"] in wanted]
+
+def expand_packed_requests(requests, packs, requests_dir=PACK_REQUESTS_DIR):
+    """Replaces every packed request with the original requests of its documents."""
+    expanded = []
+    for request in requests:
+        custom_id = request["custom_id"]
+        if custom_id in packs:
+            expanded.extend(pack_document_requests(custom_id, packs[custom_id]["documents"], requests_dir))
+        else:
+            expanded.append(request)
+    return expanded
+
+def write_retry_requests(requests, job_type, output_dir=BATCH_INPUT_DIR):
+    """Appends requests to the job type's retry batch file. Returns its path."""
+    retry_file = retry_file_path(job_type, output_dir)
+    written = write_jsonl(retry_file, requests, append=True)
+    log.warning(f"Queued {written} {job_type} requests for individual retry in {retry_file}")
+    return retry_file
+
+def load_retry_requests(job_type, output_dir=BATCH_INPUT_DIR):
+    """Returns the queued retry requests of a job type, the latest one per custom_id."""
+    retry_file = retry_file_path(job_type, output_dir)
+    if not retry_file.exists():
+        return []
+    return list({request["custom_id"]: request for request in iter_jsonl(retry_file)}.values())
+
+def clear_retry_requests(job_type, output_dir=BATCH_INPUT_DIR):
+    """Removes the job type's retry batch file once its requests have been submitted."""
+    retry_file_path(job_type, output_dir).unlink(missing_ok=True)
@@ -0,0 +1,267 @@
+import time
+import hashlib
+import logging
+import sqlite3
+import threading
+from pathlib import Path
+from WAAnalysis.config import (
+    RESPONSE_CACHE_FILE,
+    BATCH_OUTPUT_DIR,
+    BATCH_TRACKING_FILE,
+    SUBMITTED_INPUT_DIR,
+    PACK_REQUESTS_DIR,
+)
+from WAAnalysis.json_codec import JSONDecodeError, dumps, dumps_bytes, loads, iter_jsonl, read_json
+from WAAnalysis.utils import save_to_json
+from WAAnalysis.token_cache import get_connection
+from WAAnalysis.request_packer import unpack_response, load_packs, pack_document_requests
+
+# -------------------------------
+# Setup Logging
+# -------------------------------
+log = logging.getLogger(__name__)
+
+# -------------------------------
+# Cache Storage
+# -------------------------------
+# Responses are keyed by a hash of their request body. batch_requests records,
+# for each submitted batch, the digest of every document in it, so outputs are
+# matched to the exact requests that produced them. A packed request has one
+# row per document, and its response is cached per document. Rows are removed
+# once a batch's output is ingested; batches with no rows are backfilled from
+# their archived input file.
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS responses (
+    digest BLOB PRIMARY KEY,
+    content TEXT NOT NULL,
+    model TEXT,
+    completion_tokens INTEGER NOT NULL,
+    created REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS batch_requests (
+    batch_id TEXT NOT NULL,
+    custom_id TEXT NOT NULL,
+    document_id TEXT NOT NULL,
+    digest BLOB NOT NULL
+);
+CREATE INDEX IF NOT EXISTS batch_requests_batch_id ON batch_requests (batch_id);
+"""
+
+# Maximum number of digests per lookup query, below SQLite's bound-parameter limit
+LOOKUP_BATCH_SIZE = 500
+
+# Output limits do not change a response that finished within them, so they are left out of the key
+UNKEYED_FIELDS = ("max_tokens", "max_completion_tokens")
+
+_lock = threading.Lock()
+
+def connect(cache_file=RESPONSE_CACHE_FILE):
+    """Returns this process's connection to the response cache."""
+    return get_connection(cache_file, SCHEMA)
+
+def is_json_object(content):
+    """Checks whether a response's content parses as a JSON object, the only result a document can use."""
+    try:
+        return isinstance(loads(content), dict)
+    except (JSONDecodeError, TypeError):
+        return False
+
+def request_digest(body):
+    """Returns the cache key of a request body: a hash of everything but its output limit."""
+    keyed = {key: value for key, value in body.items() if key not in UNKEYED_FIELDS}
+    return hashlib.blake2b(dumps_bytes(keyed, sort_keys=True), digest_size=16).digest()
+
+# -------------------------------
+# Lookup
+# -------------------------------
+
+def lookup_responses(digests, cache_file=RESPONSE_CACHE_FILE):
+    """Returns a dict of digest -> (content, completion_tokens) for the digests in the cache."""
+    found = {}
+    with _lock:
+        connection = connect(cache_file)
+        for i in range(0, len(digests), LOOKUP_BATCH_SIZE):
+            batch = digests[i:i + LOOKUP_BATCH_SIZE]
+            placeholders = ",".join("?" * len(batch))
+            rows = connection.execute(
+                f"SELECT digest, content, completion_tokens FROM responses WHERE digest IN ({placeholders})", batch)
+            found.update((digest, (content, completion_tokens)) for digest, content, completion_tokens in rows)
+    return found
+
+def split_cached(requests, cache_file=RESPONSE_CACHE_FILE):
+    """
+    Splits batch requests into cache misses, to be submitted, and hits, served
+    from earlier responses. A cached response only counts as a hit if it fits
+    the request's output limit and parses as a JSON object. Returns the misses, the hits as (custom_id,
+    content) pairs and the digest of every request by custom_id.
+    """
+    digests = {request["custom_id"]: request_digest(request["body"]) for request in requests}
+    try:
+        cached = lookup_responses(list(set(digests.values())), cache_file)
+    except sqlite3.Error as e:
+        log.warning(f"Response cache unavailable at {cache_file}: {e}. Submitting every request.")
+        return requests, [], digests
+
+    misses = []
+    hits = []
+    for request in requests:
+        response = cached.get(digests[request["custom_id"]])
+        limit = request["body"].get("max_tokens") or float("inf")
+        if response and response[1] <= limit and is_json_object(response[0]):
+            hits.append((request["custom_id"], response[0]))
+        else:
+            misses.append(request)
+
+    log.info(f"Response cache: {len(hits)} hits, {len(misses)} requests to submit.")
+    return misses, hits, digests
+
+# -------------------------------
+# Filling
+# -------------------------------
+
+def batch_request_rows(input_file, digests, packs):
+    """
+    Returns (custom_id, document_id, digest) for every document in a batch
+    input file, expanding packed requests into their documents.
+    """
+    rows = []
+    for request in iter_jsonl(input_file):
+        custom_id = request["custom_id"]
+        document_ids = packs[custom_id]["documents"] if custom_id in packs else [custom_id]
+        rows.extend((custom_id, document_id, digests[document_id]) for document_id in document_ids
+                    if document_id in digests)
+    return rows
+
+def archived_request_rows(input_file, packs, requests_dir=PACK_REQUESTS_DIR):
+    """
+    Returns (custom_id, document_id, digest) for every document in an archived
+    batch input file, recomputing each digest from the document's request; a
+    packed request's documents are hashed from their original requests.
+    """
+    rows = []
+    for request in iter_jsonl(input_file):
+        custom_id = request["custom_id"]
+        originals = pack_document_requests(custom_id, packs[custom_id]["documents"], requests_dir) \
+            if custom_id in packs else [request]
+        rows.extend((custom_id, original["custom_id"], request_digest(original["body"])) for original in originals)
+    return rows
+
+def has_batch_requests(batch_id, cache_file=RESPONSE_CACHE_FILE):
+    """Checks whether the documents of a batch are recorded in the cache."""
+    with _lock:
+        return connect(cache_file).execute(
+            "SELECT 1 FROM batch_requests WHERE batch_id = ? LIMIT 1", (batch_id,)).fetchone() is not None
+
+def record_batch_requests(batch_id, rows, cache_file=RESPONSE_CACHE_FILE):
+    """Records the documents submitted in a batch, so its output can be cached once downloaded."""
+    with _lock:
+        connection = connect(cache_file)
+        with connection:
+            connection.executemany(
+                "INSERT INTO batch_requests (batch_id, custom_id, document_id, digest) VALUES (?, ?, ?, ?)",
+                [(batch_id, *row) for row in rows],
+            )
+
+def cacheable_content(result):
+    """
+    Returns the model, content and completion tokens of a successful, complete
+    response whose content is a JSON object, or None.
+    """
+    response = result.get("response") or {}
+    if result.get("error") or response.get("status_code") != 200:
+        return None
+    body = response.get("body") or {}
+    choices = body.get("choices") or []
+    if not choices or choices[0].get("finish_reason") == "length":
+        return None
+    content = choices[0]["message"]["content"]
+    if not is_json_object(content):
+        return None
+    usage = body.get("usage") or {}
+    return body.get("model"), content, usage.get("completion_tokens", 0)
+
+def ingest_batch_output(batch_id, output_file, cache_file=RESPONSE_CACHE_FILE):
+    """
+    Caches every successful, untruncated response in a downloaded batch output
+    under the digests recorded when the batch was submitted. Packed responses
+    are cached per document. Returns the number of responses cached.
+    """
+    with _lock:
+        connection = connect(cache_file)
+        documents = {}
+        for custom_id, document_id, digest in connection.execute(
+                "SELECT custom_id, document_id, digest FROM batch_requests WHERE batch_id = ?", (batch_id,)):
+            documents.setdefault(custom_id, []).append((document_id, digest))
+    if not documents:
+        return 0
+
+    now = time.time()
+    entries = []
+    for result in iter_jsonl(output_file):
+        response = cacheable_content(result)
+        rows = documents.get(result.get("custom_id"))
+        if response is None or not rows:
+            continue
+        model, content, completion_tokens = response
+
+        if len(rows) == 1 and rows[0][0] == result["custom_id"]:
+            entries.append((rows[0][1], content, model, completion_tokens, now))
+            continue
+
+        # A packed response's per-document output size is unknown, so it fits any limit
+        unpacked, _ = unpack_response(content, [document_id for document_id, _ in rows])
+        entries.extend((digest, dumps(unpacked[document_id]), model, 0, now)
+                       for document_id, digest in rows if document_id in unpacked)
+
+    with _lock:
+        with connection:
+            connection.executemany(
+                "INSERT OR REPLACE INTO responses (digest, content, model, completion_tokens, created) "
+                "VALUES (?, ?, ?, ?, ?)", entries)
+            connection.execute("DELETE FROM batch_requests WHERE batch_id = ?", (batch_id,))
+    log.info(f"Cached {len(entries)} responses from batch {batch_id}.")
+    return len(entries)
+
+def ingest_tracked_outputs(tracking_file=BATCH_TRACKING_FILE, output_dir=BATCH_OUTPUT_DIR,
+                           cache_file=RESPONSE_CACHE_FILE, submitted_dir=SUBMITTED_INPUT_DIR, packs=None,
+                           requests_dir=PACK_REQUESTS_DIR):
+    """
+    Caches the outputs of every downloaded batch in the tracking file that is
+    not cached yet, and marks them as cached. Batches whose documents were not
+    recorded at submission, or whose records were already ingested, are
+    backfilled from their archived input file in submitted_dir; batches
+    submitted before inputs were archived cannot be cached.
+    """
+    if not Path(tracking_file).exists():
+        return 0
+    data = read_json(tracking_file)
+    cached = 0
+    updated = False
+    for job in data["jobs"]:
+        output_file = Path(output_dir) / Path(job.get("output_file") or "").name
+        if job.get("response_cached") or not (job.get("batch_id") and job.get("output_file") and output_file.exists()):
+            continue
+
+        batch_id = job["batch_id"]
+        if not has_batch_requests(batch_id, cache_file):
+            input_file = Path(submitted_dir) / Path(job.get("input_file") or "").name
+            if not (job.get("input_file") and input_file.exists()):
+                log.warning(f"No archived input for batch {batch_id}; its responses cannot be cached.")
+                continue
+            packs = load_packs() if packs is None else packs
+            record_batch_requests(batch_id, archived_request_rows(input_file, packs, requests_dir), cache_file)
+
+        cached += ingest_batch_output(batch_id, output_file, cache_file)
+        job["response_cached"] = True
+        updated = True
+
+    if updated:
+        save_to_json(data, tracking_file)
+    return cached
+
+# -------------------------------
+# Main Execution
+# -------------------------------
+
+if __name__ == "__main__":
+    log.info(f"Cached {ingest_tracked_outputs()} responses from downloaded batch outputs.")
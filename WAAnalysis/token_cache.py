@@ -0,0 +1,217 @@
+import os
+import time
+import sqlite3
+import hashlib
+import logging
+import threading
+from functools import lru_cache
+from pathlib import Path
+import tiktoken
+from WAAnalysis.config import (
+    TOKEN_ENCODING,
+    TOKEN_CACHE_FILE,
+    TOKEN_CACHE_MAX_ENTRIES,
+    TOKEN_BATCH_SIZE,
+    TOKENIZER_THREADS,
+)
+
+# -------------------------------
+# Setup Logging
+# -------------------------------
+log = logging.getLogger(__name__)
+
+# -------------------------------
+# Cache Storage
+# -------------------------------
+# Token counts are keyed by (encoding, content hash), so a text is only ever
+# tokenized once per encoding, whichever module or file it came from.
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS token_counts (
+    encoding TEXT NOT NULL,
+    digest BLOB NOT NULL,
+    token_count INTEGER NOT NULL,
+    last_used REAL NOT NULL,
+    PRIMARY KEY (encoding, digest)
+);
+CREATE INDEX IF NOT EXISTS token_counts_last_used ON token_counts (last_used);
+"""
+
+# Maximum number of digests per lookup query, below SQLite's bound-parameter limit
+LOOKUP_BATCH_SIZE = 500
+
+# Hits only have their last use refreshed once it is older than this, so
+# repeated lookups of cached text do not write; eviction order is approximate
+# to within this interval
+LAST_USED_REFRESH_SECONDS = 3600
+
+# Connections are opened once per process and cache file, and shared between threads
+_connections = {}
+_lock = threading.Lock()
+
+# Row counts of each connection's token_counts table, kept up to date with this
+# process's inserts so eviction does not scan the table on every call. Inserts
+# from other processes are only seen at the next recount, when this count
+# passes the limit.
+_row_counts = {}
+
+def connection_key(cache_file):
+    """Returns the key of this process's connection to a cache file."""
+    return (os.getpid(), str(cache_file))
+
+def get_connection(cache_file, schema=SCHEMA):
+    """Returns this process's connection to a cache database, creating its schema if needed."""
+    key = connection_key(cache_file)
+    connection = _connections.get(key)
+    if connection is None:
+        Path(cache_file).parent.mkdir(parents=True, exist_ok=True)
+        connection = sqlite3.connect(cache_file, timeout=30, check_same_thread=False)
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=NORMAL")
+        connection.executescript(schema)
+        _connections[key] = connection
+    return connection
+
+def content_digest(text):
+    """Returns the content hash used as the cache key for a text."""
+    return hashlib.blake2b(text.encode("utf-8", "surrogatepass"), digest_size=16).digest()
+
+def lookup_counts(connection, encoding_name, digests):
+    """Returns a dict of digest -> (token count, last used) for the digests already in the cache."""
+    found = {}
+    for i in range(0, len(digests), LOOKUP_BATCH_SIZE):
+        batch = digests[i:i + LOOKUP_BATCH_SIZE]
+        placeholders = ",".join("?" * len(batch))
+        rows = connection.execute(
+            f"SELECT digest, token_count, last_used FROM token_counts "
+            f"WHERE encoding = ? AND digest IN ({placeholders})",
+            [encoding_name, *batch],
+        )
+        found.update((digest, (token_count, last_used)) for digest, token_count, last_used in rows)
+    return found
+
+def store_counts(connection, cache_file, encoding_name, new_counts, stale_digests, max_entries, now):
+    """
+    Inserts new counts and refreshes the last use of stale hits, then evicts the
+    least recently used entries beyond max_entries. Calls with nothing to write
+    do not open a transaction, and the table is only counted when this
+    process's running row count passes max_entries.
+    """
+    if not new_counts and not stale_digests:
+        return
+
+    key = connection_key(cache_file)
+    with connection:
+        inserted = connection.executemany(
+            "INSERT OR IGNORE INTO token_counts (encoding, digest, token_count, last_used) VALUES (?, ?, ?, ?)",
+            [(encoding_name, digest, token_count, now) for digest, token_count in new_counts.items()],
+        ).rowcount
+        connection.executemany(
+            "UPDATE token_counts SET last_used = ? WHERE encoding = ? AND digest = ?",
+            [(now, encoding_name, digest) for digest in stale_digests],
+        )
+
+        if key in _row_counts:
+            _row_counts[key] += max(inserted, 0)
+        else:
+            (_row_counts[key],) = connection.execute("SELECT COUNT(*) FROM token_counts").fetchone()
+
+        if _row_counts[key] > max_entries:
+            # Recount, as other processes may have inserted or evicted since
+            (total,) = connection.execute("SELECT COUNT(*) FROM token_counts").fetchone()
+            if total > max_entries:
+                connection.execute(
+                    "DELETE FROM token_counts WHERE rowid IN "
+                    "(SELECT rowid FROM token_counts ORDER BY last_used LIMIT ?)",
+                    (total - max_entries,),
+                )
+                log.debug(f"Evicted {total - max_entries} entries from the token cache.")
+            _row_counts[key] = min(total, max_entries)
+
+# -------------------------------
+# Token Counting
+# -------------------------------
+
+@lru_cache(maxsize=None)
+def get_encoding(encoding_name=TOKEN_ENCODING):
+    """Loads a tokenizer encoding once per process, only when something must be tokenized."""
+    return tiktoken.get_encoding(encoding_name)
+
+def tokenize_counts(texts, encoding_name=TOKEN_ENCODING, batch_size=TOKEN_BATCH_SIZE):
+    """
+    Tokenizes each text and returns the token counts, bypassing the cache.
+
+    Texts are encoded in batches with encode_ordinary_batch, which skips the
+    special-token checks and spreads each batch across TOKENIZER_THREADS threads
+    with the GIL released. Only the lengths are kept, so each batch's token IDs
+    are freed before the next one is encoded.
+    """
+    encoding = get_encoding(encoding_name)
+    counts = []
+    for i in range(0, len(texts), batch_size):
+        batch = encoding.encode_ordinary_batch(texts[i:i + batch_size], num_threads=TOKENIZER_THREADS)
+        counts.extend(len(tokens) for tokens in batch)
+    return counts
+
+def count_tokens_many(texts, encoding_name=TOKEN_ENCODING, cache_file=TOKEN_CACHE_FILE,
+                      max_entries=TOKEN_CACHE_MAX_ENTRIES, clock=time.time):
+    """
+    Returns the token count of each text, tokenizing only texts whose content hash
+    is not already cached. Pass cache_file=None to count without the cache.
+    clock supplies the last-use times recorded for eviction.
+    """
+    texts = list(texts)
+    if cache_file is None or not texts:
+        return tokenize_counts(texts, encoding_name)
+
+    digests = [content_digest(text) for text in texts]
+    now = clock()
+    try:
+        with _lock:
+            connection = get_connection(cache_file)
+            found = lookup_counts(connection, encoding_name, list(set(digests)))
+        counts = {digest: token_count for digest, (token_count, _) in found.items()}
+        stale = [digest for digest, (_, last_used) in found.items() if last_used < now - LAST_USED_REFRESH_SECONDS]
+
+        # Tokenize each distinct uncached text once, outside the lock
+        missing = {digest: text for digest, text in zip(digests, texts) if digest not in counts}
+        new_counts = dict(zip(missing, tokenize_counts(list(missing.values()), encoding_name))) if missing else {}
+        counts.update(new_counts)
+
+        with _lock:
+            store_counts(connection, cache_file, encoding_name, new_counts, stale, max_entries, now)
+    except sqlite3.Error as e:
+        log.warning(f"Token cache unavailable at {cache_file}: {e}. Counting without it.")
+        return tokenize_counts(texts, encoding_name)
+
+    log.debug(f"Token cache: {len(counts) - len(missing)} hits, {len(missing)} misses")
+    return [counts[digest] for digest in digests]
+
+def count_tokens(text, encoding_name=TOKEN_ENCODING, cache_file=TOKEN_CACHE_FILE):
+    """Returns the token count of a text, using the persistent cache."""
+    return count_tokens_many([text], encoding_name, cache_file)[0]
+
+def read_text(file_path):
+    """Reads a file as UTF-8 text."""
+    return Path(file_path).read_text(encoding="utf-8")
+
+def iter_file_token_counts(file_paths, read=read_text, batch_size=TOKEN_BATCH_SIZE,
+                           encoding_name=TOKEN_ENCODING, cache_file=TOKEN_CACHE_FILE):
+    """
+    Yields (file_path, token_count) for each file, reading batch_size files at a
+    time and counting each batch with one cached, multi-threaded call. read turns
+    a path into the text to count (the whole file by default). Files that cannot
+    be read are logged and skipped.
+    """
+    file_paths = list(file_paths)
+    for i in range(0, len(file_paths), batch_size):
+        batch_paths = []
+        batch_texts = []
+        for file_path in file_paths[i:i + batch_size]:
+            try:
+                batch_texts.append(read(file_path))
+                batch_paths.append(file_path)
+            except Exception as e:
+                log.error(f"Failed to process {Path(file_path).name}: {e}")
+
+        token_counts = count_tokens_many(batch_texts, encoding_name, cache_file)
+        yield from zip(batch_paths, token_counts)
@@ -0,0 +1,205 @@
+import logging
+import argparse
+from pathlib import Path
+import numpy as np
+from WAAnalysis.config import MD_DIR2, TOKEN_BATCH_SIZE, TOKEN_CACHE_FILE
+from WAAnalysis.token_cache import count_tokens_many
+from WAAnalysis.json_codec import write_json
+from WAAnalysis.utils import frontmatter_block
+
+# -------------------------------
+# Setup Logging
+# -------------------------------
+log = logging.getLogger(__name__)
+
+# -------------------------------
+# Distribution Config
+# -------------------------------
+# Columns of the per-file token count array
+COLUMNS = ("body", "frontmatter", "total")
+
+# Default inclusive upper bounds of the token ranges, e.g. 0-500, 501-1000, ...
+DEFAULT_EDGES = (500, 1000, 2000)
+DEFAULT_PERCENTILES = (50, 90, 95, 99)
+
+# -------------------------------
+# Token Counting
+# -------------------------------
+
+def collect_token_counts(file_paths, batch_size=TOKEN_BATCH_SIZE, cache_file=TOKEN_CACHE_FILE):
+    """
+    Counts the tokens of every file in a single pass.
+
+    Returns the file names and an integer array with one row per file and one
+    column per entry in COLUMNS. The total and the frontmatter are counted
+    exactly; the body is the difference, so the three always add up.
+    """
+    file_paths = list(file_paths)
+    names = []
+    rows = []
+
+    for i in range(0, len(file_paths), batch_size):
+        texts = []
+        for file_path in file_paths[i:i + batch_size]:
+            try:
+                texts.append(Path(file_path).read_text(encoding="utf-8"))
+                names.append(Path(file_path).name)
+            except Exception as e:
+                log.error(f"Failed to process {Path(file_path).name}: {e}")
+
+        # Totals and frontmatters are counted together in one cached batch
+        counts = count_tokens_many(texts + [frontmatter_block(text) for text in texts], cache_file=cache_file)
+        totals, frontmatters = counts[:len(texts)], counts[len(texts):]
+        rows.extend((total - frontmatter, frontmatter, total) for total, frontmatter in zip(totals, frontmatters))
+        log.info(f"Counted tokens for {len(names)}/{len(file_paths)} files.")
+
+    return names, np.array(rows, dtype=np.int64).reshape(-1, len(COLUMNS))
+
+# -------------------------------
+# Distribution Statistics
+# -------------------------------
+
+def range_labels(edges):
+    """Returns the label of each range for the given upper bounds, e.g. '0-500', ..., '2001+'."""
+    lower_bounds = [0] + [edge + 1 for edge in edges]
+    labels = [f"{low}-{high}" for low, high in zip(lower_bounds, edges)]
+    return labels + [f"{lower_bounds[-1]}+"]
+
+def histogram(names, values, edges=DEFAULT_EDGES):
+    """
+    Bins token counts into the inclusive ranges defined by edges.
+
+    Returns a dict of range label -> count, total tokens and percentage. The
+    open-ended last range also lists its documents, largest first.
+    """
+    edges = np.asarray(sorted(edges), dtype=np.int64)
+    bins = np.searchsorted(edges, values, side="left")
+    counts = np.bincount(bins, minlength=len(edges) + 1)
+    totals = np.bincount(bins, weights=values, minlength=len(edges) + 1)
+    lower_bounds = [0] + [int(edge) + 1 for edge in edges]
+    upper_bounds = [int(edge) for edge in edges] + [None]
+
+    ranges = {}
+    for i, label in enumerate(range_labels(edges.tolist())):
+        ranges[label] = {
+            "min": lower_bounds[i],
+            "max": upper_bounds[i],
+            "count": int(counts[i]),
+            "total_tokens": int(totals[i]),
+            "percentage": float(counts[i] / len(values) * 100) if len(values) else 0.0,
+        }
+    ranges[label]["documents"] = documents_above(names, values, int(edges[-1]))
+    return ranges
+
+def percentiles(values, qs=DEFAULT_PERCENTILES):
+    """Returns the given percentiles of the token counts, keyed as 'p50', 'p90', ..."""
+    if not len(values):
+        return {}
+    return {f"p{q}": float(value) for q, value in zip(qs, np.percentile(values, qs))}
+
+def documents_above(names, values, threshold):
+    """Returns the documents with more than threshold tokens, largest first."""
+    indices = np.flatnonzero(values > threshold)
+    indices = indices[np.argsort(-values[indices], kind="stable")]
+    return [{"filename": names[i], "token_count": int(values[i])} for i in indices]
+
+def distribution_report(names, counts, column="total", edges=DEFAULT_EDGES, threshold=None):
+    """
+    Builds the token distribution report for one column of the count array.
+    Any number of reports can be built from the same counts without rescanning.
+    """
+    values = counts[:, COLUMNS.index(column)]
+    report = {
+        "column": column,
+        "documents": len(values),
+        "total_tokens": int(values.sum()),
+        "percentiles": percentiles(values),
+        "ranges": histogram(names, values, edges),
+    }
+    if len(values):
+        largest = int(np.argmax(values))
+        report["max"] = {"filename": names[largest], "token_count": int(values[largest])}
+    if threshold is not None:
+        report["documents_above"] = {"threshold": threshold, "documents": documents_above(names, values, threshold)}
+    return report
+
+def log_report(report):
+    """Logs a distribution report."""
+    log.info(f"Token distribution ({report['column']}): {report['documents']} documents, "
+             f"{report['total_tokens']} tokens in total")
+    for label, data in report["ranges"].items():
+        log.info(f"Range {label}: {data['count']} documents ({data['percentage']:.2f}%), "
+                 f"Total tokens: {data['total_tokens']}")
+    for name, value in report["percentiles"].items():
+        log.info(f"{name}: {value:.0f} tokens")
+    if "max" in report:
+        log.info(f"Largest: {report['max']['filename']} ({report['max']['token_count']} tokens)")
+    if "documents_above" in report:
+        above = report["documents_above"]
+        log.info(f"{len(above['documents'])} documents above {above['threshold']} tokens")
+
+# -------------------------------
+# Main Analysis
+# -------------------------------
+
+def collect_counts(file_paths, estimate=False, threshold=None):
+    """Collects exact or estimated counts. Returns the names, counts and the estimator model, if any."""
+    if not estimate:
+        return (*collect_token_counts(file_paths), None)
+
+    # Imported here because the estimator builds on this module
+    from WAAnalysis.token_estimator import estimate_token_counts
+    names, counts, exact, model = estimate_token_counts(file_paths, threshold)
+    return names, counts, model
+
+def analyze_token_distribution(directory=MD_DIR2, column="total", edges=DEFAULT_EDGES,
+                               threshold=None, output_file=None, estimate=False):
+    """
+    Counts the tokens of every markdown file in a directory and reports their distribution.
+
+    With estimate set, counts are predicted from byte statistics by the calibrated
+    estimator, and only files near the threshold are tokenized exactly.
+    """
+    markdown_files = sorted(Path(directory).glob("*.md"))
+    log.info(f"Found {len(markdown_files)} markdown files for token analysis.")
+
+    # Without a threshold, files near the top range edge are the ones counted exactly
+    names, counts, model = collect_counts(markdown_files, estimate, max(edges) if threshold is None else threshold)
+    report = distribution_report(names, counts, column, edges, threshold)
+    if model:
+        report["estimator"] = model
+    log_report(report)
+
+    if output_file:
+        write_json(output_file, report)
+        log.info(f"Token analysis results saved to {output_file}")
+    return report
+
+# -------------------------------
+# Main Execution
+# -------------------------------
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Report the token distribution of a directory of markdown files.")
+    parser.add_argument("--directory", type=Path, default=MD_DIR2)
+    parser.add_argument("--column", nargs="+", choices=COLUMNS, default=["total"], help="Columns to report on.")
+    parser.add_argument("--edges", nargs="+", type=int, default=list(DEFAULT_EDGES), help="Inclusive upper bounds of the ranges.")
+    parser.add_argument("--above", type=int, default=None, help="List documents above this many tokens.")
+    parser.add_argument("--output", type=Path, default=None, help="Write the reports to this JSON file.")
+    parser.add_argument("--estimate", action="store_true",
+                        help="Estimate counts from byte statistics, tokenizing only files near --above exactly.")
+    args = parser.parse_args()
+
+    if args.estimate and args.above is None:
+        # Triage against the chunking limit unless another threshold is given
+        from WAAnalysis.chunk_large_files import TOKEN_LIMIT
+        args.above = TOKEN_LIMIT
+
+    names, counts, model = collect_counts(sorted(args.directory.glob("*.md")), args.estimate, args.above)
+    reports = [distribution_report(names, counts, column, args.edges, args.above) for column in args.column]
+    for report in reports:
+        if model:
+            report["estimator"] = model
+        log_report(report)
+    if args.output:
+        write_json(args.output, reports)
@@ -0,0 +1,164 @@
+import random
+import logging
+from pathlib import Path
+import numpy as np
+from WAAnalysis.config import TOKEN_CACHE_FILE
+from WAAnalysis.token_cache import count_tokens_many
+from WAAnalysis.token_distribution import COLUMNS
+from WAAnalysis.utils import frontmatter_block
+
+# -------------------------------
+# Setup Logging
+# -------------------------------
+log = logging.getLogger(__name__)
+
+# -------------------------------
+# Estimator Config
+# -------------------------------
+# Files tokenized exactly to fit the estimator, and the share held out to measure its error
+ESTIMATOR_SAMPLE_SIZE = 200
+ESTIMATOR_HOLDOUT_FRACTION = 0.2
+ESTIMATOR_SEED = 0
+
+# Smallest relative error band around a threshold where files are counted exactly
+MIN_ERROR_MARGIN = 0.02
+
+# Byte classes used as features, each a set of byte values
+BYTE_CLASSES = {
+    "letters": b"ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz",
+    "digits": b"0123456789",
+    "spaces": b" \t",
+    "newlines": b"\r\n",
+    "punctuation": bytes(b for b in range(33, 127) if not chr(b).isalnum()),
+    "control": bytes(b for b in range(32) if b not in b"\t\r\n") + b"\x7f",
+    "multibyte_lead": bytes(range(192, 256)),
+    "multibyte_continuation": bytes(range(128, 192)),
+}
+
+# One-hot matrix mapping each byte value to its class, so a file's features are
+# its byte histogram multiplied by this matrix
+CLASS_MATRIX = np.zeros((256, len(BYTE_CLASSES)), dtype=np.float64)
+for column, byte_values in enumerate(BYTE_CLASSES.values()):
+    CLASS_MATRIX[list(byte_values), column] = 1.0
+
+# -------------------------------
+# Features
+# -------------------------------
+
+def byte_features(data):
+    """Returns the byte-class counts of a UTF-8 byte string, plus an intercept term."""
+    histogram = np.bincount(np.frombuffer(data, dtype=np.uint8), minlength=256)
+    return np.append(histogram @ CLASS_MATRIX, 1.0)
+
+def feature_matrix(blobs):
+    """Returns one row of byte features per byte string."""
+    if not blobs:
+        return np.zeros((0, len(BYTE_CLASSES) + 1))
+    return np.vstack([byte_features(data) for data in blobs])
+
+# -------------------------------
+# Fitting
+# -------------------------------
+
+def relative_errors(predicted, actual):
+    """Returns the absolute error of each prediction as a fraction of the exact count."""
+    return np.abs(predicted - actual) / np.maximum(actual, 1)
+
+def fit_estimator(features, exact_counts, holdout_fraction=ESTIMATOR_HOLDOUT_FRACTION, seed=ESTIMATOR_SEED):
+    """
+    Fits token count = features . coefficients by least squares.
+
+    The error bounds are measured on a held-out share of the sample before the
+    final fit over the whole sample, so they reflect files the model has not seen.
+    Returns the model as a dict of coefficients and error statistics.
+    """
+    features = np.asarray(features, dtype=np.float64)
+    exact_counts = np.asarray(exact_counts, dtype=np.float64)
+
+    order = np.random.default_rng(seed).permutation(len(exact_counts))
+    holdout_size = int(len(order) * holdout_fraction)
+    if holdout_size >= 5:
+        holdout, training = order[:holdout_size], order[holdout_size:]
+    else:
+        # Too few files to hold any out, so the in-sample error is reported instead
+        holdout = training = order
+
+    coefficients = np.linalg.lstsq(features[training], exact_counts[training], rcond=None)[0]
+    errors = relative_errors(features[holdout] @ coefficients, exact_counts[holdout])
+    coefficients = np.linalg.lstsq(features, exact_counts, rcond=None)[0]
+
+    return {
+        "coefficients": coefficients.tolist(),
+        "sample_size": len(exact_counts),
+        "holdout_size": len(holdout) if holdout is not training else 0,
+        "mean_error_pct": float(errors.mean() * 100) if len(errors) else 0.0,
+        "p95_error_pct": float(np.percentile(errors, 95) * 100) if len(errors) else 0.0,
+        "max_error_pct": float(errors.max() * 100) if len(errors) else 0.0,
+    }
+
+def predict(model, features):
+    """Returns the estimated token counts for rows of byte features."""
+    estimates = np.asarray(features) @ np.asarray(model["coefficients"])
+    return np.maximum(np.rint(estimates), 0).astype(np.int64)
+
+def calibrate(file_paths, sample_size=ESTIMATOR_SAMPLE_SIZE, seed=ESTIMATOR_SEED, cache_file=TOKEN_CACHE_FILE):
+    """Fits the estimator against exact token counts of a random sample of the files."""
+    file_paths = list(file_paths)
+    sample = random.Random(seed).sample(file_paths, min(sample_size, len(file_paths)))
+    blobs = [Path(file_path).read_bytes() for file_path in sample]
+
+    exact_counts = count_tokens_many([data.decode("utf-8", "replace") for data in blobs], cache_file=cache_file)
+    model = fit_estimator(feature_matrix(blobs), exact_counts, seed=seed)
+
+    log.info(f"Fitted token estimator on {model['sample_size']} files: mean error {model['mean_error_pct']:.1f}%, "
+             f"p95 {model['p95_error_pct']:.1f}%, max {model['max_error_pct']:.1f}%")
+    return model
+
+# -------------------------------
+# Estimation
+# -------------------------------
+
+def estimate_token_counts(file_paths, threshold=None, model=None, sample_size=ESTIMATOR_SAMPLE_SIZE,
+                          cache_file=TOKEN_CACHE_FILE):
+    """
+    Estimates the tokens of every file from its byte statistics, in the same
+    (names, counts) layout as token_distribution.collect_token_counts.
+
+    Files whose estimated total is within the model's largest held-out error of
+    the threshold are counted exactly. A file can only land on the wrong side of
+    the threshold if its estimate is further off than any held-out file's was.
+    Returns the names, the count array, a mask of exactly counted files and the model.
+    """
+    file_paths = list(file_paths)
+    if model is None:
+        model = calibrate(file_paths, sample_size, cache_file=cache_file)
+
+    names = []
+    blobs = []
+    for file_path in file_paths:
+        try:
+            blobs.append(Path(file_path).read_bytes())
+            names.append(Path(file_path).name)
+        except Exception as e:
+            log.error(f"Failed to process {Path(file_path).name}: {e}")
+
+    headers = [frontmatter_block(data) for data in blobs]
+    totals = predict(model, feature_matrix(blobs))
+    frontmatters = np.minimum(predict(model, feature_matrix(headers)), totals)
+    # Files without frontmatter have no frontmatter tokens, whatever the intercept says
+    frontmatters[[not header for header in headers]] = 0
+
+    exact = np.zeros(len(blobs), dtype=bool)
+    if threshold is not None:
+        margin = max(model["max_error_pct"] / 100, MIN_ERROR_MARGIN)
+        exact = np.abs(totals - threshold) <= totals * margin
+        indices = np.flatnonzero(exact)
+        texts = [blobs[i].decode("utf-8", "replace") for i in indices]
+        header_texts = [headers[i].decode("utf-8", "replace") for i in indices]
+        counts = count_tokens_many(texts + header_texts, cache_file=cache_file)
+        totals[indices] = counts[:len(indices)]
+        frontmatters[indices] = counts[len(indices):]
+        log.info(f"Counted {len(indices)} files near {threshold} tokens exactly.")
+
+    counts = np.column_stack([totals - frontmatters, frontmatters, totals]).reshape(-1, len(COLUMNS))
+    return names, counts, exact, model
@@ -0,0 +1,167 @@
+import copy
+import logging
+import argparse
+import yaml
+from functools import lru_cache, partial
+from pathlib import Path
+from WAAnalysis.config import MD_DIR, BATCH_OUTPUT_DIR
+from WAAnalysis.utils import split_frontmatter, dump_frontmatter, atomic_write
+from WAAnalysis.parallel import run_parallel
+from WAAnalysis.correct_roles import update_entity_relationships
+from WAAnalysis.convert_topics_to_tags import convert_topics_to_tags
+from WAAnalysis.update_tags_with_clusters import apply_cluster_tags, load_clustered_tags
+from WAAnalysis.clean_summaries import remove_duplicate_summaries
+from WAAnalysis.clean_yaml_frontmatter import sanitize_yaml_field
+
+# -------------------------------
+# Setup Logging
+# -------------------------------
+log = logging.getLogger(__name__)
+
+# -------------------------------
+# Transform Registry
+# -------------------------------
+# Each transform takes (frontmatter, body) for one file and returns the new
+# (frontmatter, body). The runner parses and writes the file, so transforms
+# never touch the filesystem and can be chained in any order. A header that is
+# not valid YAML is only handed, as raw text, to the YAML-cleaning transform,
+# which must then come first.
+TRANSFORMS = {}
+YAML_CLEANING_TRANSFORM = "clean_yaml_frontmatter"
+
+def register_transform(name):
+    """Registers a (frontmatter, body) transform under the given name."""
+    def decorator(func):
+        TRANSFORMS[name] = func
+        return func
+    return decorator
+
+@lru_cache(maxsize=None)
+def default_clusters():
+    """Loads the clustered tags once per process."""
+    return load_clustered_tags(BATCH_OUTPUT_DIR / 'clustered_tag_results.jsonl')
+
+@register_transform("correct_roles")
+def correct_roles_transform(frontmatter, body):
+    """Corrects names and roles in entity_relationships."""
+    entity_relationships = frontmatter.get('entity_relationships')
+    if entity_relationships:
+        frontmatter['entity_relationships'] = update_entity_relationships(entity_relationships)
+    return frontmatter, body
+
+@register_transform("convert_topics_to_tags")
+def convert_topics_to_tags_transform(frontmatter, body):
+    """Converts the 'topics' field into sluggified 'tags'."""
+    return convert_topics_to_tags(frontmatter), body
+
+@register_transform("update_tags_with_clusters")
+def update_tags_with_clusters_transform(frontmatter, body):
+    """Adds the evidence tag and cluster tags from the clustered tag results."""
+    return apply_cluster_tags(frontmatter, default_clusters()), body
+
+@register_transform("clean_summaries")
+def clean_summaries_transform(frontmatter, body):
+    """Removes duplicate ## Summary sections from the body."""
+    cleaned_body = remove_duplicate_summaries(body)
+    return frontmatter, body if cleaned_body is None else cleaned_body
+
+@register_transform(YAML_CLEANING_TRANSFORM)
+def clean_yaml_frontmatter_transform(frontmatter, body):
+    """
+    Sanitizes and parses a raw header that is not valid YAML; the runner then
+    writes it back as clean YAML. Parsed frontmatter is left unchanged.
+    """
+    if isinstance(frontmatter, str):
+        frontmatter = yaml.safe_load(sanitize_yaml_field(frontmatter)) or {}
+    return frontmatter, body
+
+# -------------------------------
+# Transform Runner
+# -------------------------------
+
+def check_transform_order(names):
+    """Raises ValueError unless the YAML-cleaning transform, if selected, comes first."""
+    if YAML_CLEANING_TRANSFORM in names[1:]:
+        raise ValueError(f"{YAML_CLEANING_TRANSFORM} must come first, as the other transforms need parsed YAML.")
+
+def parse_header(header, file_path, names):
+    """
+    Parses the raw frontmatter text. A header that is not valid YAML is returned
+    as raw text for the YAML-cleaning transform, or None if it is not selected.
+    """
+    try:
+        return yaml.safe_load(header) or {}
+    except yaml.YAMLError as e:
+        if names and names[0] == YAML_CLEANING_TRANSFORM:
+            log.warning(f"YAML parsing failed for {file_path}: {e}. Attempting to sanitize.")
+            return header
+        log.warning(f"YAML parsing failed for {file_path}: {e}. Skipping; run {YAML_CLEANING_TRANSFORM} first.")
+        return None
+
+def apply_transforms(file_path, names):
+    """
+    Applies the named transforms, in order, to a markdown file with one read and
+    at most one write. Returns True if the file was rewritten.
+    """
+    check_transform_order(names)
+    transforms = [TRANSFORMS[name] for name in names]
+
+    content = Path(file_path).read_bytes()
+    header, closing_offset = split_frontmatter(content)
+
+    if header is None:
+        frontmatter = {}
+        body = content.decode("utf-8")
+    else:
+        frontmatter = parse_header(header.decode("utf-8"), file_path, names)
+        if frontmatter is None:
+            return False
+        # The body starts after the closing delimiter line
+        body_offset = content.find(b"\n", closing_offset)
+        body = content[body_offset + 1:].decode("utf-8") if body_offset != -1 else ""
+
+    original_frontmatter = copy.deepcopy(frontmatter)
+    original_body = body
+
+    for transform in transforms:
+        frontmatter, body = transform(frontmatter, body)
+
+    if frontmatter == original_frontmatter and body == original_body:
+        return False
+
+    if header is None and not frontmatter:
+        atomic_write(file_path, body)
+    else:
+        atomic_write(file_path, f"---\n{dump_frontmatter(frontmatter)}\n---\n{body}")
+
+    log.info(f"Applied {', '.join(names)} to {file_path}")
+    return True
+
+def run_transforms(directory, names, workers=None):
+    """Applies the named transforms to every markdown file in the directory in a single pass."""
+    unknown = [name for name in names if name not in TRANSFORMS]
+    if unknown:
+        raise ValueError(f"Unknown transforms: {', '.join(unknown)}")
+    check_transform_order(names)
+
+    files = sorted(Path(directory).glob("*.md"))
+    results, errors = run_parallel(partial(apply_transforms, names=names), files, workers)
+    total_updated = sum(1 for updated in results if updated)
+
+    log.info(f"Total updated files: {total_updated}")
+    return total_updated
+
+# -------------------------------
+# Main Execution
+# -------------------------------
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Apply a chain of corpus fixes in one pass per file.")
+    parser.add_argument("transforms", nargs="+", choices=sorted(TRANSFORMS), help="Transforms to apply, in order.")
+    parser.add_argument("--directory", type=Path, default=MD_DIR, help="Directory of markdown files.")
+    parser.add_argument("--workers", type=int, default=None, help="Number of worker processes.")
+    args = parser.parse_args()
+
+    log.info(f"Starting transforms: {', '.join(args.transforms)}")
+    run_transforms(args.directory, args.transforms, args.workers)
+    log.info("Finished applying transforms.")
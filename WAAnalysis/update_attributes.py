@@ -3,6 +3,7 @@ import yaml
 from pathlib import Path
 from datetime import datetime
 import logging
+from WAAnalysis.parallel import run_parallel
 
 # Setup logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -46,12 +47,11 @@ def update_file_timestamps(file_path):
     except Exception as e:
         logging.error(f"Error processing {file_path.name}: {e}", exc_info=True)
 
-def process_files_in_directory(directory):
+def process_files_in_directory(directory, workers=None):
     """
     Process all markdown files in the directory and update their timestamps.
     """
-    for md_file in directory.glob("*.md"):
-        update_file_timestamps(md_file)
+    run_parallel(update_file_timestamps, sorted(directory.glob("*.md")), workers)
 
 if __name__ == "__main__":
     # Process all files in the specified directory
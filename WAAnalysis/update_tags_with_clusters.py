@@ -1,9 +1,11 @@
 import logging
-import json
 import re
+from functools import partial
 from pathlib import Path
-from WAAnalysis.utils import load_markdown, update_markdown_frontmatter
+from WAAnalysis.utils import rewrite_markdown_frontmatter
 from WAAnalysis.config import MD_DIR, BATCH_OUTPUT_DIR
+from WAAnalysis.parallel import run_parallel
+from WAAnalysis.json_codec import iter_jsonl, loads, JSONDecodeError
 
 # -------------------------------
 # Setup Logging
@@ -24,17 +26,16 @@ def add_evidence_tag(tags):
 
 def map_existing_tags_to_clusters(existing_tags, clusters):
     """Map the existing tags in the markdown file to the clusters from the JSONL result."""
-    new_tags = set(existing_tags)  # Use a set to avoid duplicates
+    # Use an insertion-ordered dict to avoid duplicates while keeping the tag order stable
+    new_tags = dict.fromkeys(existing_tags)
     for cluster in clusters:
         for tag in cluster['tags']:
             if slugify(tag) in existing_tags:
-                new_tags.add(slugify(cluster['cluster_name']))
+                new_tags[slugify(cluster['cluster_name'])] = None
     return list(new_tags)
 
-def update_markdown_tags(file, clusters):
-    """Update the markdown file's frontmatter tags with the cluster mappings."""
-    frontmatter, body = load_markdown(file)
-    
+def apply_cluster_tags(frontmatter, clusters):
+    """Adds the evidence tag and cluster tags to the frontmatter's tags."""
     # Get existing tags from frontmatter or initialize an empty list
     existing_tags = frontmatter.get('tags', [])
 
@@ -42,12 +43,13 @@ def update_markdown_tags(file, clusters):
     add_evidence_tag(existing_tags)
     
     # Map existing tags to clusters and update tags
-    updated_tags = map_existing_tags_to_clusters(existing_tags, clusters)
-    frontmatter['tags'] = updated_tags
+    frontmatter['tags'] = map_existing_tags_to_clusters(existing_tags, clusters)
+    return frontmatter
 
-    # Update the markdown frontmatter with new tags
-    update_markdown_frontmatter(file, frontmatter)
-    log.info(f"Updated tags for {file}")
+def update_markdown_tags(file, clusters):
+    """Update the markdown file's frontmatter tags with the cluster mappings."""
+    if rewrite_markdown_frontmatter(file, lambda frontmatter: apply_cluster_tags(frontmatter, clusters)):
+        log.info(f"Updated tags for {file}")
 
 # -------------------------------
 # Load Clustered Tags from JSONL
@@ -55,28 +57,26 @@ def update_markdown_tags(file, clusters):
 def load_clustered_tags(jsonl_file):
     """Load the clustered tags from the JSONL file, handling markdown."""
     clusters = []
-    with open(jsonl_file, 'r') as f:
-        for line in f:
-            data = json.loads(line)
-            response_content = data['response']['body']['choices'][0]['message']['content']
+    for data in iter_jsonl(jsonl_file):
+        response_content = data['response']['body']['choices'][0]['message']['content']
 
-            # Remove Markdown code block markers (```json ... ```)
-            json_content = re.sub(r'```json|```', '', response_content).strip()
+        # Remove Markdown code block markers (```json ... ```)
+        json_content = re.sub(r'```json|```', '', response_content).strip()
 
-            # Parse the JSON content
-            try:
-                cluster_data = json.loads(json_content)
-                clusters.extend(cluster_data['clusters'])
-            except json.JSONDecodeError as e:
-                log.error(f"Failed to parse JSON content: {e}")
-                continue
+        # Parse the JSON content
+        try:
+            cluster_data = loads(json_content)
+            clusters.extend(cluster_data['clusters'])
+        except JSONDecodeError as e:
+            log.error(f"Failed to parse JSON content: {e}")
+            continue
     
     return clusters
 
 # -------------------------------
 # Process Markdown Files to Update Tags with Clusters
 # -------------------------------
-def process_markdown_for_clusters():
+def process_markdown_for_clusters(workers=None):
     """Iterate over markdown files and update the 'tags' with clustered tags."""
     md_files = [f for f in MD_DIR.iterdir() if f.suffix == '.md']
     jsonl_file = BATCH_OUTPUT_DIR / 'clustered_tag_results.jsonl'
@@ -86,9 +86,7 @@ def process_markdown_for_clusters():
     log.info(f"Loaded clusters from {jsonl_file}")
 
     # Process each markdown file
-    for file in md_files:
-        log.info(f"Processing file: {file}")
-        update_markdown_tags(file, clusters)
+    run_parallel(partial(update_markdown_tags, clusters=clusters), sorted(md_files), workers)
 
 if __name__ == "__main__":
     log.info("Starting process to update markdown tags with clusters.")
@@ -0,0 +1,163 @@
+import logging
+import argparse
+from collections import defaultdict
+from pathlib import Path
+from WAAnalysis.config import BATCH_OUTPUT_DIR, BATCH_TRACKING_FILE
+from WAAnalysis.json_codec import iter_jsonl, read_json, write_json
+from WAAnalysis.pricing import pricing_model, model_costs
+from WAAnalysis.batch_sharder import results_job_type
+
+# -------------------------------
+# Setup Logging
+# -------------------------------
+log = logging.getLogger(__name__)
+
+# -------------------------------
+# Batch Jobs
+# -------------------------------
+
+def load_batch_jobs(tracking_file=BATCH_TRACKING_FILE):
+    """Returns the tracked batch jobs keyed by the name of their output file."""
+    if not Path(tracking_file).exists():
+        return {}
+    return {Path(job["output_file"]).name: job for job in read_json(tracking_file)["jobs"] if job.get("output_file")}
+
+def output_files(output_dir=BATCH_OUTPUT_DIR, tracking_file=BATCH_TRACKING_FILE):
+    """
+    Lists the batch output files to read, leaving out results files stitched
+    together from shard outputs, whose lines are already in the shard outputs.
+    """
+    stitched = set()
+    if Path(tracking_file).exists():
+        stitched = {job["stitched_into"] for job in read_json(tracking_file)["jobs"] if job.get("stitched_into")}
+    return [file_path for file_path in sorted(Path(output_dir).glob("*.jsonl")) if file_path.name not in stitched]
+
+def job_type_for_output(file_path, jobs):
+    """Names the job type of a batch output file, from the tracking file or the file name."""
+    job = jobs.get(Path(file_path).name)
+    if job:
+        return job["job_type"]
+    return results_job_type(file_path) or Path(file_path).stem
+
+# -------------------------------
+# Usage Aggregation
+# -------------------------------
+
+def new_usage():
+    """Returns empty usage totals for one job type and model."""
+    return {"requests": 0, "failed": 0, "truncated": 0, "prompt_tokens": 0, "completion_tokens": 0}
+
+def add_result(groups, job_type, result):
+    """Adds one batch output line's usage to its (job_type, model) totals."""
+    response = result.get("response") or {}
+    body = response.get("body") or {}
+    usage = groups[(job_type, body.get("model"))]
+    usage["requests"] += 1
+
+    if result.get("error") or response.get("status_code") != 200:
+        usage["failed"] += 1
+        return
+
+    tokens = body.get("usage") or {}
+    usage["prompt_tokens"] += tokens.get("prompt_tokens", 0)
+    usage["completion_tokens"] += tokens.get("completion_tokens", 0)
+    if any(choice.get("finish_reason") == "length" for choice in body.get("choices", [])):
+        usage["truncated"] += 1
+
+def aggregate_output_file(file_path, job_type, groups=None):
+    """Streams a batch output file and adds its usage to groups, keyed by (job_type, model)."""
+    groups = defaultdict(new_usage) if groups is None else groups
+    for result in iter_jsonl(file_path):
+        add_result(groups, job_type, result)
+    return groups
+
+def batch_throughput(file_path, job, groups):
+    """Returns the tokens, wall time and tokens per hour of one batch, where the tracking file timed it."""
+    tokens = sum(usage["prompt_tokens"] + usage["completion_tokens"] for usage in groups.values())
+    summary = {"file": Path(file_path).name, "batch_id": job.get("batch_id"), "tokens": tokens,
+               "wall_hours": None, "tokens_per_hour": None}
+    if job.get("created_at") and job.get("completed_at"):
+        wall_hours = (job["completed_at"] - job["created_at"]) / 3600
+        summary["wall_hours"] = round(wall_hours, 2)
+        summary["tokens_per_hour"] = round(tokens / wall_hours) if wall_hours > 0 else None
+    return summary
+
+# -------------------------------
+# Report
+# -------------------------------
+
+def usage_row(job_type, model, usage):
+    """Returns a report row with the realized batch cost and truncation rate of a group."""
+    costs = None
+    if pricing_model(model) is not None:
+        costs = model_costs(model, usage["prompt_tokens"], usage["completion_tokens"])
+    else:
+        log.warning(f"No pricing for model {model}; its {usage['requests']} results are not costed.")
+    succeeded = usage["requests"] - usage["failed"]
+    truncation_rate = round(usage["truncated"] / succeeded, 4) if succeeded else 0.0
+    return {"job_type": job_type, "model": model, **usage, "truncation_rate": truncation_rate, "costs": costs}
+
+def usage_report(output_dir=BATCH_OUTPUT_DIR, tracking_file=BATCH_TRACKING_FILE):
+    """
+    Aggregates the token usage that every batch output file actually billed, by
+    job type and model, with the realized batch cost, the share of responses
+    cut off at max_tokens and each batch's throughput.
+    """
+    jobs = load_batch_jobs(tracking_file)
+    groups = defaultdict(new_usage)
+    batches = []
+
+    for file_path in output_files(output_dir, tracking_file):
+        try:
+            file_groups = aggregate_output_file(file_path, job_type_for_output(file_path, jobs))
+        except Exception as e:
+            log.error(f"Failed to read {file_path.name}: {e}")
+            continue
+        for key, usage in file_groups.items():
+            for field, value in usage.items():
+                groups[key][field] += value
+        batches.append(batch_throughput(file_path, jobs.get(file_path.name, {}), file_groups))
+
+    rows = [usage_row(job_type, model, usage)
+            for (job_type, model), usage in sorted(groups.items(), key=lambda item: (item[0][0], str(item[0][1])))]
+    return {
+        "groups": rows,
+        "total_cost_batch": round(sum(row["costs"]["total_cost_batch"] for row in rows if row["costs"]), 2),
+        "batches": batches,
+    }
+
+def log_usage_report(report):
+    """Logs usage and cost per job type and model, then throughput per batch."""
+    log.info(f"{'Job Type':<15} {'Model':<25} {'Requests':>9} {'Prompt':>12} {'Completion':>12} "
+             f"{'Truncated':>10} {'Batch Cost':>11}")
+    log.info("-" * 100)
+    for row in report["groups"]:
+        cost = f"${row['costs']['total_cost_batch']:.2f}" if row["costs"] else "n/a"
+        log.info(f"{row['job_type']:<15} {str(row['model']):<25} {row['requests']:>9} {row['prompt_tokens']:>12} "
+                 f"{row['completion_tokens']:>12} {row['truncation_rate']:>10.1%} {cost:>11}")
+        if row["failed"]:
+            log.warning(f"{row['failed']} {row['job_type']} requests on {row['model']} failed.")
+    log.info(f"Total batch cost: ${report['total_cost_batch']:.2f}")
+
+    for batch in report["batches"]:
+        if batch["tokens_per_hour"] is not None:
+            log.info(f"{batch['file']}: {batch['tokens']} tokens in {batch['wall_hours']}h "
+                     f"({batch['tokens_per_hour']} tokens/hour)")
+        else:
+            log.info(f"{batch['file']}: {batch['tokens']} tokens (no batch timing recorded)")
+
+# -------------------------------
+# Main Execution
+# -------------------------------
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Report the usage, cost and throughput of completed batches.")
+    parser.add_argument("--directory", type=Path, default=BATCH_OUTPUT_DIR)
+    parser.add_argument("--output", type=Path, default=None, help="Write the report to this JSON file.")
+    args = parser.parse_args()
+
+    report = usage_report(args.directory)
+    log_usage_report(report)
+    if args.output:
+        write_json(args.output, report)
+        log.info(f"Usage report saved to {args.output}")
@@ -1,13 +1,16 @@
 import re
-import json
 import pytz
 import subprocess
 import os
+import shutil
+import uuid
 import logging
 from pathlib import Path
 from jsonschema import validate, ValidationError
 from datetime import datetime
 from WAAnalysis.config import SGT, PARTICIPANT_MAPPING, ERROR_LOGS_DIRECTORY, DEBUG
+from WAAnalysis.parallel import run_parallel
+from WAAnalysis.json_codec import dumps, loads, read_json, JSONDecodeError
 import yaml  # For working with frontmatter in markdown files
 
 # -------------------------------
@@ -42,6 +45,44 @@ def sanitize_yaml_frontmatter(frontmatter):
             sanitized_lines.append(line)
     return "\n".join(sanitized_lines)
 
+def parse_frontmatter(frontmatter, file_path=None):
+    """Parses raw YAML frontmatter text, sanitizing it once if the first parse fails."""
+    try:
+        # First attempt to load the frontmatter normally
+        return yaml.safe_load(frontmatter.strip())
+    except yaml.YAMLError as e:
+        # If there's an error in the YAML parsing, sanitize the frontmatter and try again
+        logging.warning(f"YAML parsing error in file {file_path}: {e}. Attempting to sanitize frontmatter.")
+        sanitized_frontmatter = sanitize_yaml_frontmatter(frontmatter.strip())
+        return yaml.safe_load(sanitized_frontmatter)
+
+def read_frontmatter(file_path):
+    """
+    Reads only the YAML frontmatter of a markdown file.
+
+    Lines are read from the start of the file up to the closing `---` delimiter,
+    so the body is never loaded. Returns an empty dict if the file has no frontmatter.
+    """
+    try:
+        with open(file_path, 'r') as f:
+            if f.readline().rstrip() != "---":
+                return {}
+
+            lines = []
+            for line in f:
+                if line.rstrip() == "---":
+                    break
+                lines.append(line)
+            else:
+                log.warning(f"Unterminated frontmatter in {file_path}.")
+                return {}
+
+        return parse_frontmatter("".join(lines), file_path) or {}
+
+    except FileNotFoundError as e:
+        logging.error(f"Markdown file not found: {file_path} - {e}")
+        return {}
+
 def load_markdown(file_path):
     """Reads a markdown file and splits the frontmatter and body content."""
     try:
@@ -50,14 +91,7 @@ def load_markdown(file_path):
 
         if content.startswith("---"):
             frontmatter, body = content.split('---', 2)[1:]
-            try:
-                # First attempt to load the frontmatter normally
-                frontmatter = yaml.safe_load(frontmatter.strip())
-            except yaml.YAMLError as e:
-                # If there's an error in the YAML parsing, sanitize the frontmatter and try again
-                logging.warning(f"YAML parsing error in file {file_path}: {e}. Attempting to sanitize frontmatter.")
-                sanitized_frontmatter = sanitize_yaml_frontmatter(frontmatter.strip())
-                frontmatter = yaml.safe_load(sanitized_frontmatter)
+            frontmatter = parse_frontmatter(frontmatter, file_path)
         else:
             frontmatter = {}
             body = content
@@ -68,6 +102,89 @@ def load_markdown(file_path):
         logging.error(f"Markdown file not found: {file_path} - {e}")
         return {}, ""
 
+def dump_frontmatter(frontmatter):
+    """Serializes frontmatter to the YAML header text written between the `---` delimiters."""
+    return yaml.dump(frontmatter, default_flow_style=False).strip()
+
+def split_frontmatter(content):
+    """
+    Locates the frontmatter block in raw markdown bytes or text.
+
+    Returns a tuple of the header between the delimiters and the offset at which
+    the closing `---` line starts, or (None, 0) if the content has no frontmatter.
+    """
+    newline, delimiter = (b"\n", b"---") if isinstance(content, bytes) else ("\n", "---")
+    first_line_end = content.find(newline)
+    if first_line_end == -1 or content[:first_line_end].rstrip() != delimiter:
+        return None, 0
+
+    search_from = first_line_end
+    while True:
+        closing = content.find(newline + delimiter, search_from)
+        if closing == -1:
+            return None, 0
+        line_end = closing + 4
+        if not content[line_end:line_end + 1].strip():
+            return content[first_line_end + 1:closing + 1], closing + 1
+        search_from = line_end
+
+def atomic_write(file_path, data):
+    """
+    Writes data to a file through a temporary file in the same directory and an
+    atomic rename, so readers never see a partially written file.
+    """
+    file_path = Path(file_path)
+    if isinstance(data, str):
+        data = data.encode("utf-8")
+
+    tmp_path = file_path.with_name(f".{file_path.name}.{os.getpid()}.{uuid.uuid4().hex}.tmp")
+    fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o666)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        if file_path.exists():
+            shutil.copymode(file_path, tmp_path)
+        os.replace(tmp_path, file_path)
+    except BaseException:
+        tmp_path.unlink(missing_ok=True)
+        raise
+
+def rewrite_markdown_frontmatter(file_path, update):
+    """
+    Applies `update` to the frontmatter of a markdown file with a single read.
+
+    The new header is spliced onto the original body bytes, which are written back
+    untouched. The write is skipped when the serialized header is unchanged.
+
+    Args:
+        file_path (Path): Path to the markdown file.
+        update (callable): Receives the parsed frontmatter dict and returns the new one.
+
+    Returns:
+        bool: True if the file was rewritten, False if the header was unchanged.
+    """
+    content = Path(file_path).read_bytes()
+    header, closing_offset = split_frontmatter(content)
+
+    if header is None:
+        old_header = None
+        frontmatter = {}
+        tail = b"---\n\n" + content
+    else:
+        old_header = header.decode("utf-8").strip()
+        frontmatter = parse_frontmatter(old_header, file_path) or {}
+        tail = content[closing_offset:]
+
+    new_header = dump_frontmatter(update(frontmatter))
+    if new_header == old_header:
+        log.debug(f"Frontmatter unchanged for {file_path}, skipping write.")
+        return False
+
+    atomic_write(file_path, b"---\n" + new_header.encode("utf-8") + b"\n" + tail)
+    return True
+
 def update_markdown_frontmatter(file_path, frontmatter, body=None):
     """
     Writes the frontmatter and body back to the markdown file. If the body is None, 
@@ -79,18 +196,15 @@ def update_markdown_frontmatter(file_path, frontmatter, body=None):
         body (str, optional): The body of the markdown file. If not provided, the existing body remains unchanged.
     """
     try:
-        # If body is not provided, load the existing body from the file
+        # If body is not provided, splice the new frontmatter onto the existing body
         if body is None:
-            existing_frontmatter, body = load_markdown(file_path)
-            if not body:
-                log.error(f"Body content could not be retrieved for {file_path}.")
-                return
-
-        with open(file_path, 'w') as f:
-            # Dump the frontmatter into YAML format
-            new_frontmatter = yaml.dump(frontmatter, default_flow_style=False).strip()
-            # Write both the frontmatter and the body back to the file
-            f.write(f"---\n{new_frontmatter}\n---\n\n{body}\n")
+            if rewrite_markdown_frontmatter(file_path, lambda _: frontmatter):
+                log.info(f"Updated frontmatter for {file_path}")
+            return
+
+        # Write both the frontmatter and the body back to the file
+        new_frontmatter = dump_frontmatter(frontmatter)
+        atomic_write(file_path, f"---\n{new_frontmatter}\n---\n\n{body}\n")
         
         log.info(f"Updated frontmatter for {file_path}")
     
@@ -99,15 +213,27 @@ def update_markdown_frontmatter(file_path, frontmatter, body=None):
 
 
 
+def is_unchanged(entry, stat):
+    """Checks whether a manifest entry still matches the file's size and modification time."""
+    return bool(entry) and entry["size"] == stat.st_size and entry["mtime_ns"] == stat.st_mtime_ns
+
 def save_to_json(data, file_path):
     """Saves data to a JSON file."""
     try:
         with open(file_path, 'w') as json_file:
-            json.dump(data, json_file, indent=4)
+            json_file.write(dumps(data, pretty=True))
         log.info(f"Saved data to {file_path}")
     except Exception as e:
         log.error(f"Failed to save data to {file_path}: {e}")
 
+def load_json_file(file_path):
+    """Loads data from a JSON file, returning None if it is missing or invalid."""
+    try:
+        return read_json(file_path)
+    except (OSError, JSONDecodeError) as e:
+        log.error(f"Failed to load data from {file_path}: {e}")
+        return None
+
 # -------------------------------
 # Directory Management
 # -------------------------------
@@ -153,18 +279,43 @@ def calculate_time_to_read(timestamp_received, timestamp_read):
 # Conversation and Message Utilities
 # -------------------------------
 
+# Timestamp lines ("  06:30 PM") and attachment lines ("  Attached: IMG_0001.jpg")
+# written by generate_markdown_for_day, matched in a single pass
+CONVERSATION_NOISE_PATTERN = re.compile(
+    r'^[ \t]*(?:\d{2}:\d{2} [AP]M|Attached: [^\n]*)[ \t]*(?:\n|\Z)',
+    re.MULTILINE
+)
+
+def frontmatter_block(document):
+    """
+    Returns the frontmatter of a document (str or bytes), including its delimiter
+    lines, or an empty string if it has none.
+    """
+    header, closing_offset = split_frontmatter(document)
+    if header is None:
+        return document[:0]
+    line_end = document.find(b"\n" if isinstance(document, bytes) else "\n", closing_offset)
+    return document if line_end == -1 else document[:line_end + 1]
+
+def strip_frontmatter(document):
+    """Returns the document without its leading frontmatter block, cut by offset."""
+    return document[len(frontmatter_block(document)):]
+
 def clean_conversation(document):
     """Cleans the conversation text by removing frontmatter, timestamps, etc."""
     try:
-        # Remove frontmatter
-        clean_doc = re.sub(r'---[\s\S]*?---', '', document).strip()
-        # Remove timestamps (12-hour format)
-        clean_doc = re.sub(r'\d{2}:\d{2} [APM]{2}', '', clean_doc).strip()
-        return clean_doc
+        # Remove frontmatter, then timestamp and attachment lines in one pass
+        clean_doc = CONVERSATION_NOISE_PATTERN.sub('', strip_frontmatter(document))
+        return clean_doc.strip()
     except Exception as e:
         log.error(f"Failed to clean conversation: {e}")
         return document
 
+def clean_conversations(documents, workers=None):
+    """Cleans a batch of conversation texts in parallel, returning them in input order."""
+    results, errors = run_parallel(clean_conversation, documents, workers, description="documents")
+    return results
+
 def format_as_quote(message_text):
     """Formats multi-line message as a quoted block."""
     lines = message_text.splitlines()
@@ -240,8 +391,7 @@ def fetch_replied_message(cursor, replied_to_message_id):
 def load_schema(schema_path):
     """Loads a JSON schema from a file."""
     try:
-        with open(schema_path, 'r') as schema_file:
-            return json.load(schema_file)
+        return read_json(schema_path)
     except Exception as e:
         log.error(f"Failed to load schema from {schema_path}: {e}")
         return None
@@ -290,10 +440,10 @@ def validate_output(output):
 def parse_response(response):
     """Parses and validates the response from the API."""
     try:
-        parsed_output = json.loads(response)
+        parsed_output = loads(response)
         if validate_output(parsed_output):
             return parsed_output
-    except (json.JSONDecodeError, ValueError, TypeError) as e:
+    except (JSONDecodeError, ValueError, TypeError) as e:
         log.error(f"Error parsing response: {e}")
         return None
 
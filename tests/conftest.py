@@ -0,0 +1,18 @@
+import pytest
+import WAAnalysis.token_cache as token_cache
+
+class WordEncoding:
+    """Stand-in encoding that treats each word as a token and records every text it encodes."""
+    def __init__(self):
+        self.calls = []
+
+    def encode_ordinary_batch(self, texts, num_threads=1):
+        self.calls.extend(texts)
+        return [text.split() for text in texts]
+
+@pytest.fixture
+def word_tokens(monkeypatch):
+    """Counts tokens with a WordEncoding in place of tiktoken, and returns it."""
+    encoding = WordEncoding()
+    monkeypatch.setattr(token_cache, "get_encoding", lambda encoding_name: encoding)
+    return encoding
@@ -0,0 +1,65 @@
+import asyncio
+from types import SimpleNamespace
+import WAAnalysis.crons.batch_poller as batch_poller
+from WAAnalysis.crons.batch_poller import next_interval, check_batch
+from WAAnalysis.config import POLL_MIN_INTERVAL, POLL_MAX_INTERVAL
+from WAAnalysis.json_codec import read_json, write_json
+
+class FakeStream:
+    """Stand-in for a streamed file download."""
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        return False
+
+    async def iter_bytes(self):
+        for chunk in (b'{"custom_id": "a.md"}\n', b'{"custom_id": "b.md"}\n'):
+            yield chunk
+
+def fake_client(batch):
+    """Stand-in AsyncOpenAI client that returns one batch and streams its output."""
+    async def retrieve(batch_id):
+        return batch
+    return SimpleNamespace(batches=SimpleNamespace(retrieve=retrieve),
+                           files=SimpleNamespace(with_streaming_response=SimpleNamespace(content=lambda file_id: FakeStream())))
+
+def batch(status, completed=0, total=100):
+    return SimpleNamespace(status=status, request_counts=SimpleNamespace(completed=completed, failed=0, total=total),
+                           output_file_id="file-1", created_at=100, in_progress_at=110, completed_at=4000)
+
+# Test that checks follow the estimated remaining time, and back off when a batch makes no progress
+def test_next_interval():
+    assert next_interval("finalizing", 100, 100, 90, 60, 300) == POLL_MIN_INTERVAL
+    assert next_interval("in_progress", 50, 100, 40, 100, 60) == 125
+    assert next_interval("in_progress", 40, 100, 40, 100, 60) == 120
+    assert next_interval("in_progress", 0, 100, None, 0, POLL_MAX_INTERVAL) == POLL_MAX_INTERVAL
+
+# Test that an open batch is rescheduled and a completed one is streamed to disk and marked in the tracking file
+def test_check_batch(tmp_path, monkeypatch):
+    tracking_file = tmp_path / "tracking.json"
+    monkeypatch.setattr(batch_poller, "BATCH_OUTPUT_DIR", tmp_path)
+    monkeypatch.setattr(batch_poller, "BATCH_TRACKING_FILE", tracking_file)
+    monkeypatch.setattr(batch_poller, "ingest_batch_output", lambda batch_id, output_file: 0)
+    job = {"filename": "topics_batch.jsonl", "job_type": "topics", "batch_id": "batch_1", "completed": False}
+    write_json(tracking_file, {"jobs": [job]})
+    schedule = {}
+
+    async def check(status):
+        return await check_batch(fake_client(batch(status, completed=100)), job, schedule,
+                                 asyncio.Semaphore(2), asyncio.Lock())
+
+    assert asyncio.run(check("in_progress")) is False
+    assert schedule["batch_1"]["done"] == 100
+
+    assert asyncio.run(check("completed")) is True
+    assert (tmp_path / "batch_1_output.jsonl").read_text().count("custom_id") == 2
+    tracked = read_json(tracking_file)["jobs"][0]
+    assert tracked["completed"] and tracked["completed_at"] == 4000
+    assert "batch_1" not in schedule
+
+    # A failed batch still has its partial output saved, and is recorded with its terminal status
+    write_json(tracking_file, {"jobs": [job]})
+    assert asyncio.run(check("failed")) is True
+    tracked = read_json(tracking_file)["jobs"][0]
+    assert tracked["status"] == "failed" and not tracked["completed"] and tracked["output_file"]
@@ -0,0 +1,122 @@
+from functools import partial
+from WAAnalysis import batch_result_processor, utils
+from WAAnalysis.batch_result_processor import document_data_for
+from WAAnalysis.json_codec import dumps, write_jsonl
+from WAAnalysis.request_packer import pack_requests, pack_document_requests, write_retry_requests, load_retry_requests
+from WAAnalysis.utils import load_markdown
+
+real_write = utils.atomic_write
+
+ANALYSIS = {
+    "topics": ["family time"],
+    "entities": [{"person": "Jason", "role": "father", "relationships": ["defends his work"]}],
+    "sentiment": {"sentiment": "Negative", "polarity": -0.6, "subjectivity": 0.8},
+    "key_points": ["Jason defends his work commitments."],
+}
+
+# Test that a combined analysis response fills the same fields as the four per-field responses
+def test_document_data_for_analysis():
+    per_field = {}
+    per_field.update(document_data_for("topics", {"topics": ANALYSIS["topics"]}))
+    per_field.update(document_data_for("entities", {"entities": ANALYSIS["entities"]}))
+    per_field.update(document_data_for("sentiment", ANALYSIS["sentiment"]))
+    per_field.update(document_data_for("key_points", {"key_points": ANALYSIS["key_points"]}))
+
+    assert document_data_for("analysis", ANALYSIS) == per_field
+    assert per_field["overall_sentiment"]["polarity"] == -0.6
+
+def result(custom_id, content):
+    return {"custom_id": custom_id, "response": {"status_code": 200,
+                                                 "body": {"choices": [{"message": {"content": dumps(content)}}]}}}
+
+# Test that joined processing writes each markdown file once, with the same frontmatter as sequential processing,
+# across results files of every submission
+def test_process_results_joined_matches_sequential(tmp_path, monkeypatch):
+    output_dir = tmp_path / "output"
+    output_dir.mkdir()
+    write_jsonl(output_dir / "topics_results.jsonl", [result("2024-01-01.md", {"topics": ANALYSIS["topics"]})])
+    write_jsonl(output_dir / "topics_20240301T120000_results.jsonl", [result("2024-01-02.md", {"topics": ["work"]})])
+    write_jsonl(output_dir / "sentiment_results.jsonl", [result("2024-01-01.md", ANALYSIS["sentiment"])])
+    write_jsonl(output_dir / "entities_results.jsonl", [result("2024-01-01.md", {"entities": ANALYSIS["entities"]})])
+
+    frontmatters = {}
+    for mode in ("sequential", "joined"):
+        md_dir = tmp_path / mode
+        md_dir.mkdir()
+        for day in ("2024-01-01", "2024-01-02"):
+            (md_dir / f"{day}.md").write_text(f"---\ndate: '{day}'\n---\n\nHello\n")
+        monkeypatch.setattr(batch_result_processor, "MD_DIR", md_dir)
+        monkeypatch.setattr(batch_result_processor, "load_packs", lambda: {})
+
+        writes = []
+        monkeypatch.setattr(utils, "atomic_write", lambda path, data: (writes.append(path), real_write(path, data)))
+        if mode == "sequential":
+            batch_result_processor.process_results(output_dir)
+            assert len(writes) == 4
+        else:
+            batch_result_processor.process_results_joined(output_dir, workers=1)
+            assert len(writes) == 2
+        frontmatters[mode] = [load_markdown(md_dir / f"{day}.md") for day in ("2024-01-01", "2024-01-02")]
+
+    assert frontmatters["joined"] == frontmatters["sequential"]
+    assert frontmatters["joined"][0][0]["overall_sentiment"]["polarity"] == -0.6
+
+# Test that part sentiments are weighted by tokens, re-merging a part replaces it, and list order is kept
+def test_merge_continuation_parts(monkeypatch):
+    monkeypatch.setattr(batch_result_processor, "part_tokens", {"d_part_1.md": 300, "d_part_2.md": 100}.get)
+    frontmatter = {"topics": ["work"]}
+    part_1 = {"topics": ["school", "work"], "sentiment": {"sentiment": "Positive", "polarity": 0.4, "subjectivity": 0.2}}
+    part_2 = {"topics": ["dinner"], "sentiment": {"sentiment": "Negative", "polarity": -0.8, "subjectivity": 0.6}}
+
+    for custom_id, result in [("d_part_1.md", part_1), ("d_part_2.md", part_2), ("d_part_2.md", part_2)]:
+        for batch_type in ("topics", "sentiment"):
+            content = result if batch_type == "topics" else result["sentiment"]
+            batch_result_processor.merge_frontmatter(frontmatter,
+                                                     document_data_for(batch_type, content, custom_id))
+
+    assert frontmatter["topics"] == ["work", "school", "dinner"]
+    sentiment = frontmatter["overall_sentiment"]
+    assert (sentiment["sentiment"], sentiment["polarity"], sentiment["subjectivity"]) == ("Neutral", 0.1, 0.3)
+
+def request(custom_id, text):
+    return {"custom_id": custom_id, "method": "POST", "url": "/v1/chat/completions",
+            "body": {"model": "gpt-4o-mini", "max_tokens": 300,
+                     "messages": [{"role": "system", "content": "Extract the topics."},
+                                  {"role": "user", "content": text}]}}
+
+# Test that a document missing from a packed response is queued with its original request and then sent on its own
+def test_unpack_failure_queues_original_request(word_tokens, tmp_path, monkeypatch):
+    requests_dir = tmp_path / "pack_requests"
+    monkeypatch.setattr(batch_result_processor, "pack_document_requests",
+                        partial(pack_document_requests, requests_dir=requests_dir))
+    monkeypatch.setattr(batch_result_processor, "write_retry_requests",
+                        partial(write_retry_requests, output_dir=tmp_path))
+    updated = []
+    monkeypatch.setattr(batch_result_processor, "update_document",
+                        lambda custom_id, batch_type, content: updated.append(custom_id))
+    requests = [request("a.md", "first chat"), request("b.md", "second chat")]
+
+    packed = pack_requests(requests, "topics", tmp_path / "packs.json", cache_file=None, requests_dir=requests_dir)
+    pack_id = packed[0]["custom_id"]
+    packs = {pack_id: {"job_type": "topics", "documents": ["a.md", "b.md"]}}
+
+    retries = batch_result_processor.process_batch_result(
+        [result(pack_id, {"a.md": {"topics": ["x"]}})], "topics", packs)
+
+    assert updated == ["a.md"] and retries == [(pack_id, "b.md")]
+    assert load_retry_requests("topics", tmp_path) == [requests[1]]
+
+    repacked = pack_requests(requests, "topics", tmp_path / "packs.json", cache_file=None,
+                             requests_dir=requests_dir, unpacked_ids={"b.md"})
+    assert repacked == requests
+
+# Test that cached results that do not parse as a JSON object are returned to be submitted again
+def test_process_cached_results_returns_unusable(monkeypatch):
+    updated = []
+    monkeypatch.setattr(batch_result_processor, "update_document",
+                        lambda custom_id, batch_type, content: updated.append(custom_id))
+
+    unusable = batch_result_processor.process_cached_results(
+        [("a.md", '{"topics": ["x"]}'), ("b.md", "not json"), ("c.md", "[1, 2]")], "topics")
+
+    assert updated == ["a.md"] and unusable == ["b.md", "c.md"]
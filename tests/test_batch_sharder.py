@@ -0,0 +1,104 @@
+from WAAnalysis.json_codec import read_json, read_jsonl, write_json, write_jsonl
+from WAAnalysis.batch_sharder import shard_lines, write_shards, archive_input, stitch_completed_shards, results_job_type
+from WAAnalysis.request_packer import load_retry_requests
+
+# Test that shards close at whichever of the request, byte and token limits is reached first
+def test_shard_lines():
+    lines = [b"x" * 10] * 6
+    assert shard_lines(lines, [1] * 6, max_requests=4, max_bytes=1000, max_enqueued_tokens=100) == [(0, 4), (4, 6)]
+    assert shard_lines(lines, [1] * 6, max_requests=10, max_bytes=25, max_enqueued_tokens=100) == [(0, 2), (2, 4), (4, 6)]
+    assert shard_lines(lines, [5, 5, 5, 50, 1, 1], max_requests=10, max_bytes=1000, max_enqueued_tokens=50) == [(0, 3), (3, 4), (4, 6)]
+
+# Test that oversized inputs are written as shards and their outputs stitched once every shard completes
+def test_write_and_stitch_shards(word_tokens, tmp_path):
+    requests = [{"custom_id": f"{i}.md", "body": {"model": "gpt-4o-mini", "messages": []}} for i in range(5)]
+
+    shard_paths = write_shards(tmp_path / "topics_batch.jsonl", requests, cache_file=None, max_requests=2)
+    assert [path.name for path in shard_paths] == [f"topics_batch_shard_00{n}.jsonl" for n in (1, 2, 3)]
+    assert read_jsonl(tmp_path / "topics_batch.jsonl") == requests
+    assert write_shards(tmp_path / "topics_batch.jsonl", requests, cache_file=None) == [tmp_path / "topics_batch.jsonl"]
+    assert not list(tmp_path.glob("*_shard_*"))
+
+    jobs = []
+    for n, (start, end) in enumerate([(0, 2), (2, 4)], start=1):
+        write_jsonl(tmp_path / f"batch_{n}_output.jsonl", [{"custom_id": request["custom_id"]} for request in requests[start:end]])
+        jobs.append({"filename": f"topics_batch_shard_00{n}.jsonl", "job_type": "topics", "batch_id": f"batch_{n}",
+                     "completed": n == 1, "output_file": f"batch_{n}_output.jsonl" if n == 1 else None,
+                     "shard_of": "topics_batch.jsonl", "submission": "20240301T120000"})
+    tracking_file = tmp_path / "tracking.json"
+    write_json(tracking_file, {"jobs": jobs})
+
+    assert stitch_completed_shards(tracking_file, tmp_path, tmp_path, packs={}) == []
+
+    jobs[1].update(completed=True, output_file="batch_2_output.jsonl")
+    write_json(tracking_file, {"jobs": jobs})
+    assert stitch_completed_shards(tracking_file, tmp_path, tmp_path, packs={}) == [tmp_path / "topics_20240301T120000_results.jsonl"]
+    assert [result["custom_id"] for result in read_jsonl(tmp_path / "topics_20240301T120000_results.jsonl")] == ["0.md", "1.md", "2.md", "3.md"]
+    assert all(job["stitched_into"] == "topics_20240301T120000_results.jsonl" for job in read_json(tracking_file)["jobs"])
+
+def result(custom_id):
+    return {"custom_id": custom_id, "error": None, "response": {"status_code": 200, "body": {}}}
+
+# Test that a failed shard is stitched with its partial output and its unanswered documents queued for retry
+def test_stitch_failed_shard(word_tokens, tmp_path):
+    requests = [{"custom_id": custom_id, "body": {"model": "gpt-4o-mini", "messages": []}}
+                for custom_id in ("0.md", "1.md", "2.md", "topics_pack_1")]
+    packed_documents = [{"custom_id": custom_id, "body": {"model": "gpt-4o-mini", "messages": []}}
+                        for custom_id in ("3.md", "4.md")]
+    (tmp_path / "pack_requests").mkdir()
+    write_jsonl(tmp_path / "pack_requests" / "topics_pack_1.jsonl", packed_documents)
+    packs = {"topics_pack_1": {"job_type": "topics", "documents": ["3.md", "4.md"]}}
+
+    shard_paths = write_shards(tmp_path / "topics_batch.jsonl", requests, cache_file=None, max_requests=2)
+    jobs = []
+    for n, shard_path in enumerate(shard_paths, start=1):
+        input_file = archive_input(shard_path, f"batch_{n}", tmp_path / "submitted")
+        jobs.append({"filename": shard_path.name, "job_type": "topics", "batch_id": f"batch_{n}",
+                     "completed": n == 1, "output_file": f"batch_{n}_output.jsonl",
+                     "shard_of": "topics_batch.jsonl", "submission": "20240301T120000", "input_file": str(input_file)})
+    jobs[1]["status"] = "failed"
+    write_jsonl(tmp_path / "batch_1_output.jsonl", [result("0.md"), result("1.md")])
+    write_jsonl(tmp_path / "batch_2_output.jsonl", [result("2.md")])
+    tracking_file = tmp_path / "tracking.json"
+    write_json(tracking_file, {"jobs": jobs})
+
+    # The next submission overwrites the shard files; the archived inputs are read instead
+    write_shards(tmp_path / "topics_batch.jsonl", requests[:1], cache_file=None)
+
+    assert stitch_completed_shards(tracking_file, tmp_path, tmp_path, tmp_path / "submitted", packs,
+                                   tmp_path / "pack_requests") == [tmp_path / "topics_20240301T120000_results.jsonl"]
+    assert [line["custom_id"] for line in read_jsonl(tmp_path / "topics_20240301T120000_results.jsonl")] == ["0.md", "1.md", "2.md"]
+    assert load_retry_requests("topics", tmp_path) == packed_documents
+    assert stitch_completed_shards(tracking_file, tmp_path, tmp_path, tmp_path / "submitted", packs,
+                                   tmp_path / "pack_requests") == []
+
+# Test that two finished submissions of a job type are stitched into separate results files
+def test_stitch_submissions_separately(tmp_path):
+    jobs = []
+    for submission in ("20240301T120000", "20240302T120000"):
+        write_jsonl(tmp_path / f"batch_{submission}_output.jsonl", [{"custom_id": f"{submission}.md"}])
+        jobs.append({"filename": "analysis_batch.jsonl", "job_type": "analysis", "batch_id": f"batch_{submission}",
+                     "completed": True, "output_file": f"batch_{submission}_output.jsonl",
+                     "shard_of": "analysis_batch.jsonl", "submission": submission})
+    tracking_file = tmp_path / "tracking.json"
+    write_json(tracking_file, {"jobs": jobs})
+
+    results_files = stitch_completed_shards(tracking_file, tmp_path, tmp_path, packs={})
+
+    assert [file_path.name for file_path in results_files] == ["analysis_20240301T120000_results.jsonl",
+                                                               "analysis_20240302T120000_results.jsonl"]
+    assert [read_jsonl(file_path)[0]["custom_id"] for file_path in results_files] == ["20240301T120000.md",
+                                                                                      "20240302T120000.md"]
+    assert results_job_type(results_files[0]) == "analysis"
+
+# Test that a shard that finished without an output file is stitched without one, and its requests retried
+def test_stitch_shard_without_output(tmp_path):
+    write_jsonl(tmp_path / "topics_batch.jsonl", [{"custom_id": "0.md", "body": {}}])
+    tracking_file = tmp_path / "tracking.json"
+    write_json(tracking_file, {"jobs": [{"filename": "topics_batch.jsonl", "job_type": "topics", "batch_id": "batch_1",
+                                         "completed": True, "output_file": "None", "shard_of": "topics_batch.jsonl",
+                                         "submission": "20240301T120000"}]})
+
+    assert stitch_completed_shards(tracking_file, tmp_path, tmp_path, packs={}) == []
+    assert read_json(tracking_file)["jobs"][0]["stitched_into"]
+    assert [request["custom_id"] for request in load_retry_requests("topics", tmp_path)] == ["0.md"]
@@ -0,0 +1,71 @@
+import WAAnalysis.chunk_large_files as chunk_large_files
+from WAAnalysis.chunk_large_files import pack_token_ranges, split_text_by_tokens
+
+class CharEncoding:
+    """Stand-in encoding with one token per character."""
+    def encode_ordinary(self, text):
+        return [ord(char) for char in text]
+
+    def decode_with_offsets(self, tokens):
+        return "".join(map(chr, tokens)), list(range(len(tokens)))
+
+# Test that ranges end at the most preferred boundary that fits, or at the limit
+def test_pack_token_ranges():
+    assert pack_token_ranges(10, 20, [[5]]) == [(0, 10)]
+    assert pack_token_ranges(25, 10, [[]]) == [(0, 10), (10, 20), (20, 25)]
+    assert pack_token_ranges(25, 10, [[4, 8, 20], [14]]) == [(0, 8), (8, 14), (14, 20), (20, 25)]
+
+# Test that chunks split on user turns, and oversized turns split at line breaks
+def test_split_text_by_tokens():
+    first_turn = "**User**: hi\n**Assistant**: hello\n"
+    long_turn = "**User**: " + "word " * 10 + "\n" + "more " * 10 + "\n"
+    text = first_turn + long_turn
+
+    chunks = split_text_by_tokens(text, limit=70, encoding=CharEncoding())
+
+    assert "".join(chunks) == text
+    assert all(len(chunk) <= 70 for chunk in chunks)
+    assert chunks[0] == first_turn
+    assert chunks[1] == "**User**: " + "word " * 10 + "\n"
+
+# Test that unchanged sources are skipped, small files are hardlinked and outputs of deleted sources are pruned
+def test_chunk_large_files_incremental(tmp_path, monkeypatch):
+    processed = []
+    real_copy_file = chunk_large_files.copy_file
+    def tracked_copy_file(filepath, output_dir):
+        processed.append(filepath.name)
+        return real_copy_file(filepath, output_dir)
+
+    monkeypatch.setattr(chunk_large_files, "copy_file", tracked_copy_file)
+    monkeypatch.setattr(chunk_large_files, "CHUNK_MANIFEST_FILE", tmp_path / "manifest.json")
+    source_dir, output_dir = tmp_path / "md", tmp_path / "chunked"
+    source_dir.mkdir()
+    output_dir.mkdir()
+    (source_dir / "a.md").write_text("small chat")
+    (source_dir / "b.md").write_text("another small chat")
+
+    chunk_large_files.chunk_large_files(source_dir, output_dir)
+    assert sorted(processed) == ["a.md", "b.md"]
+    assert (output_dir / "a.md").samefile(source_dir / "a.md")
+
+    (source_dir / "b.md").unlink()
+    processed.clear()
+    chunk_large_files.chunk_large_files(source_dir, output_dir)
+    assert processed == []
+    assert [f.name for f in output_dir.iterdir()] == ["a.md"]
+
+# Test that written chunks, including their frontmatter, title and system message, stay within the limit
+def test_process_and_chunk_file_counts_overhead(tmp_path, monkeypatch):
+    monkeypatch.setattr(chunk_large_files, "TOKEN_LIMIT", 200)
+    file_path = tmp_path / "Server Setup.md"
+    turns = "".join(f"**User**: question {i}\n**Assistant**: answer {i}\n" for i in range(20))
+    file_path.write_text(f'---\ntitle: "Server Setup"\n---\n\n{turns}\n[System Messages](system.md)')
+
+    token_count, outputs = chunk_large_files.process_and_chunk_file(file_path, tmp_path, CharEncoding())
+
+    assert token_count > 200 and len(outputs) > 1
+    for output in outputs:
+        content = (tmp_path / output).read_text()
+        assert len(content) <= 200
+        assert content.startswith('---\ntitle: "Server Setup (continued: Part')
+        assert content.endswith("[System Messages](system.md)")
@@ -0,0 +1,70 @@
+import pytest
+from WAAnalysis.clean_summaries import (
+    find_summary_sections,
+    remove_duplicate_summaries,
+    clean_all_markdown_files,
+)
+
+long_summary = (
+    "- Discussion on server setup with high availability.\n"
+    "- Considered redundancy and load balancing as options.\n"
+)
+
+# Test that summary sections stop at the next message or heading
+def test_find_summary_sections():
+    content = "# Title\n\n## Summary\n- Point one.\n\n**User**: Hello\n"
+
+    sections = find_summary_sections(content)
+
+    assert len(sections) == 1
+    start, end = sections[0]
+    assert content[start:end] == "## Summary\n- Point one.\n\n"
+
+# Test that exact and contained duplicates are removed within a file
+def test_remove_duplicate_summaries():
+    content = (
+        "# Title\n\n"
+        f"## Summary\n{long_summary}\n"
+        f"## Summary\n{long_summary.upper()}- Automated backups were introduced.\n\n"
+        f"## Summary\n{long_summary}\n"
+        "**User**: Hello\n"
+    )
+
+    cleaned = remove_duplicate_summaries(content)
+
+    assert cleaned.count("## Summary") == 1
+    assert "Automated backups" in cleaned
+    assert cleaned.endswith("**User**: Hello\n")
+
+# Test that distinct summaries are left alone
+def test_remove_duplicate_summaries_no_change():
+    content = f"## Summary\n{long_summary}\n## Summary\n- Something else entirely.\n"
+
+    assert remove_duplicate_summaries(content) is None
+
+# Test that duplicates are removed across the continuation parts of a conversation
+def test_clean_all_markdown_files_across_parts(tmp_path):
+    part_1 = tmp_path / "Server Setup_part_1.md"
+    part_2 = tmp_path / "Server Setup_part_2.md"
+    other = tmp_path / "Other Chat.md"
+    part_1.write_text(f"# Server Setup\n\n## Summary\n{long_summary}\n**User**: Part one\n")
+    part_2.write_text(f"# Server Setup\n\n## Summary\n{long_summary}\n**User**: Part two\n")
+    other.write_text(f"# Other Chat\n\n## Summary\n{long_summary}\n**User**: Unrelated\n")
+
+    clean_all_markdown_files(tmp_path, workers=1)
+
+    assert "## Summary" in part_1.read_text()
+    assert part_2.read_text() == "# Server Setup\n\n**User**: Part two\n"
+    assert "## Summary" in other.read_text()
+
+# Test that bold lines inside a summary do not end it, and short summaries are still found in longer ones
+def test_bold_lines_and_short_summaries():
+    content = (
+        "## Summary\n**Decisions**\n- Use two servers.\n\n"
+        "## Summary\n- Use two servers.\n\n"
+        "**User**: Hello\n"
+    )
+
+    sections = find_summary_sections(content)
+    assert content[sections[0][0]:sections[0][1]] == "## Summary\n**Decisions**\n- Use two servers.\n\n"
+    assert remove_duplicate_summaries(content) == "## Summary\n**Decisions**\n- Use two servers.\n\n**User**: Hello\n"
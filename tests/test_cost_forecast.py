@@ -0,0 +1,39 @@
+from WAAnalysis.json_codec import write_jsonl
+from WAAnalysis.cost_forecast import batch_input_files, forecast_batch_file, forecast_report, TOKENS_PER_MESSAGE, TOKENS_PER_REQUEST
+
+def batch_request(custom_id, model, user_text, max_tokens=None):
+    """Builds a batch input line like batch_utils.generate_batch_input."""
+    body = {"model": model, "messages": [{"role": "system", "content": "you tag chats"},
+                                         {"role": "user", "content": user_text}]}
+    if max_tokens is not None:
+        body["max_tokens"] = max_tokens
+    return {"custom_id": custom_id, "method": "POST", "url": "/v1/chat/completions", "body": body}
+
+# Test that requests are grouped by job type and model, with max_tokens bounding the output cost
+def test_forecast_batch_file(word_tokens, tmp_path):
+    batch_file = tmp_path / "topics_batch.jsonl"
+    write_jsonl(batch_file, [
+        batch_request("a.md", "gpt-4o-mini", "one two three", max_tokens=300),
+        batch_request("b.md", "gpt-4o-mini", "four five", max_tokens=300),
+        batch_request("c.md", "unpriced-model", "six"),
+    ])
+
+    groups = forecast_batch_file(batch_file, batch_size=2, cache_file=None)
+    report = forecast_report(groups)
+
+    overhead = TOKENS_PER_REQUEST + 2 * TOKENS_PER_MESSAGE
+    mini = groups[("topics", "gpt-4o-mini")]
+    assert mini == {"requests": 2, "input_tokens": 2 * overhead + 3 + 2 + 2 * 3,
+                    "max_output_tokens": 600, "unbounded_requests": 0}
+    assert groups[("topics", "unpriced-model")]["unbounded_requests"] == 1
+
+    assert report["by_model"]["gpt-4o-mini"]["costs"]["total_cost_batch"] == report["groups"][0]["costs"]["total_cost_batch"]
+    assert report["by_model"]["unpriced-model"]["costs"] is None
+    assert report["by_job_type"]["topics"]["requests"] == 3
+
+# Test that retry files are left out of the default batch input files
+def test_batch_input_files(tmp_path):
+    for name in ("analysis_batch.jsonl", "analysis_retry_batch.jsonl", "topics_batch_shard_001.jsonl"):
+        (tmp_path / name).write_text("")
+
+    assert batch_input_files(tmp_path) == [tmp_path / "analysis_batch.jsonl"]
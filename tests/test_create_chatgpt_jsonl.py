@@ -0,0 +1,42 @@
+import WAAnalysis.create_chatgpt_jsonl as create_chatgpt_jsonl
+from WAAnalysis.json_codec import read_json, read_jsonl
+
+# Test that unchanged chunks are skipped unopened, and re-inspected once the token limit changes
+def test_create_jsonl_for_chunks_skips_and_resumes(tmp_path, monkeypatch):
+    chunked_dir = tmp_path / "chunked"
+    chunked_dir.mkdir()
+    (chunked_dir / "short.md").write_text("# Short\n\nhi\n")
+    (chunked_dir / "long.md").write_text("# Long\n\n" + "word " * 10 + "\n")
+
+    inspected = []
+    real_inspect_chunk = create_chatgpt_jsonl.inspect_chunk
+    def tracked_inspect_chunk(file_path, previous_entry=None):
+        inspected.append(file_path.name)
+        return real_inspect_chunk(file_path, previous_entry)
+
+    monkeypatch.setattr(create_chatgpt_jsonl, "inspect_chunk", tracked_inspect_chunk)
+    monkeypatch.setattr(create_chatgpt_jsonl, "count_tokens", lambda text: len(text.split()))
+    monkeypatch.setattr(create_chatgpt_jsonl, "size_requests", lambda requests, job_type: requests)
+    monkeypatch.setattr(create_chatgpt_jsonl, "CHUNKED_DIR", chunked_dir)
+    monkeypatch.setattr(create_chatgpt_jsonl, "BATCH_INPUT_DIR", tmp_path / "batch_input")
+    monkeypatch.setattr(create_chatgpt_jsonl, "SUMMARY_MANIFEST_FILE", tmp_path / "manifest.json")
+    monkeypatch.setattr(create_chatgpt_jsonl, "TOKEN_LIMIT", 5)
+    batch_file = tmp_path / "batch_input" / "summarization" / "summarization_batch_input.jsonl"
+
+    create_chatgpt_jsonl.create_jsonl_for_chunks()
+    assert sorted(inspected) == ["long.md", "short.md"]
+    assert [request["custom_id"] for request in read_jsonl(batch_file)] == ["long.md"]
+    assert read_json(tmp_path / "manifest.json")["files"]["short.md"]["state"] == "below_limit"
+
+    # The below-limit chunk is skipped unopened; the pending one is inspected again
+    inspected.clear()
+    create_chatgpt_jsonl.create_jsonl_for_chunks()
+    assert inspected == ["long.md"]
+
+    # A lower limit invalidates the below-limit state
+    inspected.clear()
+    monkeypatch.setattr(create_chatgpt_jsonl, "TOKEN_LIMIT", 2)
+    create_chatgpt_jsonl.create_jsonl_for_chunks()
+    assert sorted(inspected) == ["long.md", "short.md"]
+    assert sorted(request["custom_id"] for request in read_jsonl(batch_file)) == ["long.md", "short.md"]
+    assert read_json(tmp_path / "manifest.json")["token_limit"] == 2
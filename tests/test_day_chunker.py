@@ -0,0 +1,40 @@
+import WAAnalysis.day_chunker as day_chunker
+from WAAnalysis.day_chunker import pack_messages, chunk_day_file, source_file_name
+
+def word_counts(texts):
+    """Counts each whitespace-separated word as a token."""
+    return [len(text.split()) for text in texts]
+
+DAY_FILE = (
+    "---\ntopics:\n---\n\n# Saturday, 09 March 2024\n\n"
+    "**Jason**: one two three\n  10:00 AM\n\n"
+    "**Sarah**: _Replying to:_\n\n> **Jason**: one two three\n  10:05 AM\n\n"
+    "**Jason**: four five six\n  10:10 AM\n\n"
+)
+
+# Test that parts hold whole messages within the budget and repeat trailing context
+def test_pack_messages():
+    assert pack_messages([3, 3, 3, 3], budget=6) == [(0, 2), (2, 4)]
+    assert pack_messages([3, 3, 3, 3], budget=7, overlap=3) == [(0, 2), (1, 3), (2, 4)]
+    assert pack_messages([10, 2], budget=5) == [(0, 1), (1, 2)]
+
+# Test that heavy days are written as parts that keep the frontmatter and reply blocks
+def test_chunk_day_file(tmp_path, monkeypatch):
+    monkeypatch.setattr(day_chunker, "count_tokens_many", word_counts)
+    day_file = tmp_path / "2024-03-09.md"
+    day_file.write_text(DAY_FILE)
+    output_dir = tmp_path / "parts"
+
+    documents = chunk_day_file(day_file, output_dir, budget=16, overlap=0)
+
+    assert [name for name, _ in documents] == ["2024-03-09_part_1.md", "2024-03-09_part_2.md"]
+    first, second = (text for _, text in documents)
+    assert first.startswith("---\ntopics:\n---\n\n# Saturday, 09 March 2024 (Part 1 of 2)\n\n**Jason**")
+    assert "> **Jason**: one two three\n  10:05 AM" in first
+    assert "four five six" in second and second.startswith("---\ntopics:\n---\n")
+    assert (output_dir / "2024-03-09_part_2.md").read_text() == second
+    assert source_file_name("2024-03-09_part_2.md") == "2024-03-09.md"
+
+    # Once the day fits the budget, its stale parts are removed
+    assert chunk_day_file(day_file, output_dir, budget=100) == [("2024-03-09.md", DAY_FILE)]
+    assert not list(output_dir.glob("*.md"))
@@ -0,0 +1,11 @@
+from WAAnalysis.generate_single_tag_cluster_jsonl import tag_cluster_max_tokens, TAG_CLUSTER_MAX_TOKENS
+
+# Test that the clustering response is sized from the tags it must list, within the model's output limit
+def test_tag_cluster_max_tokens(word_tokens):
+    def max_tokens(tags):
+        return tag_cluster_max_tokens(tags, model="gpt-4o-mini", cache_file=None)
+    few, many = ["family time"] * 30, ["family time"] * 5000
+
+    assert max_tokens(few) < max_tokens(few * 2)
+    assert max_tokens(few) >= 2 * len(few)
+    assert max_tokens(many) == TAG_CLUSTER_MAX_TOKENS
@@ -0,0 +1,26 @@
+from datetime import date
+from WAAnalysis.json_codec import dumps, loads, read_json, write_json, iter_jsonl, write_jsonl
+
+# Test that JSONL records round-trip and blank lines are skipped
+def test_jsonl_round_trip(tmp_path):
+    file_path = tmp_path / "results.jsonl"
+    records = [{"custom_id": "2024-03-09.md", "text": "héllo"}, {"custom_id": "2024-03-10.md", "text": ""}]
+
+    assert write_jsonl(file_path, records) == 2
+    with open(file_path, "a") as f:
+        f.write("\n")
+
+    assert list(iter_jsonl(file_path)) == records
+
+# Test pretty and compact output, and serialization of dates
+def test_write_json_pretty_and_compact(tmp_path):
+    data = {"day": date(2024, 3, 9), "count": 1}
+
+    pretty_path = tmp_path / "pretty.json"
+    compact_path = tmp_path / "compact.json"
+    write_json(pretty_path, data)
+    write_json(compact_path, data, compact=True)
+
+    assert "\n  " in pretty_path.read_text()
+    assert compact_path.read_text() == dumps(data) == '{"day":"2024-03-09","count":1}'
+    assert read_json(pretty_path) == loads(compact_path.read_bytes())
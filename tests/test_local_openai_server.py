@@ -0,0 +1,53 @@
+import time
+import threading
+from openai import OpenAI
+from WAAnalysis.json_codec import dumps, loads, write_jsonl
+from WAAnalysis.local_openai_server import make_server
+
+CONVERSATION = "Jason: Shall we plan the holiday trip?\nElizabeth: Yes, the holiday sounds lovely."
+
+def request(custom_id, system, user, max_tokens=300):
+    return {"custom_id": custom_id, "method": "POST", "url": "/v1/chat/completions",
+            "body": {"model": "gpt-4o-mini", "max_tokens": max_tokens,
+                     "messages": [{"role": "system", "content": dumps(system)},
+                                  {"role": "user", "content": dumps(user)}]}}
+
+# Test that a batch submitted through the OpenAI client completes with schema-conforming, deterministic outputs
+def test_batch_round_trip(tmp_path):
+    server = make_server(port=0, latency=0)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    client = OpenAI(api_key="x", base_url=f"http://127.0.0.1:{server.server_port}/v1")
+    try:
+        input_file = tmp_path / "analysis_batch.jsonl"
+        write_jsonl(input_file, [
+            request("a.md", "Your goal is to extract, in a single JSON object, the topics.", CONVERSATION),
+            request("b.md", "You are an AI assistant specialized in analyzing sentiment in conversations.", CONVERSATION),
+            request("c.md", "You are an AI assistant specialized in extracting topics or themes.", CONVERSATION, 1),
+        ])
+        with open(input_file, "rb") as file:
+            file_id = client.files.create(file=file, purpose="batch").id
+        batch = client.batches.create(input_file_id=file_id, endpoint="/v1/chat/completions", completion_window="24h")
+
+        for _ in range(100):
+            batch = client.batches.retrieve(batch.id)
+            if batch.status == "completed":
+                break
+            time.sleep(0.05)
+        assert batch.status == "completed"
+        assert (batch.request_counts.total, batch.request_counts.completed) == (3, 3)
+
+        lines = [loads(line) for line in client.files.content(batch.output_file_id).text.splitlines()]
+        results = {line["custom_id"]: line["response"]["body"]["choices"][0] for line in lines}
+        analysis = loads(results["a.md"]["message"]["content"])
+        assert set(analysis) == {"topics", "entities", "sentiment", "key_points"}
+        assert analysis["topics"][0] == "holiday"
+        assert [entity["person"] for entity in analysis["entities"]] == ["Jason", "Elizabeth"]
+        assert set(loads(results["b.md"]["message"]["content"])) == {"sentiment", "polarity", "subjectivity"}
+        assert results["c.md"]["finish_reason"] == "length"
+
+        messages = request("a.md", "Your goal is to extract, in a single JSON object.", CONVERSATION)["body"]["messages"]
+        completion = client.chat.completions.create(model="gpt-4o-mini", messages=messages)
+        assert completion.choices[0].message.content == results["a.md"]["message"]["content"]
+    finally:
+        server.shutdown()
+        server.server_close()
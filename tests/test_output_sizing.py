@@ -0,0 +1,41 @@
+import numpy as np
+from WAAnalysis.json_codec import write_jsonl
+from WAAnalysis.output_sizing import fit_profile, size_requests, collect_output_lengths
+
+# Test that limits follow the output quantile of each input band and grow where responses were truncated
+def test_fit_profile():
+    prompt_tokens = np.repeat([100, 1000], 100)
+    completion_tokens = np.concatenate([np.full(100, 50), np.full(100, 200)])
+    truncated = np.zeros(200, dtype=bool)
+
+    profile = fit_profile(prompt_tokens, completion_tokens, truncated, bins=2, headroom=1.0, floor=10)
+    assert profile["edges"] == [550]
+    assert profile["limits"] == [50, 200]
+
+    truncated[100:110] = True
+    profile = fit_profile(prompt_tokens, completion_tokens, truncated, bins=2, headroom=1.0, floor=10)
+    assert profile["limits"] == [50, 300]
+
+# Test that requests get the limit of their input band, and job types without a profile keep theirs
+def test_size_requests(word_tokens):
+    requests = [{"body": {"model": "gpt-4o-mini", "max_tokens": 300,
+                          "messages": [{"role": "user", "content": "word " * words}]}} for words in (10, 100)]
+    profiles = {"topics": {"edges": [50], "limits": [40, 120]}}
+
+    size_requests(requests, "sentiment", profiles, cache_file=None)
+    assert [request["body"]["max_tokens"] for request in requests] == [300, 300]
+
+    size_requests(requests, "topics", profiles, cache_file=None)
+    assert [request["body"]["max_tokens"] for request in requests] == [40, 120]
+
+# Test that packed responses are left out of the observed output lengths
+def test_collect_output_lengths_skips_packs(tmp_path):
+    def result(custom_id, prompt_tokens, completion_tokens):
+        return {"custom_id": custom_id, "response": {"status_code": 200, "body": {
+            "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens},
+            "choices": [{"finish_reason": "stop"}]}}}
+    write_jsonl(tmp_path / "topics_results.jsonl", [result("a.md", 100, 40), result("topics_pack_1", 2000, 800)])
+
+    rows = collect_output_lengths(tmp_path, tmp_path / "tracking.json", packs={"topics_pack_1": {}})
+
+    assert rows["topics"].tolist() == [[100, 40, 0]]
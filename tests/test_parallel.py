@@ -0,0 +1,17 @@
+import time
+from WAAnalysis.parallel import run_parallel
+
+def slow_square(item):
+    # Earlier items finish last, so completions come back out of input order
+    time.sleep((5 - item) * 0.02)
+    if item == 3:
+        raise ValueError("bad item")
+    return item * item
+
+# Test that results keep input order and a failing item is collected instead of stopping the run
+def test_run_parallel_orders_results_and_collects_errors():
+    for use_threads in (True, False):
+        results, errors = run_parallel(slow_square, range(5), workers=5, use_threads=use_threads)
+
+        assert results == [0, 1, 4, None, 16]
+        assert errors == [(3, "ValueError: bad item")]
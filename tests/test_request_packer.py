@@ -0,0 +1,32 @@
+from WAAnalysis.json_codec import dumps
+from WAAnalysis.request_packer import group_small_documents, pack_requests, unpack_response, load_packs
+
+def request(custom_id, words):
+    """Builds a batch request with a few-shot system prompt and a conversation of that many words."""
+    return {"custom_id": custom_id, "method": "POST", "url": "/v1/chat/completions",
+            "body": {"model": "gpt-4o-mini", "max_tokens": 300,
+                     "messages": [{"role": "system", "content": "Extract the topics."},
+                                  {"role": "user", "content": "word " * words}]}}
+
+# Test that small documents are grouped within the budget and large ones are left alone
+def test_group_small_documents():
+    assert group_small_documents([100, 100, 900, 100, 100, 100], document_limit=500, budget=250) == [[0, 1], [2], [3, 4], [5]]
+    assert group_small_documents([10] * 5, max_documents=2) == [[0, 1], [2, 3], [4]]
+
+# Test that packed requests carry delimited documents and their responses unpack per document
+def test_pack_requests(word_tokens, tmp_path):
+    manifest_file = tmp_path / "packs.json"
+    requests = [request("a.md", 10), request("b.md", 20), request("c.md", 900)]
+
+    packed = pack_requests(requests, "topics", manifest_file, cache_file=None, requests_dir=tmp_path)
+
+    assert len(packed) == 2 and packed[1] is requests[2]
+    body = packed[0]["body"]
+    assert body["max_tokens"] == 600
+    assert "=== DOCUMENT a.md ===" in body["messages"][1]["content"]
+    assert "=== END DOCUMENT b.md ===" in body["messages"][1]["content"]
+    assert load_packs(manifest_file)[packed[0]["custom_id"]]["documents"] == ["a.md", "b.md"]
+
+    unpacked, failed = unpack_response(dumps({"a.md": {"topics": ["x"]}}), ["a.md", "b.md"])
+    assert unpacked == {"a.md": {"topics": ["x"]}} and failed == ["b.md"]
+    assert unpack_response("not json", ["a.md"]) == ({}, ["a.md"])
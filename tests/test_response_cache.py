@@ -0,0 +1,89 @@
+from WAAnalysis.json_codec import dumps, write_json, write_jsonl
+import time
+from WAAnalysis.response_cache import (request_digest, split_cached, batch_request_rows, record_batch_requests,
+                                       ingest_batch_output, ingest_tracked_outputs, connect)
+
+def request(custom_id, text, max_tokens=300):
+    return {"custom_id": custom_id, "body": {"model": "gpt-4o-mini", "max_tokens": max_tokens,
+                                             "messages": [{"role": "user", "content": text}]}}
+
+def result(custom_id, content, completion_tokens=20, finish_reason="stop"):
+    return {"custom_id": custom_id, "error": None, "response": {"status_code": 200, "body": {
+        "model": "gpt-4o-mini", "usage": {"completion_tokens": completion_tokens},
+        "choices": [{"finish_reason": finish_reason, "message": {"content": content}}]}}}
+
+# Test that outputs are cached under the digests of their submitted documents and served on the next run
+def test_response_cache_round_trip(tmp_path):
+    cache_file = tmp_path / "responses.sqlite"
+    requests = [request("a.md", "hello"), request("b.md", "packed one"), request("c.md", "packed two"),
+                request("d.md", "cut off")]
+    misses, hits, digests = split_cached(requests, cache_file)
+    assert misses == requests and hits == []
+    assert request_digest(request("x", "hello", max_tokens=50)["body"]) == digests["a.md"]
+
+    input_file = tmp_path / "topics_batch.jsonl"
+    write_jsonl(input_file, [requests[0], {"custom_id": "pack_1"}, requests[3]])
+    packs = {"pack_1": {"documents": ["b.md", "c.md"]}}
+    record_batch_requests("batch_1", batch_request_rows(input_file, digests, packs), cache_file)
+
+    output_file = tmp_path / "batch_1_output.jsonl"
+    write_jsonl(output_file, [
+        result("a.md", '{"topics": ["greeting"]}'),
+        result("pack_1", dumps({"b.md": {"topics": ["one"]}, "c.md": {"topics": ["two"]}})),
+        result("d.md", '{"topics": [', finish_reason="length"),
+    ])
+    assert ingest_batch_output("batch_1", output_file, cache_file) == 3
+
+    # A changed document, a truncated response and a too-small output limit are still submitted
+    rerun = [request("a.md", "hello"), request("b.md", "packed one"), request("c.md", "packed two, edited"),
+             request("d.md", "cut off"), request("e.md", "hello", max_tokens=10)]
+    misses, hits, _ = split_cached(rerun, cache_file)
+    assert dict(hits) == {"a.md": '{"topics": ["greeting"]}', "b.md": '{"topics":["one"]}'}
+    assert [miss["custom_id"] for miss in misses] == ["c.md", "d.md", "e.md"]
+
+# Test that an output whose requests were never recorded is backfilled from its archived input, once
+def test_ingest_tracked_outputs_backfills_from_archived_input(tmp_path):
+    cache_file = tmp_path / "responses.sqlite"
+    requests = [request("a.md", "hello"), request("b.md", "packed one"), request("c.md", "packed two")]
+    (tmp_path / "pack_requests").mkdir()
+    write_jsonl(tmp_path / "pack_requests" / "pack_1.jsonl", requests[1:])
+    packs = {"pack_1": {"job_type": "topics", "documents": ["b.md", "c.md"]}}
+
+    (tmp_path / "submitted").mkdir()
+    write_jsonl(tmp_path / "submitted" / "batch_1.jsonl", [requests[0], {"custom_id": "pack_1", "body": {}}])
+    write_jsonl(tmp_path / "batch_1_output.jsonl", [
+        result("a.md", '{"topics": ["greeting"]}'),
+        result("pack_1", dumps({"b.md": {"topics": ["one"]}, "c.md": {"topics": ["two"]}})),
+    ])
+    tracking_file = tmp_path / "tracking.json"
+    write_json(tracking_file, {"jobs": [{"batch_id": "batch_1", "output_file": "batch_1_output.jsonl",
+                                         "input_file": "submitted/batch_1.jsonl"}]})
+
+    def ingest():
+        return ingest_tracked_outputs(tracking_file, tmp_path, cache_file, tmp_path / "submitted", packs,
+                                      tmp_path / "pack_requests")
+
+    assert ingest() == 3
+    assert ingest() == 0
+    misses, hits, _ = split_cached(requests, cache_file)
+    assert misses == [] and [custom_id for custom_id, _ in hits] == ["a.md", "b.md", "c.md"]
+
+# Test that a response that is not a JSON object is never cached, and an unparseable cached one is a miss
+def test_unparseable_responses_are_not_hits(tmp_path):
+    cache_file = tmp_path / "responses.sqlite"
+    requests = [request("a.md", "hello"), request("b.md", "prose")]
+    _, _, digests = split_cached(requests, cache_file)
+
+    input_file = tmp_path / "topics_batch.jsonl"
+    write_jsonl(input_file, requests)
+    record_batch_requests("batch_1", batch_request_rows(input_file, digests, {}), cache_file)
+    output_file = tmp_path / "batch_1_output.jsonl"
+    write_jsonl(output_file, [result("a.md", "Sure! The topics are greetings."), result("b.md", '["not", "an", "object"]')])
+    assert ingest_batch_output("batch_1", output_file, cache_file) == 0
+
+    # An entry cached before this check was in place
+    with connect(cache_file) as connection:
+        connection.execute("INSERT INTO responses VALUES (?, ?, ?, ?, ?)",
+                           (digests["a.md"], "not json", "gpt-4o-mini", 5, time.time()))
+    misses, hits, _ = split_cached(requests, cache_file)
+    assert misses == requests and hits == []
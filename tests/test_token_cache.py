@@ -0,0 +1,51 @@
+import WAAnalysis.token_cache as token_cache
+from WAAnalysis.token_cache import count_tokens, count_tokens_many, iter_file_token_counts
+
+# Test that a second pass over unchanged text makes no tokenizer calls
+def test_count_tokens_many_uses_cache(word_tokens, tmp_path):
+    cache_file = tmp_path / "token_cache.sqlite"
+    texts = ["one two three", "four five", "one two three"]
+
+    assert count_tokens_many(texts, cache_file=cache_file) == [3, 2, 3]
+    assert len(word_tokens.calls) == 2
+
+    assert count_tokens_many(texts, cache_file=cache_file) == [3, 2, 3]
+    assert count_tokens("four five", cache_file=cache_file) == 2
+    assert len(word_tokens.calls) == 2
+
+# Test that the least recently used entries are evicted beyond the size limit
+def test_count_tokens_many_evicts_least_recently_used(word_tokens, tmp_path):
+    cache_file = tmp_path / "token_cache.sqlite"
+
+    clock = iter(range(1, 100)).__next__
+
+    count_tokens_many(["old entry"], cache_file=cache_file, max_entries=2, clock=clock)
+    count_tokens_many(["newer entry"], cache_file=cache_file, max_entries=2, clock=clock)
+    count_tokens_many(["newest entry"], cache_file=cache_file, max_entries=2, clock=clock)
+    word_tokens.calls.clear()
+
+    count_tokens_many(["newer entry", "newest entry", "old entry"], cache_file=cache_file, max_entries=2, clock=clock)
+    assert word_tokens.calls == ["old entry"]
+
+# Test that a call where every text is cached only reads the cache
+def test_count_tokens_many_all_hits_do_not_write(word_tokens, tmp_path):
+    cache_file = tmp_path / "token_cache.sqlite"
+    count_tokens_many(["one two", "three"], cache_file=cache_file)
+
+    statements = []
+    token_cache.get_connection(cache_file).set_trace_callback(statements.append)
+    assert count_tokens_many(["three", "one two"], cache_file=cache_file) == [1, 2]
+    token_cache.get_connection(cache_file).set_trace_callback(None)
+
+    assert len(statements) == 1 and statements[0].startswith("SELECT digest, token_count")
+
+# Test that files are counted in batches and unreadable files are skipped
+def test_iter_file_token_counts(word_tokens, tmp_path):
+    files = [tmp_path / f"chat_{i}.md" for i in range(5)]
+    for i, file_path in enumerate(files):
+        file_path.write_text("word " * i)
+    missing = tmp_path / "missing.md"
+
+    counted = list(iter_file_token_counts(files + [missing], batch_size=2, cache_file=None))
+
+    assert counted == [(file_path, i) for i, file_path in enumerate(files)]
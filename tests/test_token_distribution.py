@@ -0,0 +1,28 @@
+import numpy as np
+from WAAnalysis.token_distribution import collect_token_counts, distribution_report, histogram
+
+# Test that counts on a range boundary land in the lower range
+def test_histogram_inclusive_edges():
+    names = ["a.md", "b.md", "c.md", "d.md", "e.md"]
+    values = np.array([0, 500, 501, 2000, 2500])
+
+    ranges = histogram(names, values, (500, 1000, 2000))
+
+    assert [data["count"] for data in ranges.values()] == [2, 1, 1, 1]
+    assert list(ranges) == ["0-500", "501-1000", "1001-2000", "2001+"]
+    assert ranges["2001+"]["total_tokens"] == 2500
+    assert ranges["2001+"]["documents"] == [{"filename": "e.md", "token_count": 2500}]
+
+# Test that one pass yields body, frontmatter and total counts for every report
+def test_collect_token_counts(word_tokens, tmp_path):
+    (tmp_path / "a.md").write_text("---\ntitle: a\n---\none two three\n")
+    (tmp_path / "b.md").write_text("no frontmatter here\n")
+
+    names, counts = collect_token_counts(sorted(tmp_path.glob("*.md")), cache_file=None)
+
+    assert names == ["a.md", "b.md"]
+    assert counts.tolist() == [[3, 4, 7], [3, 0, 3]]
+
+    report = distribution_report(names, counts, "frontmatter", (2,), threshold=3)
+    assert report["max"] == {"filename": "a.md", "token_count": 4}
+    assert report["documents_above"]["documents"] == [{"filename": "a.md", "token_count": 4}]
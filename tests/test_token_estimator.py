@@ -0,0 +1,33 @@
+import random
+from WAAnalysis.token_estimator import estimate_token_counts
+
+def write_corpus(directory, sizes):
+    """Writes one markdown file per size, with that many words in the body."""
+    rng = random.Random(1)
+    files = []
+    for i, size in enumerate(sizes):
+        words = " ".join(rng.choice(["alpha", "be", "gamma", "delta42", "é"]) for _ in range(size))
+        file_path = directory / f"chat_{i:03}.md"
+        file_path.write_text(f"---\ntitle: chat {i}\n---\n{words}\n", encoding="utf-8")
+        files.append(file_path)
+    return files
+
+# Test that estimates track exact counts and files near the threshold are counted exactly
+def test_estimate_token_counts(word_tokens, tmp_path):
+    files = write_corpus(tmp_path, range(10, 1010, 10))
+
+    names, counts, exact, model = estimate_token_counts(files, threshold=500, sample_size=50, cache_file=None)
+
+    assert names == [file_path.name for file_path in files]
+    assert model["sample_size"] == 50 and model["holdout_size"] == 10
+    assert model["p95_error_pct"] < 10
+
+    exact_totals = [len(file_path.read_text(encoding="utf-8").split()) for file_path in files]
+    for total, expected in zip(counts[:, 2], exact_totals):
+        assert abs(total - expected) <= max(2, expected * 0.1)
+
+    # The file exactly at the threshold is always counted exactly
+    at_threshold = names.index("chat_049.md")
+    assert exact[at_threshold]
+    assert counts[at_threshold, 2] == exact_totals[at_threshold]
+    assert (counts[:, 0] + counts[:, 1] == counts[:, 2]).all()
@@ -0,0 +1,82 @@
+import pytest
+from WAAnalysis.transforms import apply_transforms, run_transforms
+from WAAnalysis.utils import load_markdown
+
+# Sample markdown document needing several fixes
+sample_markdown = (
+    "---\n"
+    "entity_relationships:\n"
+    "- person: Anna\n"
+    "  relationships:\n"
+    "  - plays with Wesley\n"
+    "  role: child\n"
+    "topics:\n"
+    "- Family Time\n"
+    "---\n\n"
+    "# Saturday, 09 March 2024\n\n"
+    "## Summary\n"
+    "- Family day out.\n"
+    "## Summary\n"
+    "- Family day out.\n"
+    "- Picnic at the park.\n"
+)
+
+# Test that a chain of transforms is applied in a single rewrite
+def test_apply_transforms_chain(tmp_path):
+    file_path = tmp_path / "2024-03-09.md"
+    file_path.write_text(sample_markdown)
+
+    updated = apply_transforms(file_path, ["correct_roles", "convert_topics_to_tags", "clean_summaries"])
+
+    assert updated is True
+    frontmatter, body = load_markdown(file_path)
+    assert frontmatter["tags"] == ["family-time"]
+    assert "topics" not in frontmatter
+    assert frontmatter["entity_relationships"][0]["person"] == "Ana"
+    assert frontmatter["entity_relationships"][0]["role"] == "daughter"
+    assert body.count("## Summary") == 1
+
+# Test that a second run is a no-op
+def test_apply_transforms_is_idempotent(tmp_path):
+    file_path = tmp_path / "2024-03-09.md"
+    file_path.write_text(sample_markdown)
+    names = ["correct_roles", "convert_topics_to_tags", "clean_summaries"]
+
+    apply_transforms(file_path, names)
+    content = file_path.read_text()
+
+    assert apply_transforms(file_path, names) is False
+    assert file_path.read_text() == content
+
+# Test that headers needing sanitizing are rewritten as clean YAML
+def test_apply_transforms_sanitizes_yaml(tmp_path):
+    file_path = tmp_path / "chat.md"
+    file_path.write_text('---\ntitle: "Define the word "yeet""\n---\n\n# Title\n')
+
+    assert apply_transforms(file_path, ["clean_yaml_frontmatter"]) is True
+    assert "yeet" in load_markdown(file_path)[0]["title"]
+    assert apply_transforms(file_path, ["clean_yaml_frontmatter"]) is False
+
+# Test that unknown transform names are rejected
+def test_run_transforms_unknown_name(tmp_path):
+    with pytest.raises(ValueError):
+        run_transforms(tmp_path, ["not_a_transform"])
+
+# Test that the runner applies transforms across a directory with a worker pool
+def test_run_transforms_parallel(tmp_path):
+    for day in range(1, 5):
+        (tmp_path / f"2024-03-0{day}.md").write_text(sample_markdown)
+
+    assert run_transforms(tmp_path, ["convert_topics_to_tags"], workers=2) == 4
+    assert run_transforms(tmp_path, ["convert_topics_to_tags"], workers=2) == 0
+
+# Test that an unrelated transform leaves a header needing sanitizing untouched
+def test_apply_transforms_only_sanitizes_when_selected(tmp_path):
+    file_path = tmp_path / "chat.md"
+    content = '---\ntitle: "Define the word "yeet""\n---\n\n# Title\n'
+    file_path.write_text(content)
+
+    assert apply_transforms(file_path, ["clean_summaries"]) is False
+    assert file_path.read_text() == content
+    with pytest.raises(ValueError):
+        apply_transforms(file_path, ["clean_summaries", "clean_yaml_frontmatter"])
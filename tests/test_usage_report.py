@@ -0,0 +1,37 @@
+from WAAnalysis.json_codec import write_json, write_jsonl
+from WAAnalysis.usage_report import usage_report
+
+def batch_result(custom_id, prompt_tokens, completion_tokens, finish_reason="stop", status_code=200):
+    """Builds a batch output line as the Batch API returns it."""
+    return {"id": f"batch_req_{custom_id}", "custom_id": custom_id, "error": None, "response": {
+        "status_code": status_code, "body": {
+            "model": "gpt-4o-mini-2024-07-18",
+            "choices": [{"finish_reason": finish_reason, "message": {"content": "{}"}}],
+            "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens},
+        }}}
+
+# Test that usage, truncation and cost are aggregated by job type and model, with throughput per batch
+def test_usage_report(tmp_path):
+    write_jsonl(tmp_path / "batch_abc_output.jsonl", [
+        batch_result("a.md", 1_000_000, 100, finish_reason="length"),
+        batch_result("b.md", 1_000_000, 100),
+        batch_result("c.md", 0, 0, status_code=500),
+    ])
+    write_jsonl(tmp_path / "sentiment_results.jsonl", [batch_result("a.md", 10, 5)])
+    tracking_file = tmp_path / "tracking.json"
+    write_json(tracking_file, {"jobs": [{"job_type": "topics", "batch_id": "batch_abc", "completed": True,
+                                         "output_file": "data/batch_outputs/batch_abc_output.jsonl",
+                                         "created_at": 1000, "completed_at": 1000 + 7200}]})
+
+    report = usage_report(tmp_path, tracking_file)
+
+    sentiment, topics = report["groups"]
+    assert (topics["job_type"], topics["model"]) == ("topics", "gpt-4o-mini-2024-07-18")
+    assert topics["requests"] == 3 and topics["failed"] == 1
+    assert topics["prompt_tokens"] == 2_000_000 and topics["truncation_rate"] == 0.5
+    assert topics["costs"]["input_cost_batch"] == 0.15
+    assert sentiment["job_type"] == "sentiment" and sentiment["truncation_rate"] == 0.0
+
+    batch = report["batches"][0]
+    assert batch["wall_hours"] == 2 and batch["tokens_per_hour"] == 1_000_100
+    assert report["batches"][1]["tokens_per_hour"] is None
@@ -0,0 +1,114 @@
+import pytest
+from WAAnalysis.utils import (
+    read_frontmatter,
+    load_markdown,
+    rewrite_markdown_frontmatter,
+    clean_conversation,
+    clean_conversations,
+)
+
+# Sample markdown document with frontmatter
+sample_markdown = (
+    "---\n"
+    "tags:\n"
+    "- family-time\n"
+    "- work-life-balance\n"
+    "---\n\n"
+    "# Saturday, 09 March 2024\n\n"
+    "**Jason**: This is a sample message\n"
+    "  06:30 PM\n\n"
+    "---\n\n"
+    "**Elizabeth**: A message after a horizontal rule\n"
+)
+
+# Test for reading the frontmatter only
+def test_read_frontmatter(tmp_path):
+    file_path = tmp_path / "2024-03-09.md"
+    file_path.write_text(sample_markdown)
+
+    frontmatter = read_frontmatter(file_path)
+
+    assert frontmatter == {"tags": ["family-time", "work-life-balance"]}
+    assert frontmatter == load_markdown(file_path)[0]
+
+# Test that files without frontmatter return an empty dict
+def test_read_frontmatter_without_frontmatter(tmp_path):
+    file_path = tmp_path / "no_frontmatter.md"
+    file_path.write_text("# Title\n\nSome content\n")
+
+    assert read_frontmatter(file_path) == {}
+
+# Test that an unterminated frontmatter block is not parsed as YAML
+def test_read_frontmatter_unterminated(tmp_path):
+    file_path = tmp_path / "unterminated.md"
+    file_path.write_text("---\ntags:\n- a\n")
+
+    assert read_frontmatter(file_path) == {}
+
+# Test that a missing file returns an empty dict
+def test_read_frontmatter_missing_file(tmp_path):
+    assert read_frontmatter(tmp_path / "missing.md") == {}
+
+# Test that the body is preserved byte-for-byte when the frontmatter is rewritten
+def test_rewrite_markdown_frontmatter(tmp_path):
+    file_path = tmp_path / "2024-03-09.md"
+    file_path.write_text(sample_markdown)
+    body = sample_markdown[sample_markdown.index("---\n\n# Saturday"):]
+
+    def add_tag(frontmatter):
+        frontmatter["tags"].append("evidence")
+        return frontmatter
+
+    assert rewrite_markdown_frontmatter(file_path, add_tag) is True
+
+    content = file_path.read_text()
+    assert content.endswith(body)
+    assert read_frontmatter(file_path)["tags"] == ["family-time", "work-life-balance", "evidence"]
+    assert list(tmp_path.iterdir()) == [file_path]
+
+# Test that an unchanged header does not rewrite the file
+def test_rewrite_markdown_frontmatter_no_op(tmp_path):
+    file_path = tmp_path / "2024-03-09.md"
+    file_path.write_text(sample_markdown)
+    mtime = file_path.stat().st_mtime_ns
+
+    assert rewrite_markdown_frontmatter(file_path, lambda frontmatter: frontmatter) is False
+    assert file_path.stat().st_mtime_ns == mtime
+    assert file_path.read_text() == sample_markdown
+
+# Test that frontmatter is added to a file without one
+def test_rewrite_markdown_frontmatter_adds_header(tmp_path):
+    file_path = tmp_path / "no_frontmatter.md"
+    file_path.write_text("# Title\n")
+
+    rewrite_markdown_frontmatter(file_path, lambda frontmatter: {"tags": ["new"]})
+
+    assert file_path.read_text() == "---\ntags:\n- new\n---\n\n# Title\n"
+
+# Test that cleaning removes frontmatter, timestamp and attachment lines but keeps body rules
+def test_clean_conversation():
+    document = (
+        "---\n"
+        "topics:\n"
+        "---\n\n"
+        "# Saturday, 09 March 2024\n\n"
+        "**Jason**: Meet at 10:30 PM?\n"
+        "  06:30 PM\n"
+        "  Attached: IMG_0001.jpg\n\n"
+        "---\n\n"
+        "**Elizabeth**: Sure\n"
+        "  06:31 PM\n"
+    )
+
+    assert clean_conversation(document) == (
+        "# Saturday, 09 March 2024\n\n"
+        "**Jason**: Meet at 10:30 PM?\n\n"
+        "---\n\n"
+        "**Elizabeth**: Sure"
+    )
+
+# Test that batch cleaning returns results in input order
+def test_clean_conversations_order():
+    documents = [f"**Jason**: message {i}\n  06:30 PM\n" for i in range(10)]
+
+    assert clean_conversations(documents, workers=2) == [f"**Jason**: message {i}" for i in range(10)]